@@ -1,13 +1,104 @@
-"""Run the backend: uv run python -m backend"""
+"""
+Run the backend: uv run python -m backend
+
+Multi-worker: uv run python -m backend --workers 4
+Each worker is a separate (spawned) process with its own embedding model, caches and Python heap.
+The read-only index data is shared: FAISS opens index.faiss memory-mapped (INDEX_MMAP=true), and
+the chunk store, BM25 postings and binary rescoring vectors are memory-mapped too, so N workers
+hold one copy in the OS page cache instead of N. Use SESSION_STORE=sqlite so sessions are shared,
+and RETRIEVAL_WARMUP=true so each worker maps the index before taking traffic.
+
+With several workers the launcher prints a memory report every --memory-report seconds (needs
+psutil): per worker, RSS split into unique (private) and shared bytes, plus PSS (shared pages
+divided among the processes mapping them); the total PSS is what the workers really cost.
+"""
+import argparse
 import os
+import threading
+import time
 import warnings
 
+# Before any tokenizer/transformers imports
 os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
 warnings.filterwarnings("ignore", message=".*resource_tracker.*leaked semaphore.*", category=UserWarning)
 
 import uvicorn
 
-from backend.main import app
+from backend import metrics
+from config import settings
+
+
+def _mb(n: float) -> str:
+    return f"{n / (1024 * 1024):.0f}"
+
+
+def _report_memory(interval: float) -> None:
+    """Print per-worker unique/shared memory of this process's children every interval seconds."""
+    import psutil
+
+    parent = psutil.Process()
+    while True:
+        time.sleep(interval)
+        rows = []
+        for child in parent.children(recursive=True):
+            try:
+                if "resource_tracker" in " ".join(child.cmdline()):
+                    continue
+                mem = metrics.process_memory(child.pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            if mem is not None:
+                rows.append((child.pid, mem))
+        if not rows:
+            continue
+        lines = [f"Worker memory (MB, {len(rows)} workers):"]
+        for pid, mem in rows:
+            pss = f", pss {_mb(mem['pss'])}" if "pss" in mem else ""
+            lines.append(
+                f"  pid {pid}: rss {_mb(mem['rss'])} = unique {_mb(mem['unique'])} + shared {_mb(mem['shared'])}{pss}"
+            )
+        total_rss = sum(m["rss"] for _, m in rows)
+        total = f"  total: rss {_mb(total_rss)}, unique {_mb(sum(m['unique'] for _, m in rows))}"
+        if all("pss" in m for _, m in rows):
+            total += f", pss {_mb(sum(m['pss'] for _, m in rows))} (actual footprint)"
+        lines.append(total)
+        print("\n".join(lines), flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the RAG demo backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (default 1)")
+    parser.add_argument(
+        "--memory-report",
+        type=float,
+        default=60.0,
+        metavar="SECONDS",
+        help="with --workers > 1, print per-worker unique/shared memory this often (0 = off; needs psutil)",
+    )
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        from backend.main import app
+
+        uvicorn.run(app, host=args.host, port=args.port)
+        return
+
+    if settings.session_store == "memory":
+        print("SESSION_STORE=memory: each worker keeps its own sessions; set SESSION_STORE=sqlite to share them.")
+    if not settings.index_mmap:
+        print("INDEX_MMAP=false: every worker loads a private copy of the index.")
+    if args.memory_report > 0:
+        try:
+            import psutil  # noqa: F401
+        except ImportError:
+            print("Memory report needs psutil (uv sync --extra dev).")
+        else:
+            threading.Thread(target=_report_memory, args=(args.memory_report,), daemon=True).start()
+    # Workers import the app by name (uvicorn spawns them).
+    uvicorn.run("backend.main:app", host=args.host, port=args.port, workers=args.workers)
+
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    main()
@@ -1,69 +1,192 @@
 """
 RAG agent: retrieve chunks for query, build prompt with context + history, call LLM.
 Explicit agent loop (retrieve → format → complete). Session state lives in main.
+
+Prompts are assembled within a token budget: CONTEXT_LENGTH minus PROMPT_RESERVED_TOKENS for
+the reply. After the fixed template and the user message, retrieved chunks get up to
+PROMPT_CONTEXT_SHARE of what is left (more if history needs less) and history the rest,
+newest turns first; older turns are replaced by a short summary of what the user asked.
+
+PROMPT_LAYOUT=history_first puts the system text and append-only history before the per-turn
+context, so consecutive turns share a growing prompt prefix that Ollama/vLLM can reuse from
+their KV cache. History then has a fixed budget and is trimmed in steps of
+HISTORY_TRIM_STEP messages, so the prefix only changes when a trim happens.
+Compare the layouts with: uv run python -m backend.bench_prefix
 """
 
-from backend.inference import generate
-from backend.retrieval import retrieve
+from collections.abc import AsyncIterator
+
+from backend import tokens, tracing
+from backend.metrics import LATENCY_BUCKETS, Counter, Histogram
+from backend.inference import generate, generate_stream, prompt_tokens_include_cached
+from backend.retrieval import retrieve_async
 from config import settings
 
 # How many chunks to inject into the prompt
 RAG_TOP_K = 6
 
-# Max chars of context to avoid blowing context window (rough)
-MAX_CONTEXT_CHARS = 12_000
+# Max chars per retrieved chunk in the prompt (the token budget decides how many fit)
+MAX_CHUNK_CHARS = 2000
+# Slack for token merges across section boundaries when counting sections separately
+PROMPT_SAFETY_TOKENS = 16
+# Cap on the summary that stands in for trimmed history turns
+HISTORY_SUMMARY_TOKENS = 150
+# Chunks smaller than this are dropped rather than truncated to fit
+MIN_CHUNK_TOKENS = 64
+# history_first layout: trimmed history is cut at multiples of this many messages
+HISTORY_TRIM_STEP = 8
+
+_retrieve_seconds = Histogram(LATENCY_BUCKETS, "rag_retrieve_seconds", "Retrieval time per chat turn")
+_inference_seconds = Histogram(LATENCY_BUCKETS, "rag_inference_seconds", "Inference time per chat turn")
+_turn_seconds = Histogram(LATENCY_BUCKETS, "rag_turn_seconds", "Total time per chat turn (retrieve + prompt + inference)")
+_prompt_eval_tokens = Counter(
+    "rag_prompt_eval_tokens_total", "Prompt tokens the inference server evaluated (prefix-cache hits excluded)"
+)
+_prompt_cached_tokens = Counter(
+    "rag_prompt_cached_tokens_total", "Prompt tokens served from the server's prefix cache (when it reports them)"
+)
+_completion_tokens = Counter("rag_completion_tokens_total", "Completion tokens reported by the inference server")
+
+EMPTY_MESSAGE_REPLY = "Please ask a question about the codebase."
+INDEX_NOT_LOADED_REPLY = "RAG index not loaded. Run: uv run python -m ingest (or use test index)."
+
+SYSTEM_PROMPT = (
+    "You are a coding assistant with access to the Hugging Face Transformers codebase. "
+    "Use the following retrieved code snippets only to ground your answer. "
+    "If the snippets do not contain relevant information, say so and answer from general knowledge."
+)
+
+
+def _format_chunk(i: int, c: dict) -> str:
+    path = c.get("path", "?")
+    text = (c.get("text") or "")[:MAX_CHUNK_CHARS].strip()
+    return f"[{i}] {path}\n{text}"
 
 
 def _format_context(chunks: list[dict]) -> str:
-    parts = []
-    for i, c in enumerate(chunks, 1):
-        path = c.get("path", "?")
-        text = (c.get("text") or "")[:2000].strip()
-        parts.append(f"[{i}] {path}\n{text}")
-    return "\n\n".join(parts)[:MAX_CONTEXT_CHARS]
+    return "\n\n".join(_format_chunk(i, c) for i, c in enumerate(chunks, 1))
+
+
+def _format_message(m: dict) -> str:
+    role = (m.get("role") or "user").lower()
+    content = (m.get("content") or "").strip()
+    return f"User: {content}" if role == "user" else f"Assistant: {content}"
 
 
 def _format_messages(history: list[dict]) -> str:
-    lines = []
-    for m in history:
-        role = (m.get("role") or "user").lower()
-        content = (m.get("content") or "").strip()
-        if role == "user":
-            lines.append(f"User: {content}")
-        else:
-            lines.append(f"Assistant: {content}")
+    lines = [_format_message(m) for m in history]
     return "\n".join(lines) if lines else "(no prior messages)"
 
 
-async def run_rag_chat(message: str, history: list[dict]) -> tuple[str, dict]:
+def _fit_chunks(chunks: list[dict], budget: int) -> tuple[str, int, int]:
+    """Chunks in rank order within budget tokens; the first one that overflows is truncated if
+    enough room is left. Returns (context, tokens, chunks used)."""
+    parts: list[str] = []
+    used = 0
+    for i, c in enumerate(chunks, 1):
+        part = _format_chunk(i, c)
+        n = tokens.count(part) + (1 if parts else 0)  # + separator
+        if used + n > budget:
+            room = budget - used - (1 if parts else 0)
+            if room >= MIN_CHUNK_TOKENS:
+                part = tokens.truncate(part, room)
+                parts.append(part)
+                used += tokens.count(part) + (1 if len(parts) > 1 else 0)
+            break
+        parts.append(part)
+        used += n
+    return "\n\n".join(parts), used, len(parts)
+
+
+def _summarize_turns(dropped: list[dict]) -> str:
+    asked = [(m.get("content") or "").strip().replace("\n", " ")[:100] for m in dropped if m.get("role") == "user"]
+    note = f"({len(dropped)} earlier messages omitted"
+    return f"{note}; the user asked: " + "; ".join(asked) + ")" if asked else note + ")"
+
+
+def _fit_history(history: list[dict], budget: int, step: int = 1) -> tuple[str, int, int, bool]:
+    """Newest messages within budget tokens; older ones are replaced by a short summary.
+    The cut is rounded up to a multiple of step messages (stable prefix across turns) unless
+    that would leave none.
+    Returns (conversation text, tokens, messages kept, summarized)."""
+    lines = [_format_message(m) for m in history]
+    counts = [tokens.count(line) + 1 for line in lines]  # + newline
+    if sum(counts) <= budget:
+        return _format_messages(history), sum(counts), len(history), False
+    summary_budget = min(HISTORY_SUMMARY_TOKENS, budget // 4)
+    used, start = 0, len(lines)
+    while start > 0 and used + counts[start - 1] <= budget - summary_budget:
+        start -= 1
+        used += counts[start]
+    if start < len(lines) and history[start].get("role") != "user":
+        used -= counts[start]  # don't open on a reply whose question was trimmed
+        start += 1
+    cut = -(-start // step) * step
+    if step > 1 and start < cut < len(lines):  # rounding must not drop every message that fit
+        used -= sum(counts[start:cut])
+        start = cut
+    summary = tokens.truncate(_summarize_turns(history[:start]), summary_budget)
+    conv = "\n".join([summary] + lines[start:]) if summary else "\n".join(lines[start:])
+    return conv or "(no prior messages)", used + tokens.count(summary), len(lines) - start, True
+
+
+def _assemble_prompt(message: str, chunks: list[dict], history: list[dict]) -> tuple[str, str, dict]:
     """
-    Run one agent step: retrieve for message, build prompt with context + history, return LLM reply.
+    Build the prompt within the token budget; return (prompt, context, token report).
     """
-    import time
+    layout = settings.prompt_layout
+    total = settings.context_length - settings.prompt_reserved_tokens - PROMPT_SAFETY_TOKENS
+    fixed = tokens.count(_build_prompt(message, "", "", layout))
+    if fixed > total:  # oversized message: keep its head so chunks and history still get room
+        message = tokens.truncate(message, total // 2)
+        fixed = tokens.count(_build_prompt(message, "", "", layout))
+    left = max(total - fixed, 0)
+    history_share = int(left * (1.0 - settings.prompt_context_share))
 
-    message = (message or "").strip()
-    if not message:
-        return "Please ask a question about the codebase.", {"error": "empty_message"}
+    if layout == "history_first":
+        # Fixed history budget (not whatever this turn's chunks leave) keeps the cut stable.
+        conv, history_tokens, kept, summarized = _fit_history(history, history_share, HISTORY_TRIM_STEP)
+        context, context_tokens, chunks_used = _fit_chunks(chunks, left - history_tokens)
+    else:
+        history_need = sum(tokens.count(_format_message(m)) + 1 for m in history)
+        context, context_tokens, chunks_used = _fit_chunks(chunks, left - min(history_need, history_share))
+        conv, history_tokens, kept, summarized = _fit_history(history, left - context_tokens)
+    context = context or "(no relevant chunks found)"
 
-    try:
-        t_retrieve0 = time.perf_counter()
-        chunks = retrieve(message, top_k=RAG_TOP_K)
-        t_retrieve1 = time.perf_counter()
-    except FileNotFoundError:
-        return (
-            "RAG index not loaded. Run: uv run python -m ingest (or use test index).",
-            {"error": "index_not_loaded"},
-        )
+    prompt = _build_prompt(message, context, conv, layout)
+    report = {
+        "counter": tokens.counter_name(),
+        "layout": layout,
+        "budget": total,
+        "reserved_output": settings.prompt_reserved_tokens,
+        "template": fixed,
+        "context": context_tokens,
+        "history": history_tokens,
+        "prompt": fixed + context_tokens + history_tokens,
+        "chunks_used": chunks_used,
+        "history_kept": kept,
+        "history_dropped": len(history) - kept,
+        "history_summarized": summarized,
+    }
+    return prompt, context, report
+
+
+def _build_prompt(message: str, context: str, conv: str, layout: str = "context_first") -> str:
+    if layout == "history_first":
+        return f"""{SYSTEM_PROMPT}
+
+## Conversation so far
+{conv}
 
-    context = _format_context(chunks) if chunks else "(no relevant chunks found)"
-    conv = _format_messages(history)
+## Retrieved context for the current message (file excerpts)
+{context}
+
+## Current user message
+User: {message}
 
-    system = (
-        "You are a coding assistant with access to the Hugging Face Transformers codebase. "
-        "Use the following retrieved code snippets only to ground your answer. "
-        "If the snippets do not contain relevant information, say so and answer from general knowledge."
-    )
-    prompt = f"""{system}
+## Your reply (concise, grounded in the context when possible)
+Assistant:"""
+    return f"""{SYSTEM_PROMPT}
 
 ## Retrieved context (file excerpts)
 {context}
@@ -77,16 +200,50 @@ User: {message}
 ## Your reply (concise, grounded in the context when possible)
 Assistant:"""
 
-    t_infer0 = time.perf_counter()
-    reply, infer_meta = await generate(prompt)
-    t_infer1 = time.perf_counter()
 
-    # Compact per-turn telemetry for demo/operator visibility.
+def _span_attrs(infer_meta: dict) -> dict:
+    keys = ("queue_wait_ms", "ttft_ms", "prefill_ms", "decode_ms", "prompt_tokens", "completion_tokens")
+    return {k: infer_meta[k] for k in keys if k in infer_meta}
+
+
+def _observe_turn(timing_ms: dict, infer_meta: dict) -> None:
+    _retrieve_seconds.observe(timing_ms["retrieve_ms"] / 1000.0)
+    _inference_seconds.observe(timing_ms["inference_ms"] / 1000.0)
+    _turn_seconds.observe(timing_ms["total_ms"] / 1000.0)
+    prompt_tokens = infer_meta.get("prompt_tokens") or 0
+    cached = infer_meta.get("cached_prompt_tokens") or 0
+    _prompt_eval_tokens.inc(prompt_tokens - cached if prompt_tokens_include_cached() else prompt_tokens)
+    _prompt_cached_tokens.inc(cached)
+    _completion_tokens.inc(infer_meta.get("completion_tokens") or 0)
+
+
+def _calibrate_tokens(prompt: str, infer_meta: dict) -> None:
+    """Calibrate the token estimate from the server's count of the whole prompt."""
+    # Ollama's count leaves out prefix-cache hits and reports no cached count. Every prompt starts
+    # with SYSTEM_PROMPT, so any turn may be a partial hit; a short count would raise chars/token
+    # and let prompts overflow num_ctx. Its counts are never used; the estimate stays at the default.
+    if not prompt_tokens_include_cached():
+        return
+    tokens.observe(prompt, infer_meta.get("prompt_tokens"))
+
+
+def _turn_metrics(
+    chunks: list[dict],
+    prompt: str,
+    context: str,
+    history: list[dict],
+    timing_ms: dict,
+    infer_meta: dict,
+    token_report: dict,
+) -> dict:
+    """Compact per-turn telemetry for demo/operator visibility."""
     top = [
         {"path": c.get("path"), "score": c.get("score")}
         for c in (chunks or [])[: min(3, len(chunks or []))]
     ]
-    turn_metrics = {
+    trace = tracing.current()
+    return {
+        "request_id": trace.request_id if trace else None,
         "tier": settings.tier,
         "model": settings.model_name,
         "rag": {
@@ -99,11 +256,98 @@ Assistant:"""
             "context_chars": len(context),
             "history_messages": len(history),
         },
-        "timing_ms": {
-            "retrieve_ms": round((t_retrieve1 - t_retrieve0) * 1000.0, 2),
-            "inference_ms": round((t_infer1 - t_infer0) * 1000.0, 2),
-        },
+        "tokens": token_report,
+        "timing_ms": timing_ms,
+        "trace_ms": trace.durations_ms() if trace else {},
         "inference": infer_meta,
     }
 
+
+async def run_rag_chat(message: str, history: list[dict]) -> tuple[str, dict]:
+    """
+    Run one agent step: retrieve for message, build prompt with context + history, return LLM reply.
+    """
+    import time
+
+    message = (message or "").strip()
+    if not message:
+        return EMPTY_MESSAGE_REPLY, {"error": "empty_message"}
+
+    try:
+        t_retrieve0 = time.perf_counter()
+        with tracing.span("retrieve", top_k=RAG_TOP_K):
+            chunks = await retrieve_async(message, top_k=RAG_TOP_K)
+        t_retrieve1 = time.perf_counter()
+    except FileNotFoundError:
+        return INDEX_NOT_LOADED_REPLY, {"error": "index_not_loaded"}
+
+    with tracing.span("assemble_prompt"):
+        prompt, context, token_report = _assemble_prompt(message, chunks, history)
+        tracing.annotate(prompt_tokens=token_report["prompt"], chunks_used=token_report["chunks_used"])
+
+    t_infer0 = time.perf_counter()
+    with tracing.span("inference", api=settings.inference_api):
+        reply, infer_meta = await generate(prompt)
+        tracing.annotate(**_span_attrs(infer_meta))
+    t_infer1 = time.perf_counter()
+    _calibrate_tokens(prompt, infer_meta)
+
+    timing_ms = {
+        "retrieve_ms": round((t_retrieve1 - t_retrieve0) * 1000.0, 2),
+        "inference_ms": round((t_infer1 - t_infer0) * 1000.0, 2),
+        "total_ms": round((t_infer1 - t_retrieve0) * 1000.0, 2),
+    }
+    _observe_turn(timing_ms, infer_meta)
+    turn_metrics = _turn_metrics(chunks, prompt, context, history, timing_ms, infer_meta, token_report)
     return (reply or "").strip(), turn_metrics
+
+
+async def run_rag_chat_stream(message: str, history: list[dict]) -> AsyncIterator[dict]:
+    """
+    Streaming variant of run_rag_chat. Yields events:
+    - {"type": "token", "text": ...} for each reply piece as the model produces it
+    - {"type": "done", "reply": ..., "metrics": ...} once, after the stream finishes
+
+    Inference errors (httpx) propagate to the caller, as in run_rag_chat.
+    """
+    import time
+
+    message = (message or "").strip()
+    if not message:
+        yield {"type": "done", "reply": EMPTY_MESSAGE_REPLY, "metrics": {"error": "empty_message"}}
+        return
+
+    try:
+        t_retrieve0 = time.perf_counter()
+        with tracing.span("retrieve", top_k=RAG_TOP_K):
+            chunks = await retrieve_async(message, top_k=RAG_TOP_K)
+        t_retrieve1 = time.perf_counter()
+    except FileNotFoundError:
+        yield {"type": "done", "reply": INDEX_NOT_LOADED_REPLY, "metrics": {"error": "index_not_loaded"}}
+        return
+
+    with tracing.span("assemble_prompt"):
+        prompt, context, token_report = _assemble_prompt(message, chunks, history)
+        tracing.annotate(prompt_tokens=token_report["prompt"], chunks_used=token_report["chunks_used"])
+
+    infer_meta: dict = {}
+    pieces: list[str] = []
+    t_infer0 = time.perf_counter()
+    with tracing.span("inference", api=settings.inference_api, stream=True):
+        async for piece in generate_stream(prompt, infer_meta):
+            pieces.append(piece)
+            yield {"type": "token", "text": piece}
+        tracing.annotate(**_span_attrs(infer_meta))
+    t_infer1 = time.perf_counter()
+    _calibrate_tokens(prompt, infer_meta)
+
+    timing_ms = {
+        "retrieve_ms": round((t_retrieve1 - t_retrieve0) * 1000.0, 2),
+        "inference_ms": round((t_infer1 - t_infer0) * 1000.0, 2),
+        "total_ms": round((t_infer1 - t_retrieve0) * 1000.0, 2),
+    }
+    if "ttft_ms" in infer_meta:
+        timing_ms["ttft_ms"] = infer_meta["ttft_ms"]
+    _observe_turn(timing_ms, infer_meta)
+    turn_metrics = _turn_metrics(chunks, prompt, context, history, timing_ms, infer_meta, token_report)
+    yield {"type": "done", "reply": "".join(pieces).strip(), "metrics": turn_metrics}
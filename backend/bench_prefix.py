@@ -0,0 +1,98 @@
+"""
+Compare prompt layouts for prefix (KV) cache reuse: run the same scripted conversation with
+PROMPT_LAYOUT=context_first and history_first and report the prompt tokens the inference
+server had to evaluate and its prefill time per turn.
+
+Run: uv run python -m backend.bench_prefix [--turns 8] [--no-rag] [--json report.json]
+Needs the inference server (INFERENCE_URL) and, unless --no-rag, the FAISS index.
+Ollama's prompt_eval_count excludes prefix-cache hits and vLLM reports them as
+cached_prompt_tokens, so cache reuse shows up as fewer evaluated tokens than the prompt's
+size; a layout with a stable prefix should keep it roughly flat per turn instead of
+growing with the history.
+"""
+
+import argparse
+import asyncio
+import json
+
+from backend import agent, inference
+from backend.retrieval import retrieve_async
+from config import settings
+
+QUESTIONS = (
+    "How does the Trainer class decide which device to use?",
+    "Where is the learning rate scheduler created in Trainer?",
+    "How are gradient accumulation steps handled?",
+    "What does PreTrainedModel.from_pretrained do with sharded checkpoints?",
+    "How does the tokenizer handle padding side?",
+    "Where is generation's beam search implemented?",
+    "How does GenerationConfig get merged with model defaults?",
+    "How are attention masks built for causal language models?",
+    "Where is the BERT self-attention implemented?",
+    "How does pipeline() pick a default model for a task?",
+)
+
+
+async def _run_layout(layout: str, turns: int, rag: bool) -> list[dict]:
+    settings.prompt_layout = layout
+    history: list[dict] = []
+    rows = []
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        chunks = await retrieve_async(question, top_k=agent.RAG_TOP_K) if rag else []
+        prompt, _context, report = agent._assemble_prompt(question, chunks, history)
+        reply, meta = await inference.generate(prompt)
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": reply}]
+        evaluated = meta.get("prompt_tokens")
+        if evaluated is not None:
+            evaluated -= meta.get("cached_prompt_tokens", 0)
+        rows.append({
+            "turn": turn + 1,
+            "prompt_tokens": report["prompt"],
+            "evaluated_tokens": evaluated,
+            "prefill_ms": meta.get("prefill_ms"),
+            "http_ms": meta.get("http_ms"),
+        })
+    return rows
+
+
+def _print_rows(layout: str, rows: list[dict]) -> None:
+    print(f"\n{layout}")
+    print(f"{'turn':>4}  {'prompt tok':>10}  {'evaluated':>9}  {'prefill ms':>10}  {'http ms':>9}")
+    for r in rows:
+        print(f"{r['turn']:>4}  {r['prompt_tokens']:>10}  {r['evaluated_tokens'] or '-':>9}  "
+              f"{r['prefill_ms'] or '-':>10}  {r['http_ms']:>9}")
+    evaluated = sum(r["evaluated_tokens"] or 0 for r in rows)
+    prefill_ms = sum(r["prefill_ms"] or 0 for r in rows)
+    print(f"total evaluated tokens {evaluated}, prefill {prefill_ms:.0f} ms")
+
+
+async def _main(args: argparse.Namespace) -> dict:
+    await inference.start()
+    try:
+        results = {}
+        for layout in ("context_first", "history_first"):
+            results[layout] = await _run_layout(layout, args.turns, not args.no_rag)
+            _print_rows(layout, results[layout])
+        return results
+    finally:
+        await inference.stop()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--turns", type=int, default=8)
+    ap.add_argument("--no-rag", action="store_true", help="skip retrieval (no index needed)")
+    ap.add_argument("--json", help="also write results to this JSON file")
+    args = ap.parse_args()
+
+    print(f"model {settings.model_name} @ {settings.inference_url}, {args.turns} turns per layout")
+    results = asyncio.run(_main(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"model": settings.model_name, "turns": args.turns, "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
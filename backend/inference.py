@@ -1,59 +1,346 @@
-"""Inference client: Ollama (dev) or vLLM (test/demo). Swap via config."""
+"""
+Inference client: Ollama (dev) or an OpenAI-compatible server such as vLLM (test/demo).
+Swap via INFERENCE_API: ollama (/api/generate) | openai_completions (/v1/completions) |
+openai_chat (/v1/chat/completions).
+
+Telemetry uses the same keys for every API: prompt_tokens, completion_tokens, prefill_ms,
+decode_ms, tokens_per_sec (plus cached_prompt_tokens when the server reports prefix-cache
+hits). Ollama's raw counters (OLLAMA_META_KEYS) are passed through as well.
+For a local stand-in server: uv run python -m backend.stub_server
+"""
+
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
 import httpx
 
+from backend.metrics import LATENCY_BUCKETS, Histogram
 from config import settings
 
+# Ollama counters passed through to per-turn telemetry (safe to ignore downstream).
+OLLAMA_META_KEYS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+    "created_at",
+    "done",
+    "done_reason",
+)
+
+# App-lifetime pooled client and in-flight cap; created in start()/on first use, closed in stop().
+_client: httpx.AsyncClient | None = None
+_semaphore: asyncio.Semaphore | None = None
+_queued = 0
+_queue_wait_seconds = Histogram(
+    LATENCY_BUCKETS, "rag_inference_queue_wait_seconds", "Wait for an inference slot (INFERENCE_MAX_CONCURRENCY)"
+)
+
+
+def _new_client() -> httpx.AsyncClient:
+    headers = {"Authorization": f"Bearer {settings.inference_api_key}"} if settings.inference_api_key else None
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=httpx.Timeout(settings.inference_timeout, connect=settings.inference_connect_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.inference_max_connections,
+            max_keepalive_connections=settings.inference_max_keepalive,
+            keepalive_expiry=settings.inference_keepalive_expiry,
+        ),
+    )
+
+
+async def start() -> None:
+    """Create the pooled client and concurrency gate (FastAPI lifespan startup)."""
+    global _client, _semaphore
+    if _client is None:
+        _client = _new_client()
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.inference_max_concurrency)
+
+
+async def stop() -> None:
+    """Close the pooled client (FastAPI lifespan shutdown)."""
+    global _client, _semaphore
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _semaphore = None
+
+
+def queue_depth() -> int:
+    """Requests currently waiting for an inference slot."""
+    return _queued
+
+
+@asynccontextmanager
+async def _slot():
+    """
+    Wait for one of INFERENCE_MAX_CONCURRENCY slots, then yield (client, queue_wait_ms).
+    Requests beyond the cap queue here instead of piling onto Ollama/vLLM.
+    """
+    import time
+
+    global _queued
+    if _client is None or _semaphore is None:
+        await start()
+    t0 = time.perf_counter()
+    _queued += 1
+    try:
+        await _semaphore.acquire()
+    finally:
+        _queued -= 1
+    waited = time.perf_counter() - t0
+    _queue_wait_seconds.observe(waited)
+    try:
+        yield _client, round(waited * 1000.0, 2)
+    finally:
+        _semaphore.release()
+
+
+def _ms(ns: int | None) -> float | None:
+    return round(ns / 1e6, 2) if ns else None
+
+
+class InferenceAPI(ABC):
+    """One wire protocol: request payloads, response text and normalized usage."""
+
+    path = ""
+    # usage()["prompt_tokens"] counts the whole prompt, prefix-cache hits included
+    prompt_tokens_include_cached = True
+
+    @abstractmethod
+    def payload(self, prompt: str, stream: bool) -> dict: ...
+
+    @abstractmethod
+    def text(self, data: dict) -> str:
+        """Reply text of a full response, or the piece carried by one streamed event."""
+
+    @abstractmethod
+    def event(self, line: str) -> dict | None:
+        """Parse one streamed line; None to skip it. {"done": True} ends the stream."""
+
+    @abstractmethod
+    def usage(self, data: dict) -> dict:
+        """Normalized counters from a full response or the final streamed event."""
+
+
+class OllamaAPI(InferenceAPI):
+    path = "/api/generate"
+    prompt_tokens_include_cached = False
+
+    def payload(self, prompt: str, stream: bool) -> dict:
+        return {
+            "model": settings.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            # Match the window the prompt was budgeted for (Ollama otherwise uses its own default num_ctx).
+            "options": {"num_ctx": settings.context_length, "num_predict": settings.prompt_reserved_tokens},
+        }
+
+    def text(self, data: dict) -> str:
+        return data.get("response") or ""
+
+    def event(self, line: str) -> dict | None:
+        # NDJSON: one {"response": "..."} object per token, then one with "done": true and the counters.
+        return json.loads(line) if line.strip() else None
+
+    def usage(self, data: dict) -> dict:
+        out = {k: data[k] for k in OLLAMA_META_KEYS if k in data}
+        # prompt_eval_count only counts tokens Ollama had to evaluate (prefix-cache hits excluded).
+        out["prompt_tokens"] = data.get("prompt_eval_count")
+        out["completion_tokens"] = data.get("eval_count")
+        out["prefill_ms"] = _ms(data.get("prompt_eval_duration"))
+        out["decode_ms"] = _ms(data.get("eval_duration"))
+        return out
+
+
+class OpenAICompletionsAPI(InferenceAPI):
+    path = "/v1/completions"
+
+    def payload(self, prompt: str, stream: bool) -> dict:
+        payload = {
+            "model": settings.model_name,
+            "prompt": prompt,
+            "max_tokens": settings.prompt_reserved_tokens,
+            "stream": stream,
+        }
+        if stream:
+            payload["stream_options"] = {"include_usage": True}  # final event carries usage
+        return payload
+
+    def text(self, data: dict) -> str:
+        choices = data.get("choices") or []
+        return (choices[0].get("text") or "") if choices else ""
+
+    def event(self, line: str) -> dict | None:
+        # Server-sent events: "data: {...}" per chunk, then "data: [DONE]".
+        if not line.startswith("data:"):
+            return None
+        body = line[len("data:"):].strip()
+        return {"done": True} if body == "[DONE]" else json.loads(body)
+
+    def usage(self, data: dict) -> dict:
+        usage = data.get("usage") or {}
+        out = {
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+        }
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached is not None:
+            out["cached_prompt_tokens"] = cached
+        return out
+
+
+class OpenAIChatAPI(OpenAICompletionsAPI):
+    """Chat endpoint; the assembled prompt is sent as one user message."""
+
+    path = "/v1/chat/completions"
+
+    def payload(self, prompt: str, stream: bool) -> dict:
+        payload = super().payload(prompt, stream)
+        payload["messages"] = [{"role": "user", "content": payload.pop("prompt")}]
+        return payload
+
+    def text(self, data: dict) -> str:
+        choices = data.get("choices") or []
+        if not choices:
+            return ""
+        msg = choices[0].get("delta") or choices[0].get("message") or {}
+        return msg.get("content") or ""
+
+
+APIS: dict[str, InferenceAPI] = {
+    "ollama": OllamaAPI(),
+    "openai_completions": OpenAICompletionsAPI(),
+    "openai_chat": OpenAIChatAPI(),
+}
+
+
+def _api() -> InferenceAPI:
+    return APIS[settings.inference_api]
+
+
+def prompt_tokens_include_cached() -> bool:
+    """False when prompt_tokens leaves out prefix-cache hits without reporting them (Ollama)."""
+    return _api().prompt_tokens_include_cached
+
+
+def _build_telemetry(usage: dict, http_ms: float) -> dict:
+    telemetry = {
+        "model": settings.model_name,
+        "api": settings.inference_api,
+        "http_ms": round(http_ms, 2),
+    }
+    telemetry.update({k: v for k, v in usage.items() if v is not None})
+    count, decode_ms = telemetry.get("completion_tokens"), telemetry.get("decode_ms")
+    if count and decode_ms:
+        telemetry["tokens_per_sec"] = round(count / (decode_ms / 1000.0), 2)
+    return telemetry
+
 
 async def generate(prompt: str) -> tuple[str, dict]:
     """
     Send prompt to the configured inference endpoint; return (reply, telemetry).
 
-    For Ollama /api/generate, the response often includes useful counters like:
-    - prompt_eval_count, eval_count
-    - total_duration, prompt_eval_duration, eval_duration (ns)
+    OpenAI-compatible servers only report token counts, so the reply is streamed internally
+    to measure prefill (time to first token) and decode time.
     """
     import time
 
-    url = f"{settings.inference_url}/api/generate"
-    payload = {
-        "model": settings.model_name,
-        "prompt": prompt,
-        "stream": False,
-    }
-    t0 = time.perf_counter()
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        resp = await client.post(url, json=payload)
+    if settings.inference_api != "ollama":
+        telemetry: dict = {}
+        pieces = [piece async for piece in _stream(prompt, telemetry)]
+        return "".join(pieces).strip(), telemetry
+
+    api = _api()
+    async with _slot() as (client, queue_wait_ms):
+        t0 = time.perf_counter()
+        resp = await client.post(f"{settings.inference_url}{api.path}", json=api.payload(prompt, False))
         resp.raise_for_status()
         data = resp.json()
-    t1 = time.perf_counter()
+        t1 = time.perf_counter()
 
-    reply = (data.get("response", "") or "").strip()
-    telemetry = {
-        "model": settings.model_name,
-        "http_ms": round((t1 - t0) * 1000.0, 2),
-    }
-    # Pass through Ollama metrics if present (safe to ignore downstream).
-    for k in (
-        "total_duration",
-        "load_duration",
-        "prompt_eval_count",
-        "prompt_eval_duration",
-        "eval_count",
-        "eval_duration",
-        "created_at",
-        "done",
-        "done_reason",
-    ):
-        if k in data:
-            telemetry[k] = data[k]
+    reply = api.text(data).strip()
+    telemetry = _build_telemetry(api.usage(data), (t1 - t0) * 1000.0)
+    telemetry["queue_wait_ms"] = queue_wait_ms
     return reply, telemetry
 
 
+async def generate_many(prompts: list[str]) -> list[tuple[str, dict]]:
+    """
+    generate() for several prompts at once. They run concurrently up to
+    INFERENCE_MAX_CONCURRENCY, so vLLM can batch them on the GPU.
+    """
+    return list(await asyncio.gather(*(generate(p) for p in prompts)))
+
+
+async def _stream(prompt: str, telemetry: dict) -> AsyncIterator[str]:
+    import time
+
+    api = _api()
+    final: dict = {}
+    ttft_ms = None
+    pieces = 0
+    async with _slot() as (client, queue_wait_ms):
+        t0 = time.perf_counter()
+        url = f"{settings.inference_url}{api.path}"
+        async with client.stream("POST", url, json=api.payload(prompt, True)) as resp:
+            if resp.is_error:
+                await resp.aread()
+                resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                data = api.event(line)
+                if data is None:
+                    continue
+                piece = api.text(data)
+                if piece:
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - t0) * 1000.0
+                    pieces += 1
+                    yield piece
+                if data.get("usage") is not None or data.get("eval_count") is not None:
+                    final = data
+                if data.get("done"):
+                    final = final or data
+                    break
+        t1 = time.perf_counter()
+
+    usage = api.usage(final)
+    if ttft_ms is not None and usage.get("prefill_ms") is None:
+        # No server timings: time to first token approximates prefill, the rest is decode.
+        usage["prefill_ms"] = round(ttft_ms, 2)
+        usage["decode_ms"] = round((t1 - t0) * 1000.0 - ttft_ms, 2)
+        if not usage.get("completion_tokens"):
+            usage["completion_tokens"] = pieces
+    telemetry.update(_build_telemetry(usage, (t1 - t0) * 1000.0))
+    telemetry["queue_wait_ms"] = queue_wait_ms
+    telemetry["stream_chunks"] = pieces
+    if ttft_ms is not None:
+        telemetry["ttft_ms"] = round(ttft_ms, 2)
+
+
+async def generate_stream(prompt: str, telemetry: dict) -> AsyncIterator[str]:
+    """
+    Stream reply text pieces from the configured inference endpoint as they are generated.
+
+    `telemetry` is filled in place once the stream finishes (plus ttft_ms, measured
+    from request start to the first non-empty piece). The inference slot is held for
+    the whole stream.
+    """
+    async for piece in _stream(prompt, telemetry):
+        yield piece
+    telemetry["stream"] = True
+
+
 async def complete(prompt: str) -> str:
     """
     Send prompt to the configured inference endpoint; return model reply.
-    Uses Ollama API when INFERENCE_URL points at Ollama (e.g. http://localhost:11434).
     """
     reply, _telemetry = await generate(prompt)
     return reply
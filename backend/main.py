@@ -1,23 +1,48 @@
 """FastAPI app: health, hello, chat, and static frontend."""
 
+import asyncio
+import json
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 import httpx
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
 from config import settings
 
-from backend.agent import run_rag_chat
-from backend.retrieval import retrieve
+from backend import inference, metrics, retrieval, sessions, tracing
+from backend.agent import run_rag_chat, run_rag_chat_stream
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """App-lifetime resources: inference client, session store, retrieval executor, optional warm-up."""
+    await inference.start()
+    warmup_task = None
+    if settings.retrieval_warmup:
+        # In the background so /health answers while loading; /ready flips once warm.
+        warmup_task = asyncio.create_task(retrieval.warmup_async())
+        # Failures are recorded in retrieval.load_status(); don't leave them unretrieved.
+        warmup_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    try:
+        yield
+    finally:
+        if warmup_task is not None and not warmup_task.done():
+            warmup_task.cancel()
+        await inference.stop()
+        _sessions.close()
+        retrieval.shutdown_executor()
+
 
 app = FastAPI(
     title="RAG Demo",
     description="RAG + agentic coding assistant for Phison aiDAPTIV",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -26,7 +51,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+app.add_middleware(tracing.TraceMiddleware)
 
 FRONTEND_DIR = Path(__file__).resolve().parent.parent / "frontend"
 
@@ -37,6 +64,23 @@ def health() -> dict:
     return {"status": "ok", "tier": settings.tier}
 
 
+@app.get("/ready")
+def ready() -> JSONResponse:
+    """
+    Readiness for load balancers: 200 once the retrieval stack is loaded, 503 while loading
+    or after a failed load. Without RETRIEVAL_WARMUP the stack loads lazily on first query,
+    so there is nothing to wait for and this reports ready.
+    """
+    status = retrieval.load_status()
+    is_ready = status["state"] == "ready" or (
+        not settings.retrieval_warmup and status["state"] == "not_loaded"
+    )
+    return JSONResponse(
+        {"ready": is_ready, "warmup": settings.retrieval_warmup, "retrieval": status},
+        status_code=200 if is_ready else 503,
+    )
+
+
 @app.get("/api/hello")
 def hello() -> dict:
     """Hello payload for frontend to display."""
@@ -49,16 +93,16 @@ def hello() -> dict:
     }
 
 
-# In-memory session store: session_id -> list of {role, content}
-_sessions: dict[str, list[dict]] = {}
+# Session store: session_id -> list of {role, content}, bounded (see backend.sessions)
+_sessions = sessions.open_store(settings)
 
 
 def _get_or_create_session(session_id: str | None) -> tuple[str, list[dict]]:
+    """Return (session_id, copy of its history); turns are saved with _sessions.append()."""
     import uuid
     sid = (session_id or "").strip() or str(uuid.uuid4())
-    if sid not in _sessions:
-        _sessions[sid] = []
-    return sid, _sessions[sid]
+    with tracing.span("session_load", backend=_sessions.backend):
+        return sid, _sessions.get_or_create(sid)
 
 
 def _session_metrics(history: list[dict]) -> dict:
@@ -68,6 +112,14 @@ def _session_metrics(history: list[dict]) -> dict:
     metrics: dict = {
         "message_count": message_count,
         "context_chars": context_chars,
+        "session_store": _sessions.stats(),
+    }
+    cache = retrieval.cache_stats()
+    metrics["retrieval_cache"] = {
+        "hit_rate": cache["results"]["hit_rate"],
+        "hits": cache["results"]["hits"],
+        "misses": cache["results"]["misses"],
+        "embedding_hits": cache["embedding"]["hits"],
     }
     try:
         import psutil
@@ -104,10 +156,13 @@ async def chat(req: ChatRequest) -> ChatResponse:
     if not req.prompt.strip():
         raise HTTPException(status_code=400, detail="prompt is required")
     session_id, history = _get_or_create_session(req.session_id)
-    history.append({"role": "user", "content": req.prompt})
     try:
-        reply, turn_metrics = await run_rag_chat(req.prompt, history[:-1])  # history without this turn
-        history.append({"role": "assistant", "content": reply})
+        reply, turn_metrics = await run_rag_chat(req.prompt, history)  # history without this turn
+        with tracing.span("session_save"):
+            history = _sessions.append(session_id, [
+                {"role": "user", "content": req.prompt},
+                {"role": "assistant", "content": reply},
+            ])
         metrics = _session_metrics(history)
         metrics["last_turn"] = turn_metrics
         return ChatResponse(
@@ -117,22 +172,79 @@ async def chat(req: ChatRequest) -> ChatResponse:
             metrics=metrics,
         )
     except httpx.ConnectError as e:
-        history.pop()  # remove the user message we just appended
+        _errors.inc(type="503", endpoint="chat")
         raise HTTPException(
             status_code=503,
-            detail=f"Cannot reach inference at {settings.inference_url}. Is Ollama running?",
+            detail=f"Cannot reach inference at {settings.inference_url}. Is the inference server running?",
         ) from e
     except httpx.HTTPStatusError as e:
-        history.pop()
+        _errors.inc(type="502", endpoint="chat")
         raise HTTPException(status_code=502, detail=str(e.response.text)) from e
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(req: ChatRequest) -> StreamingResponse:
+    """
+    Streaming /api/chat as Server-Sent Events: `token` events ({"text"}) while the model
+    generates, then one `done` event with the same body as ChatResponse. Inference failures
+    after the stream has started (including timeouts and malformed stream lines) are sent as
+    an `error` event ({"status", "detail"}).
+    The session gets the user + assistant turn only once the stream finishes.
+    """
+    if not req.prompt.strip():
+        raise HTTPException(status_code=400, detail="prompt is required")
+    session_id, history = _get_or_create_session(req.session_id)
+
+    async def events():
+        try:
+            async for ev in run_rag_chat_stream(req.prompt, history):
+                if ev["type"] == "token":
+                    yield _sse("token", {"text": ev["text"]})
+                    continue
+                with tracing.span("session_save"):
+                    updated = _sessions.append(session_id, [
+                        {"role": "user", "content": req.prompt},
+                        {"role": "assistant", "content": ev["reply"]},
+                    ])
+                metrics = _session_metrics(updated)
+                metrics["last_turn"] = ev["metrics"]
+                yield _sse("done", {
+                    "reply": ev["reply"],
+                    "session_id": session_id,
+                    "message_count": metrics["message_count"],
+                    "metrics": metrics,
+                })
+        except httpx.ConnectError:
+            _errors.inc(type="503", endpoint="chat_stream")
+            yield _sse("error", {
+                "status": 503,
+                "detail": f"Cannot reach inference at {settings.inference_url}. Is the inference server running?",
+            })
+        except httpx.HTTPStatusError as e:
+            _errors.inc(type="502", endpoint="chat_stream")
+            yield _sse("error", {"status": 502, "detail": str(e.response.text)})
+        except (httpx.HTTPError, ValueError) as e:
+            # Read timeouts, dropped connections, malformed stream lines: the 200 is already sent.
+            _errors.inc(type="502", endpoint="chat_stream")
+            yield _sse("error", {"status": 502, "detail": f"Inference stream failed: {e!r}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/session/{session_id}", response_model=SessionResponse)
 def get_session(session_id: str) -> SessionResponse:
     """Return session telemetry: message count and metrics (Phase 6)."""
-    if session_id not in _sessions:
+    history = _sessions.get(session_id)
+    if history is None:
         raise HTTPException(status_code=404, detail="session not found")
-    history = _sessions[session_id]
     metrics = _session_metrics(history)
     return SessionResponse(
         session_id=session_id,
@@ -151,23 +263,157 @@ class RetrieveResponse(BaseModel):
 
 
 @app.post("/api/retrieve", response_model=RetrieveResponse)
-def api_retrieve(req: RetrieveRequest) -> RetrieveResponse:
+async def api_retrieve(req: RetrieveRequest) -> RetrieveResponse:
     """Search Transformers corpus; return top-k chunks with path, text, score."""
     if not req.query.strip():
         raise HTTPException(status_code=400, detail="query is required")
     try:
-        chunks = retrieve(req.query.strip(), top_k=min(req.top_k, 50))
+        with tracing.span("retrieve", top_k=min(req.top_k, 50)):
+            chunks = await retrieval.retrieve_async(req.query.strip(), top_k=min(req.top_k, 50))
         return RetrieveResponse(chunks=chunks)
     except FileNotFoundError as e:
+        _errors.inc(type="503", endpoint="retrieve")
         raise HTTPException(status_code=503, detail=str(e)) from e
 
 
+# Queries per request, and per encode + search when streaming the batch as NDJSON.
+MAX_BATCH_QUERIES = 1000
+STREAM_GROUP = 64
+
+
+class BatchQuery(BaseModel):
+    query: str
+    top_k: int | None = None  # default: the request's top_k
+    path_prefix: str | None = None  # default: the request's path_prefix
+
+
+class RetrieveBatchRequest(BaseModel):
+    queries: list[str | BatchQuery]
+    top_k: int = 10
+    path_prefix: str | None = None  # keep only chunks whose file path starts with this
+    stream: bool = False
+
+
+class RetrieveBatchResponse(BaseModel):
+    results: list[dict]  # {query, chunks}, in request order
+
+
+@app.post("/api/retrieve/batch", response_model=None)
+async def api_retrieve_batch(req: RetrieveBatchRequest) -> RetrieveBatchResponse | StreamingResponse:
+    """
+    Many queries in one request: one embed call and one multi-row search for the batch. Queries
+    are strings or {query, top_k, path_prefix}. stream=true answers NDJSON, one
+    {index, query, chunks} line per query, searching STREAM_GROUP queries at a time; a failure
+    mid-stream ends it with one {index, error: {status, detail}} line (index: first query not answered).
+    """
+    items = [BatchQuery(query=q) if isinstance(q, str) else q for q in req.queries]
+    if not items:
+        raise HTTPException(status_code=400, detail="queries is required")
+    if len(items) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"at most {MAX_BATCH_QUERIES} queries per request")
+    blank = next((i for i, b in enumerate(items) if not b.query.strip()), None)
+    if blank is not None:
+        raise HTTPException(status_code=400, detail=f"queries[{blank}]: query is required")
+    queries = [b.query.strip() for b in items]
+    top_ks = [max(1, min(req.top_k if b.top_k is None else b.top_k, 50)) for b in items]
+    prefixes = [req.path_prefix if b.path_prefix is None else b.path_prefix for b in items]
+
+    if not req.stream:
+        try:
+            with tracing.span("retrieve_batch", queries=len(queries)):
+                results = await retrieval.retrieve_many_async(queries, top_ks, prefixes)
+        except FileNotFoundError as e:
+            _errors.inc(type="503", endpoint="retrieve_batch")
+            raise HTTPException(status_code=503, detail=str(e)) from e
+        return RetrieveBatchResponse(results=[{"query": q, "chunks": c} for q, c in zip(queries, results)])
+
+    async def lines():
+        for start in range(0, len(queries), STREAM_GROUP):
+            group = slice(start, start + STREAM_GROUP)
+            try:
+                with tracing.span("retrieve_batch", queries=len(queries[group]), offset=start):
+                    results = await retrieval.retrieve_many_async(queries[group], top_ks[group], prefixes[group])
+            except FileNotFoundError as e:
+                _errors.inc(type="503", endpoint="retrieve_batch")
+                yield json.dumps({"index": start, "error": {"status": 503, "detail": str(e)}}) + "\n"
+                return
+            except Exception as e:
+                # The 200 is already sent: say why the stream ends early instead of just cutting it off.
+                _errors.inc(type="500", endpoint="retrieve_batch")
+                yield json.dumps({"index": start, "error": {"status": 500, "detail": repr(e)}}) + "\n"
+                return
+            for i, chunks in enumerate(results, start):
+                yield json.dumps({"index": i, "query": queries[i], "chunks": chunks}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/api/retrieval/stats")
+def retrieval_stats() -> dict:
+    """Query micro-batching histograms and query cache counters, for tuning under load."""
+    return {"batching": retrieval.batch_stats(), "cache": retrieval.cache_stats()}
+
+
+@app.get("/admin/index")
+def admin_index() -> dict:
+    """Active index version and its load time, published versions on disk, hot-reload state."""
+    return retrieval.index_info()
+
+
+@app.post("/admin/index/reload")
+async def admin_index_reload(force: bool = False) -> JSONResponse:
+    """
+    Load the published index version now (force: even if unchanged) and swap it in once warm;
+    in-flight searches finish on the old version. 500 if it failed to load (the old one keeps serving).
+    """
+    info = await retrieval.reload_async(force)
+    return JSONResponse(info, status_code=500 if "reload_error" in info else 200)
+
+
+def _load_seconds(*keys: str) -> float | None:
+    timings = retrieval.load_status()["timings_ms"]
+    if not all(k in timings for k in keys):
+        return None
+    return sum(timings[k] for k in keys) / 1000.0
+
+
+def _rss_bytes() -> float | None:
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+_errors = metrics.Counter("rag_http_errors_total", "Inference/index failures returned to clients, by status")
+metrics.Gauge("rag_active_sessions", "Sessions in the session store", lambda: _sessions.stats()["sessions"])
+metrics.Gauge("rag_inference_queue_depth", "Requests waiting for an inference slot", inference.queue_depth)
+metrics.Gauge("rag_index_load_seconds", "Index + chunk store load time", lambda: _load_seconds("index_ms", "metadata_ms"))
+metrics.Gauge("rag_embed_model_load_seconds", "Embedding model load time", lambda: _load_seconds("model_ms"))
+metrics.Gauge("process_resident_memory_bytes", "Backend process RSS (needs psutil)", _rss_bytes)
+metrics.Gauge(
+    "process_unique_memory_bytes",
+    "RSS private to this process (needs psutil)",
+    lambda: (metrics.process_memory() or {}).get("unique"),
+)
+metrics.Gauge(
+    "process_shared_memory_bytes",
+    "RSS shared with other processes, e.g. the index mapped by every worker (needs psutil)",
+    lambda: (metrics.process_memory() or {}).get("shared"),
+)
+
+
+@app.get("/metrics")
+def prometheus_metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint: latency histograms, token/error counters, saturation gauges."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 def index() -> FileResponse:
     """Serve frontend so one URL runs the app."""
     index_file = FRONTEND_DIR / "index.html"
     if not index_file.exists():
-        from fastapi.responses import JSONResponse
         return JSONResponse({"error": "frontend/index.html not found"}, status_code=404)
     return FileResponse(index_file)
 
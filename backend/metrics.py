@@ -0,0 +1,165 @@
+"""
+In-process metrics: fixed-bucket histograms for tuning hot paths under load, plus counters
+and gauges, rendered in the Prometheus text format by GET /metrics.
+
+Metrics given a name register themselves; gauges are read through a callback at scrape time,
+so values that already live elsewhere (queue depth, session count, RSS) cost nothing per request.
+"""
+
+import bisect
+import threading
+from collections.abc import Callable
+
+# Latency buckets in seconds, from sub-ms cache hits to multi-second inference.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry: list = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric) -> None:
+    if metric.name:
+        with _registry_lock:
+            _registry.append(metric)
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return repr(round(value, 6))
+    return str(int(value))
+
+
+def _labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (Prometheus-style cumulative `le` buckets in snapshots).
+    Thread-safe; observe() is a bisect + two adds under a lock.
+    """
+
+    def __init__(self, buckets: tuple[float, ...], name: str = "", help: str = "") -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.name = name
+        self.help = help
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot = +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+        _register(self)
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = []
+        running = 0
+        for bound, c in zip(self.buckets + (float("inf"),), counts):
+            running += c
+            cumulative.append({"le": "+Inf" if bound == float("inf") else bound, "count": running})
+        return {
+            "count": count,
+            "sum": round(total, 3),
+            "mean": round(total / count, 3) if count else None,
+            "buckets": cumulative,
+        }
+
+    def render(self) -> list[str]:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        running = 0
+        for bound, c in zip(self.buckets + (float("inf"),), counts):
+            running += c
+            lines.append(f'{self.name}_bucket{{le="{_fmt(bound)}"}} {running}')
+        lines.append(f"{self.name}_sum {_fmt(total)}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels: inc(1, type="503")."""
+
+    def __init__(self, name: str, help: str = "") -> None:
+        self.name = name
+        self.help = help
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(k)} {_fmt(v)}" for k, v in values] or [f"{self.name} 0"]
+        return lines
+
+
+class Gauge:
+    """Value read at scrape time from fn(); None skips the sample."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float | None]) -> None:
+        self.name = name
+        self.help = help
+        self.fn = fn
+        _register(self)
+
+    def render(self) -> list[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            value = None
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if value is not None:
+            lines.append(f"{self.name} {_fmt(value)}")
+        return lines
+
+
+def process_memory(pid: int | None = None) -> dict | None:
+    """
+    RSS of a process split into unique (private: heap, model weights) and shared bytes (pages
+    also mapped by other processes, e.g. an index memory-mapped by every worker), plus PSS
+    (shared pages divided among their users; Linux). Needs psutil; None without it.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process(pid).memory_full_info()
+    out = {"rss": info.rss, "unique": info.uss, "shared": max(info.rss - info.uss, 0)}
+    if hasattr(info, "pss"):
+        out["pss"] = info.pss
+    return out
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines: list[str] = []
+    for m in metrics:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
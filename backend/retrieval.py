@@ -1,48 +1,562 @@
-"""RAG retrieval: load FAISS index + metadata, embed query, return top-k chunks."""
+"""
+RAG retrieval: load FAISS index + metadata, embed query, return top-k chunks.
 
+RETRIEVAL_MODE=hybrid also searches the BM25 index from ingest.lexical and merges both ranked
+lists by reciprocal-rank fusion; hits then carry the fused score and their rank in each list.
+
+Hot reload: the loaded index version (FAISS index, chunk store, BM25) is one immutable _Snapshot.
+When ingest publishes a new version (INDEX_HOT_RELOAD; checked at most every
+INDEX_CHECK_INTERVAL_S from the request path) it is loaded and warmed on a background thread,
+then swapped in with one assignment. Each search holds the snapshot it started with, so
+in-flight searches finish on the old version. The embedding model is shared across versions.
+"""
+
+import asyncio
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any
 
+from backend import tracing
+from backend.cache import TTLCache
+from backend.metrics import LATENCY_BUCKETS, Counter, Histogram
 from config import settings
 
 # Must match ingest/run.py
 EMBED_MODEL = "BAAI/bge-small-en-v1.5"
 
-_index = None
-_metadata = None
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """One loaded index version; searches read index, metadata and lexical from the same one."""
+
+    generation: int  # bumps on every load; part of the result cache key
+    version: str  # ingest version name, or "unversioned" for an index dir without CURRENT
+    path: Path
+    signature: tuple  # _index_signature(path) when loaded: in-place rewrites also reload
+    index: Any
+    metadata: Any  # ChunkStore or legacy metadata list
+    lexical: Any  # ingest.lexical.LexicalIndex, or None (dense only)
+    timings_ms: dict = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.time)
+
+
+_active: _Snapshot | None = None
 _model = None
+_generations = itertools.count(1)
+_load_lock = threading.Lock()
+# Held for the whole background load + swap; one reload at a time.
+_reload_lock = threading.Lock()
+_reload_error: str | None = None
+_reload_failed: tuple | None = None  # (path, signature) that failed; not retried until it changes
+_previous_version: str | None = None
+
+# Load state for /ready: not_loaded | loading | ready | error, plus per-component timings (ms).
+_load_state = "not_loaded"
+_load_error: str | None = None
+_load_timings: dict[str, float] = {}
+
+# Encode + FAISS search run here so they never block the event loop. Threads (not processes):
+# torch and FAISS release the GIL in their kernels, and workers share one loaded model/index.
+_executor: ThreadPoolExecutor | None = None
+
+
+_encode_seconds = Histogram(LATENCY_BUCKETS, "rag_encode_seconds", "Query embedding time per encode call")
+_search_seconds = Histogram(LATENCY_BUCKETS, "rag_search_seconds", "FAISS search time per search call")
+_lexical_seconds = Histogram(LATENCY_BUCKETS, "rag_lexical_seconds", "BM25 search time per batch of queries")
+
+# Query caches: normalized query -> embedding, (generation, query, top_k) -> results. Results
+# are keyed by snapshot, so a swap never serves hits of the old version; the result cache is
+# also cleared on swap. Embeddings depend only on the model and survive swaps.
+_embedding_cache = TTLCache(settings.query_cache_size, settings.query_cache_ttl_s)
+_result_cache = TTLCache(settings.query_cache_size, settings.query_cache_ttl_s)
+_checked_at = 0.0
+_cache_invalidations = 0
+INDEX_CHECK_INTERVAL_S = 1.0
+
+# Path-prefix filters: (generation, prefix) -> (match, rows); see _prefix_filter.
+_prefix_cache = TTLCache(256, 0)
+FILTER_MAX_CANDIDATES = 1024
+
+# Components of a version's load time (the model is loaded once, not per version).
+_LOAD_KEYS = ("index_ms", "metadata_ms", "lexical_ms", "warmup_search_ms")
+_reloads = Counter("rag_index_reloads_total", "Index version loads after startup (hot reloads), by outcome")
 
 
 def _index_dir() -> Path:
+    """INDEX_PATH as a directory (the versions/ + CURRENT root)."""
     p = settings.index_path.expanduser().resolve()
     return p.parent if p.suffix else p
 
 
-def _index_path() -> Path:
-    return _index_dir() / "index.faiss"
+def _live_dir() -> Path:
+    from ingest.incremental import live_dir
 
+    return live_dir(_index_dir())
 
-def _meta_path() -> Path:
-    return _index_dir() / "metadata.json"
 
+def _load_metadata(path: Path):
+    """Memory-mapped ChunkStore if present, else the legacy metadata.json list."""
+    from ingest import store
 
-def _load() -> None:
-    global _index, _metadata, _model
-    if _index is not None:
-        return
+    if store.exists(path):
+        return store.ChunkStore(path)
     import json
-    import faiss
-    import numpy as np
-    from sentence_transformers import SentenceTransformer
+    return json.loads((path / "metadata.json").read_text(encoding="utf-8"))
 
-    idx_path = _index_path()
-    meta_path = _meta_path()
-    if not idx_path.exists() or not meta_path.exists():
+
+def _ms_since(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000.0, 2)
+
+
+def _open_snapshot(path: Path) -> _Snapshot:
+    """Load the index files in path (one version dir). Raises FileNotFoundError if incomplete."""
+    from ingest import lexical, store
+    from ingest.index import apply_search_params, read_index
+
+    idx_path = path / "index.faiss"
+    if not idx_path.exists() or not (store.exists(path) or (path / "metadata.json").exists()):
         raise FileNotFoundError(
-            f"Index not found. Run: uv run python -m ingest (expects {idx_path} and {meta_path})"
+            f"Index not found. Run: uv run python -m ingest (expects {idx_path} and a chunk store in {path})"
+        )
+    signature = _index_signature(path)
+    timings: dict[str, float] = {}
+    t0 = time.perf_counter()
+    index = read_index(idx_path, mmap=settings.index_mmap)
+    apply_search_params(index)  # nprobe / efSearch are not persisted by write_index
+    timings["index_ms"] = _ms_since(t0)
+    t0 = time.perf_counter()
+    metadata = _load_metadata(path)
+    timings["metadata_ms"] = _ms_since(t0)
+    t0 = time.perf_counter()
+    lexical_index = lexical.load(path, len(metadata))
+    timings["lexical_ms"] = _ms_since(t0)
+    return _Snapshot(
+        generation=next(_generations),
+        version=path.name if path != _index_dir() else "unversioned",
+        path=path,
+        signature=signature,
+        index=index,
+        metadata=metadata,
+        lexical=lexical_index,
+        timings_ms=timings,
+    )
+
+
+def _load() -> None:
+    global _active, _model, _load_state, _load_error
+    if _active is not None:
+        return
+    # Concurrent first requests wait here for a single load instead of each loading.
+    with _load_lock:
+        if _active is not None:
+            return
+        from sentence_transformers import SentenceTransformer
+
+        _load_state, _load_error = "loading", None
+        try:
+            snap = _open_snapshot(_live_dir())
+            _load_timings.update(snap.timings_ms)
+            t0 = time.perf_counter()
+            model = SentenceTransformer(EMBED_MODEL)
+            _load_timings["model_ms"] = _ms_since(t0)
+        except FileNotFoundError:
+            _load_state, _load_error = "error", "index_not_found"
+            raise
+        except Exception as e:
+            _load_state, _load_error = "error", repr(e)
+            raise
+        # Publish _active last: it is the "loaded" flag checked outside the lock.
+        _model = model
+        _embedding_cache.clear()
+        _result_cache.clear()
+        _active = snap
+        _load_state = "ready"
+
+
+def warmup() -> dict:
+    """
+    Load index, metadata and model, then run one dummy encode + search so the first real
+    query doesn't pay for lazy init (torch kernels, FAISS pages). Returns load_status().
+    """
+    _load()
+    t0 = time.perf_counter()
+    _search_batch(["warmup query"], [1])
+    _load_timings["warmup_search_ms"] = _ms_since(t0)
+    return load_status()
+
+
+def reload(force: bool = False) -> dict:
+    """
+    Load the published index version if it differs from the active one (or force), warm it
+    with one search and swap it in. Searches already running keep the old snapshot. On failure
+    the old version keeps serving and the error is reported in index_info(). Blocks while
+    another reload runs. Returns index_info().
+    """
+    with _reload_lock:
+        _reload_locked(force)
+    return index_info()
+
+
+def _reload_locked(force: bool) -> None:
+    global _active, _reload_error, _reload_failed, _previous_version, _cache_invalidations
+    old = _active
+    if old is None:
+        return  # nothing loaded yet; the first query loads the live version
+    path = _live_dir()
+    key = (path, _index_signature(path))
+    if not force and key == (old.path, old.signature):
+        return
+    t0 = time.perf_counter()
+    try:
+        snap = _open_snapshot(path)
+        t1 = time.perf_counter()
+        _search_batch(["warmup query"], [1], False, None, snap)  # fault in pages before traffic
+        snap.timings_ms["warmup_search_ms"] = _ms_since(t1)
+    except Exception as e:
+        _reload_error, _reload_failed = repr(e), key
+        _reloads.inc(outcome="error")
+        return
+    snap.timings_ms["reload_ms"] = _ms_since(t0)
+    _active = snap
+    _result_cache.clear()
+    _prefix_cache.clear()  # its matchers hold the old chunk store
+    _load_timings.update(snap.timings_ms)
+    _reload_error, _reload_failed, _previous_version = None, None, old.version
+    _cache_invalidations += 1
+    _reloads.inc(outcome="ok")
+
+
+def _background_reload() -> None:
+    try:
+        _reload_locked(force=False)
+    finally:
+        _reload_lock.release()
+
+
+def _check_for_new_version() -> None:
+    """
+    Throttled (INDEX_CHECK_INTERVAL_S) from the request path: start a background reload when
+    CURRENT points at a new version or the live files changed in place.
+    """
+    global _checked_at
+    now = time.monotonic()
+    snap = _active
+    if snap is None or not settings.index_hot_reload or now - _checked_at < INDEX_CHECK_INTERVAL_S:
+        return
+    _checked_at = now
+    path = _live_dir()
+    key = (path, _index_signature(path))
+    if key == (snap.path, snap.signature) or key == _reload_failed:
+        return
+    if not _reload_lock.acquire(blocking=False):
+        return  # a reload is already running
+    threading.Thread(target=_background_reload, name="index-reload", daemon=True).start()
+
+
+async def reload_async(force: bool = False) -> dict:
+    """reload() off the event loop; not on the retrieval executor, so searches keep their threads."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, reload, force)
+
+
+def index_info() -> dict:
+    """Active index version, its load timings, versions on disk and hot-reload state (/admin/index)."""
+    from ingest.incremental import current_version, list_versions
+
+    snap = _active
+    info: dict = {
+        "hot_reload": settings.index_hot_reload,
+        "published": current_version(_index_dir()),
+        "versions": list_versions(_index_dir()),
+        "reloading": _reload_lock.locked(),
+        "reloads": {"ok": _reloads.value(outcome="ok"), "error": _reloads.value(outcome="error")},
+    }
+    if snap is not None:
+        info["active"] = {
+            "version": snap.version,
+            "path": str(snap.path),
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(snap.loaded_at)),
+            "load_ms": round(sum(snap.timings_ms.get(k, 0.0) for k in _LOAD_KEYS), 2),
+            "timings_ms": dict(snap.timings_ms),
+            "vectors": int(snap.index.ntotal),
+            "chunks": len(snap.metadata),
+        }
+        info["previous"] = _previous_version
+    if _reload_error:
+        info["reload_error"] = _reload_error
+    return info
+
+
+async def warmup_async() -> dict:
+    """warmup() on the retrieval executor (used from the FastAPI lifespan)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), warmup)
+
+
+def load_status() -> dict:
+    """Retrieval stack readiness for /ready: state, error (if any), per-component load timings."""
+    state = _load_state
+    if state == "ready" and "warmup_search_ms" not in _load_timings and settings.retrieval_warmup:
+        state = "warming"
+    status: dict = {
+        "state": state,
+        "timings_ms": dict(_load_timings),
+    }
+    if _load_error:
+        status["error"] = _load_error
+    snap = _active
+    if snap is not None:
+        from ingest.index import describe
+
+        status["version"] = snap.version
+        status["index"] = describe(snap.index)
+        status["vectors"] = int(snap.index.ntotal)
+        status["chunks"] = len(snap.metadata)
+        status["mode"] = "hybrid" if _hybrid(snap) else "dense"
+        if snap.lexical is not None:
+            status["lexical_terms"] = snap.lexical.n_terms
+    return status
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.retrieval_workers,
+            thread_name_prefix="retrieval",
         )
-    _index = faiss.read_index(str(idx_path))
-    _metadata = json.loads(meta_path.read_text(encoding="utf-8"))
-    _model = SentenceTransformer(EMBED_MODEL)
+    return _executor
+
+
+def shutdown_executor() -> None:
+    """Stop retrieval worker threads (FastAPI lifespan shutdown)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+def _query_key(query: str) -> str:
+    """Cache key: whitespace-normalized query (case is kept; it can matter for code identifiers)."""
+    return " ".join(query.split())
+
+
+def _index_signature(path: Path) -> tuple:
+    sig = []
+    for name in ("index.faiss", "chunks.npy", "chunks.bin", "metadata.json", "bm25.json", "vectors.npy"):
+        try:
+            st = (path / name).stat()
+        except FileNotFoundError:
+            continue
+        sig.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def _cached_results(query: str, top_k: int) -> list[dict] | None:
+    _check_for_new_version()
+    hit = _result_cache.get((_active.generation, _query_key(query), top_k, ""))
+    return list(hit) if hit is not None else None
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters of the query embedding and result caches (invalidations = version swaps)."""
+    return {
+        "embedding": _embedding_cache.stats(),
+        "results": _result_cache.stats(),
+        "invalidations": _cache_invalidations,
+    }
+
+
+def _embed_queries(keys: list[str], timings: dict | None = None):
+    """Embeddings for normalized queries: cached rows reused, the rest encoded in one call."""
+    import numpy as np
+
+    vectors = [_embedding_cache.get(k) for k in keys]
+    missing = list(dict.fromkeys(k for k, v in zip(keys, vectors) if v is None))
+    if missing:
+        t0 = time.perf_counter()
+        encoded = _model.encode(missing, normalize_embeddings=True).astype(np.float32)
+        elapsed = time.perf_counter() - t0
+        _encode_seconds.observe(elapsed)
+        if timings is not None:
+            timings["encode_ms"] = round(elapsed * 1000.0, 3)
+            timings["encoded"] = len(missing)
+        fresh = dict(zip(missing, encoded))
+        for k, v in fresh.items():
+            _embedding_cache.put(k, v)
+        vectors = [fresh[k] if v is None else v for k, v in zip(keys, vectors)]
+    return np.stack(vectors)
+
+
+def _hybrid(snap: _Snapshot) -> bool:
+    return settings.retrieval_mode == "hybrid" and snap.lexical is not None
+
+
+def _rrf(dense_ids, lexical_ids, top_k: int) -> list[tuple[int, float, dict]]:
+    """Reciprocal-rank fusion of two ranked id lists: (id, fused score, {source: 1-based rank})."""
+    fused: dict[int, float] = {}
+    ranks: dict[int, dict] = {}
+    for source, ids in (("dense", dense_ids), ("lexical", lexical_ids)):
+        for rank, idx in enumerate(int(i) for i in ids if i >= 0):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (settings.rrf_k + rank + 1)
+            ranks.setdefault(idx, {})[source] = rank + 1
+    best = sorted(fused, key=fused.__getitem__, reverse=True)[:top_k]
+    return [(idx, fused[idx], ranks[idx]) for idx in best]
+
+
+def _hit(metadata, idx: int, score: float) -> dict | None:
+    if idx < 0 or idx >= len(metadata):
+        return None
+    meta = metadata[idx]
+    hit = {
+        "path": meta["path"],
+        "text": meta["text"],
+        "score": score,
+    }
+    if "lines" in meta:
+        hit["lines"] = meta["lines"]
+    return hit
+
+
+def _prefix_filter(snap: _Snapshot, prefix: str) -> tuple[Any, int]:
+    """
+    (match, rows): match(ids) -> bool mask of the ids whose chunk path starts with prefix (False
+    for -1 and out-of-range ids), rows = how many chunks match. Cached per index version.
+    """
+    import numpy as np
+
+    key = (snap.generation, prefix)
+    cached = _prefix_cache.get(key)
+    if cached is not None:
+        return cached
+    metadata = snap.metadata
+    n = len(metadata)
+    if hasattr(metadata, "prefix_mask"):  # ChunkStore: compare path indices, decode no text
+        paths = metadata.prefix_paths(prefix)
+
+        def test(ids):
+            return metadata.prefix_mask(ids, paths)
+    else:
+        def test(ids):
+            return np.array([metadata[int(i)]["path"].startswith(prefix) for i in ids], dtype=bool)
+
+    def match(ids):
+        ids = np.asarray(ids)
+        valid = (ids >= 0) & (ids < n)
+        out = np.zeros(len(ids), dtype=bool)
+        out[valid] = test(ids[valid])
+        return out
+
+    result = (match, int(np.count_nonzero(match(np.arange(n)))))
+    _prefix_cache.put(key, result)
+    return result
+
+
+def _fetch_k(snap: _Snapshot, top_k: int, prefix: str, hybrid: bool) -> tuple[int, Any]:
+    """
+    (candidates to take from each search, prefix match or None). Prefix filters apply after the
+    search, so a filtered query fetches more in proportion to how few chunks its prefix matches,
+    up to FILTER_MAX_CANDIDATES; very narrow prefixes can return fewer than top_k hits.
+    """
+    base = max(top_k, settings.hybrid_candidates) if hybrid else top_k
+    if not prefix:
+        return base, None
+    match, rows = _prefix_filter(snap, prefix)
+    if rows == 0:
+        return 0, match
+    want = math.ceil(2 * base * len(snap.metadata) / rows)
+    return min(want, max(base, FILTER_MAX_CANDIDATES)), match
+
+
+def _search_batch(
+    queries: list[str],
+    top_ks: list[int],
+    use_result_cache: bool = True,
+    timings: dict | None = None,
+    snap: _Snapshot | None = None,
+    prefixes: list[str] | None = None,
+) -> list[list[dict]]:
+    """
+    Embed all queries in one encode call and run one multi-row FAISS search;
+    return one {path, text, score} list per query (each cut to its own top_k).
+    Cached results and cached query embeddings are reused; only misses are encoded/searched.
+    In hybrid mode each query is also run against BM25 and the two lists are fused (RRF).
+    timings, if given, receives encode_ms / search_ms / lexical_ms / fuse_ms / batch for tracing.
+    snap: the index version to search (default: the active one, taken once for the whole batch).
+    prefixes: per-query chunk path prefix ("" = no filter), see _fetch_k.
+    """
+    if snap is None:
+        _load()
+        _check_for_new_version()
+        snap = _active
+    prefixes = prefixes or [""] * len(queries)
+    keys = [_query_key(q) for q in queries]
+    results: list[list[dict] | None] = [None] * len(queries)
+    todo = list(range(len(queries)))
+    if use_result_cache:
+        todo = []
+        for i, (key, top_k, prefix) in enumerate(zip(keys, top_ks, prefixes)):
+            hit = _result_cache.get((snap.generation, key, top_k, prefix))
+            if hit is None:
+                todo.append(i)
+            else:
+                results[i] = list(hit)
+
+    hybrid = _hybrid(snap)
+    fetch = {i: _fetch_k(snap, top_ks[i], prefixes[i], hybrid) for i in todo}
+    for i in todo:
+        if fetch[i][0] <= 0:  # prefix matches no chunk (or top_k <= 0)
+            results[i] = []
+    todo = [i for i in todo if fetch[i][0] > 0]
+    if not todo:
+        return results
+
+    q = _embed_queries([keys[i] for i in todo], timings)
+    k = min(max(fetch[i][0] for i in todo), len(snap.metadata))
+    t0 = time.perf_counter()
+    scores, ids = snap.index.search(q, k)
+    elapsed = time.perf_counter() - t0
+    _search_seconds.observe(elapsed)
+    if timings is not None:
+        timings["search_ms"] = round(elapsed * 1000.0, 3)
+        timings["batch"] = len(todo)
+    if hybrid:
+        t0 = time.perf_counter()
+        lexical_ids = [snap.lexical.search(keys[i], fetch[i][0])[0] for i in todo]
+        elapsed = time.perf_counter() - t0
+        _lexical_seconds.observe(elapsed)
+        if timings is not None:
+            timings["lexical_ms"] = round(elapsed * 1000.0, 3)
+    t0 = time.perf_counter()
+    for row, i in enumerate(todo):
+        n_fetch, match = fetch[i]
+        dense_ids, dense_scores = ids[row][:n_fetch], scores[row][:n_fetch]
+        if match is not None:
+            keep = match(dense_ids)
+            dense_ids, dense_scores = dense_ids[keep], dense_scores[keep]
+        out = []
+        if hybrid:
+            lex = lexical_ids[row] if match is None else lexical_ids[row][match(lexical_ids[row])]
+            for idx, score, ranks in _rrf(dense_ids, lex, top_ks[i]):
+                hit = _hit(snap.metadata, idx, score)
+                if hit is not None:
+                    hit["ranks"] = ranks
+                    out.append(hit)
+        else:
+            for j, idx in enumerate(dense_ids[:top_ks[i]]):
+                hit = _hit(snap.metadata, int(idx), float(dense_scores[j]))
+                if hit is not None:
+                    out.append(hit)
+        _result_cache.put((snap.generation, keys[i], top_ks[i], prefixes[i]), out)
+        results[i] = list(out)
+    if hybrid and timings is not None:
+        timings["fuse_ms"] = _ms_since(t0)  # fusion + decoding the hits from the chunk store
+    return results
 
 
 def retrieve(query: str, top_k: int = 10) -> list[dict]:
@@ -50,18 +564,147 @@ def retrieve(query: str, top_k: int = 10) -> list[dict]:
     Embed query, search FAISS, return list of {path, text, score}.
     Loads index and model on first call.
     """
-    _load()
-    import numpy as np
-    q = _model.encode([query], normalize_embeddings=True).astype(np.float32)
-    scores, ids = _index.search(q, min(top_k, len(_metadata)))
-    out = []
-    for i, idx in enumerate(ids[0]):
-        if idx < 0 or idx >= len(_metadata):
-            continue
-        meta = _metadata[idx]
-        out.append({
-            "path": meta["path"],
-            "text": meta["text"],
-            "score": float(scores[0][i]),
-        })
-    return out
+    return _search_batch([query], [top_k])[0]
+
+
+def retrieve_many(
+    queries: list[str],
+    top_k: int | list[int] = 10,
+    path_prefix: str | list[str | None] | None = None,
+    timings: dict | None = None,
+) -> list[list[dict]]:
+    """
+    retrieve() for many queries at once: one encode call and one multi-row FAISS search for the
+    whole batch. top_k and path_prefix (keep only chunks whose path starts with it) are one
+    value for all queries or one per query. Returns one hit list per query, in order.
+    """
+    n = len(queries)
+    top_ks = list(top_k) if isinstance(top_k, (list, tuple)) else [top_k] * n
+    prefixes = list(path_prefix) if isinstance(path_prefix, (list, tuple)) else [path_prefix] * n
+    if len(top_ks) != n or len(prefixes) != n:
+        raise ValueError("top_k and path_prefix lists must match queries in length")
+    if not n:
+        return []
+    return _search_batch(queries, top_ks, True, timings, prefixes=[p or "" for p in prefixes])
+
+
+async def retrieve_many_async(
+    queries: list[str],
+    top_k: int | list[int] = 10,
+    path_prefix: str | list[str | None] | None = None,
+) -> list[list[dict]]:
+    """retrieve_many() on the retrieval executor (already one batch: not micro-batched)."""
+    loop = asyncio.get_running_loop()
+    timings: dict = {}
+    results = await loop.run_in_executor(
+        _get_executor(), retrieve_many, queries, top_k, path_prefix, timings
+    )
+    tracing.annotate(**timings)
+    return results
+
+
+# Batch sizes are query counts; waits are seconds from submit to flush.
+_batch_size_hist = Histogram((1, 2, 4, 8, 16, 32, 64), "rag_retrieval_batch_size", "Queries per micro-batch")
+_batch_wait_hist = Histogram(
+    (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05),
+    "rag_retrieval_batch_wait_seconds",
+    "Wait from query submit to batch flush",
+)
+
+
+class _QueryBatcher:
+    """
+    Collects queries arriving within RETRIEVAL_BATCH_WAIT_MS (or until RETRIEVAL_BATCH_MAX are
+    pending), runs them as one _search_batch on the executor, and resolves each caller's future.
+    Lives on the event loop, so no locking is needed around _pending.
+    """
+
+    def __init__(self, max_batch: int, wait_ms: float) -> None:
+        self.max_batch = max_batch
+        self.wait_ms = wait_ms
+        self._pending: list[tuple[str, int, asyncio.Future, float, dict]] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    async def submit(self, query: str, top_k: int) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        timings: dict = {}
+        self._pending.append((query, top_k, fut, time.perf_counter(), timings))
+        if len(self._pending) >= self.max_batch:
+            self._flush(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.wait_ms / 1000.0, self._flush, loop)
+        result = await fut
+        tracing.annotate(**timings)
+        return result
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        now = time.perf_counter()
+        _batch_size_hist.observe(len(batch))
+        for _q, _k, _f, t_submit, timings in batch:
+            wait_ms = (now - t_submit) * 1000.0
+            _batch_wait_hist.observe(wait_ms / 1000.0)
+            timings["batch_wait_ms"] = round(wait_ms, 3)
+        shared: dict = {}
+        # Result cache was already checked in retrieve_async; don't count those misses twice.
+        work = loop.run_in_executor(
+            _get_executor(), _search_batch, [b[0] for b in batch], [b[1] for b in batch], False, shared
+        )
+        work.add_done_callback(lambda f: self._resolve(batch, f, shared))
+
+    @staticmethod
+    def _resolve(batch: list, work: asyncio.Future, shared: dict) -> None:
+        exc = asyncio.CancelledError() if work.cancelled() else work.exception()
+        results = None if exc else work.result()
+        for i, (_q, _k, fut, _t, timings) in enumerate(batch):
+            timings.update(shared)
+            if fut.done():  # caller went away
+                continue
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(results[i])
+
+
+_batcher: _QueryBatcher | None = None
+
+
+def batch_stats() -> dict:
+    """Batch-size and wait-window histograms, for tuning RETRIEVAL_BATCH_* under load."""
+    return {
+        "max_batch": settings.retrieval_batch_max,
+        "wait_ms": settings.retrieval_batch_wait_ms,
+        "batch_size": _batch_size_hist.snapshot(),
+        "wait_seconds": _batch_wait_hist.snapshot(),
+    }
+
+
+async def retrieve_async(query: str, top_k: int = 10) -> list[dict]:
+    """
+    retrieve() on the retrieval executor, so encode + search don't stall other requests.
+    Concurrent calls are micro-batched into one encode + search (RETRIEVAL_BATCH_WAIT_MS=0 disables).
+    Repeated queries are answered from the result cache on the event loop.
+    """
+    global _batcher
+    if _active is not None:
+        cached = _cached_results(query, top_k)  # no thread hop for repeated queries
+        if cached is not None:
+            tracing.annotate(cache="hit")
+            return cached
+    if settings.retrieval_batch_wait_ms <= 0 or settings.retrieval_batch_max <= 1:
+        loop = asyncio.get_running_loop()
+        timings: dict = {}
+        result = await loop.run_in_executor(
+            _get_executor(), _search_batch, [query], [top_k], _active is None, timings
+        )
+        tracing.annotate(**timings)
+        return result[0]
+    if _batcher is None:
+        _batcher = _QueryBatcher(settings.retrieval_batch_max, settings.retrieval_batch_wait_ms)
+    return await _batcher.submit(query, top_k)
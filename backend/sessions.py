@@ -0,0 +1,267 @@
+"""
+Chat session stores: session_id -> list of {role, content}.
+
+Both backends evict sessions idle for longer than SESSION_TTL_S, keep at most SESSION_MAX
+sessions (least recently used go first) and cap each session's history at
+SESSION_MAX_BYTES of JSON by dropping its oldest messages.
+- MemorySessionStore: per-process, the default.
+- SQLiteSessionStore: one file shared by every uvicorn worker on the host, so any worker can
+  serve a session_id.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+
+SWEEP_INTERVAL_S = 5.0  # SQLite: how often a write also runs the TTL/LRU sweep
+
+
+def _nbytes(history: list[dict]) -> int:
+    return len(json.dumps(history).encode("utf-8"))
+
+
+def _trim(history: list[dict], max_bytes: int) -> tuple[list[dict], int]:
+    """Drop the oldest messages until history fits max_bytes (<= 0 = no cap); keep the last one."""
+    dropped = 0
+    if max_bytes > 0:
+        while len(history) > 1 and _nbytes(history) > max_bytes:
+            history = history[1:]
+            dropped += 1
+    return history, dropped
+
+
+class SessionStore(ABC):
+    """Interface shared by the backends."""
+
+    backend = ""
+
+    def __init__(self, max_sessions: int, ttl_s: float, max_bytes: int) -> None:
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+
+    @abstractmethod
+    def get(self, session_id: str) -> list[dict] | None:
+        """Copy of the session's history, or None if unknown or expired. Refreshes its idle timer."""
+
+    def get_or_create(self, session_id: str) -> list[dict]:
+        history = self.get(session_id)
+        if history is None:
+            self.append(session_id, [])
+            history = []
+        return history
+
+    @abstractmethod
+    def append(self, session_id: str, messages: list[dict]) -> list[dict]:
+        """Append messages (creating the session if needed); return the history after trimming."""
+
+    @abstractmethod
+    def stats(self) -> dict: ...
+
+    def close(self) -> None:
+        """Release resources (FastAPI lifespan shutdown); the store reopens them if used again."""
+
+
+class MemorySessionStore(SessionStore):
+    backend = "memory"
+
+    def __init__(self, max_sessions: int, ttl_s: float, max_bytes: int) -> None:
+        super().__init__(max_sessions, ttl_s, max_bytes)
+        # session_id -> (last access, history, bytes); ordered oldest access first
+        self._data: OrderedDict[str, tuple[float, list[dict], int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.evicted_ttl = 0
+        self.evicted_lru = 0
+        self.trimmed_messages = 0
+
+    def _pop(self, session_id: str) -> None:
+        self._bytes -= self._data.pop(session_id)[2]
+
+    def _evict(self, now: float) -> None:
+        # Least recently used first, so expired sessions are all at the front.
+        if self.ttl_s > 0:
+            while self._data:
+                sid, (last, _, _) = next(iter(self._data.items()))
+                if now - last <= self.ttl_s:
+                    break
+                self._pop(sid)
+                self.evicted_ttl += 1
+        if self.max_sessions > 0:
+            while len(self._data) > self.max_sessions:
+                self._pop(next(iter(self._data)))
+                self.evicted_lru += 1
+
+    def get(self, session_id: str) -> list[dict] | None:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            item = self._data.get(session_id)
+            if item is None:
+                return None
+            self._data[session_id] = (now, item[1], item[2])
+            self._data.move_to_end(session_id)
+            return list(item[1])
+
+    def append(self, session_id: str, messages: list[dict]) -> list[dict]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)  # an expired session starts over, as in SQLiteSessionStore
+            item = self._data.get(session_id)
+            history = (item[1] if item else []) + list(messages)
+            history, dropped = _trim(history, self.max_bytes)
+            self.trimmed_messages += dropped
+            size = _nbytes(history)
+            if item:
+                self._bytes -= item[2]
+            self._data[session_id] = (now, history, size)
+            self._data.move_to_end(session_id)
+            self._bytes += size
+            self._evict(now)
+            return list(history)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "sessions": len(self._data),
+                "bytes": self._bytes,
+                "evicted_ttl": self.evicted_ttl,
+                "evicted_lru": self.evicted_lru,
+                "trimmed_messages": self.trimmed_messages,
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in one SQLite file (WAL mode). Eviction counters live in the database too, so
+    stats() reports totals across all workers. Timestamps are wall-clock (time.time()).
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: Path, max_sessions: int, ttl_s: float, max_bytes: int) -> None:
+        super().__init__(max_sessions, ttl_s, max_bytes)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = self._connect()
+        self._last_sweep = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY, history TEXT NOT NULL, bytes INTEGER NOT NULL, last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access);
+            CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """
+        )
+        return conn
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """The connection; reopened after close() (the app's lifespan can start again, e.g. in tests)."""
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
+
+    def _bump(self, name: str, n: int) -> None:
+        if n:
+            self._conn.execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, n),
+            )
+
+    def _sweep(self, now: float) -> None:
+        if self.ttl_s > 0:
+            cur = self._conn.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.ttl_s,))
+            self._bump("evicted_ttl", cur.rowcount)
+        if self.max_sessions > 0:
+            cur = self._conn.execute(
+                "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY last_access DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+            self._bump("evicted_lru", cur.rowcount)
+
+    def get(self, session_id: str) -> list[dict] | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history, last_access FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl_s > 0 and now - row[1] > self.ttl_s:
+                return None  # expired; removed (and counted) by the next sweep
+            self._conn.execute("UPDATE sessions SET last_access = ? WHERE id = ?", (now, session_id))
+            return json.loads(row[0])
+
+    def append(self, session_id: str, messages: list[dict]) -> list[dict]:
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE: take the write lock up front so concurrent workers don't lose appends.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT history, last_access FROM sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                history = json.loads(row[0]) if row else []
+                if row and self.ttl_s > 0 and now - row[1] > self.ttl_s:
+                    history = []  # expired but not swept yet: start over
+                    self._bump("evicted_ttl", 1)
+                history, dropped = _trim(history + list(messages), self.max_bytes)
+                self._bump("trimmed_messages", dropped)
+                data = json.dumps(history)
+                self._conn.execute(
+                    "INSERT INTO sessions (id, history, bytes, last_access) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET history = excluded.history, bytes = excluded.bytes, "
+                    "last_access = excluded.last_access",
+                    (session_id, data, len(data.encode("utf-8")), now),
+                )
+                if now - self._last_sweep >= SWEEP_INTERVAL_S:
+                    self._last_sweep = now
+                    self._sweep(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return history
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions").fetchone()
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+        return {
+            "backend": self.backend,
+            "sessions": count,
+            "bytes": size,
+            "evicted_ttl": counters.get("evicted_ttl", 0),
+            "evicted_lru": counters.get("evicted_lru", 0),
+            "trimmed_messages": counters.get("trimmed_messages", 0),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def open_store(settings) -> SessionStore:
+    """Session store selected by SESSION_STORE (memory | sqlite)."""
+    if settings.session_store == "sqlite":
+        return SQLiteSessionStore(
+            settings.session_db_path, settings.session_max, settings.session_ttl_s, settings.session_max_bytes
+        )
+    return MemorySessionStore(settings.session_max, settings.session_ttl_s, settings.session_max_bytes)
@@ -0,0 +1,161 @@
+"""
+Local stand-in inference server for tests and load runs without a GPU: speaks Ollama
+/api/generate and OpenAI-compatible /v1/completions and /v1/chat/completions, streaming or not.
+
+Run: uv run python -m backend.stub_server [--port 11435] [--reply-tokens 32] [--token-ms 0]
+Then point the backend at it, e.g. INFERENCE_URL=http://127.0.0.1:11435 INFERENCE_API=openai_chat.
+
+Replies are a fixed word sequence; one word is one token and the prompt counts as
+len(prompt) / 4 tokens. The prompt prefix shared with the previous request is reported as
+cached (Ollama: excluded from prompt_eval_count; OpenAI: usage.prompt_tokens_details), like
+a server with prefix caching, so backend.bench_prefix gives meaningful numbers.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CHARS_PER_TOKEN = 4
+WORDS = ("The", "stub", "server", "streams", "one", "word", "per", "token", "for", "tests.")
+
+app = FastAPI(title="Inference stub")
+app.state.reply_tokens = 32
+app.state.token_ms = 0.0
+app.state.prefill_ms_per_k = 0.0  # simulated prefill time per 1000 uncached prompt tokens
+_last_prompt = ""
+
+
+def _prompt_counts(prompt: str) -> tuple[int, int]:
+    """(prompt tokens, tokens shared with the previous prompt's prefix)."""
+    global _last_prompt
+    shared = len(os.path.commonprefix([prompt, _last_prompt]))
+    _last_prompt = prompt
+    return len(prompt) // CHARS_PER_TOKEN + 1, shared // CHARS_PER_TOKEN
+
+
+def _words(n: int) -> list[str]:
+    return [WORDS[i % len(WORDS)] + " " for i in range(n)]
+
+
+async def _prefill(uncached: int) -> float:
+    ms = uncached / 1000.0 * app.state.prefill_ms_per_k
+    if ms:
+        await asyncio.sleep(ms / 1000.0)
+    return ms
+
+
+async def _decode(words: list[str]):
+    for w in words:
+        if app.state.token_ms:
+            await asyncio.sleep(app.state.token_ms / 1000.0)
+        yield w
+
+
+@app.post("/api/generate")
+async def ollama_generate(request: Request):
+    body = await request.json()
+    prompt_tokens, cached = _prompt_counts(body.get("prompt", ""))
+    n = min(app.state.reply_tokens, (body.get("options") or {}).get("num_predict") or app.state.reply_tokens)
+    words = _words(n)
+    prefill_ms = await _prefill(prompt_tokens - cached)
+
+    def final(decode_ms: float) -> dict:
+        return {
+            "model": body.get("model"),
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens - cached,
+            "prompt_eval_duration": int(prefill_ms * 1e6) or 1,
+            "eval_count": n,
+            "eval_duration": int(decode_ms * 1e6) or 1,
+        }
+
+    if not body.get("stream", True):  # Ollama streams by default
+        t0 = time.perf_counter()
+        text = "".join([w async for w in _decode(words)])
+        return JSONResponse({"response": text, **final((time.perf_counter() - t0) * 1000.0)})
+
+    async def lines():
+        t0 = time.perf_counter()
+        async for w in _decode(words):
+            yield json.dumps({"model": body.get("model"), "response": w, "done": False}) + "\n"
+        yield json.dumps({"response": "", **final((time.perf_counter() - t0) * 1000.0)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def _openai(request: Request, chat: bool):
+    body = await request.json()
+    if chat:
+        prompt = "".join(m.get("content") or "" for m in body.get("messages") or [])
+    else:
+        prompt = body.get("prompt") or ""
+    prompt_tokens, cached = _prompt_counts(prompt)
+    n = min(app.state.reply_tokens, body.get("max_tokens") or app.state.reply_tokens)
+    words = _words(n)
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": n,
+        "total_tokens": prompt_tokens + n,
+        "prompt_tokens_details": {"cached_tokens": cached},
+    }
+    kind = "chat.completion" if chat else "text_completion"
+    await _prefill(prompt_tokens - cached)
+
+    def choice(text: str, finish: str | None, stream: bool) -> dict:
+        if not chat:
+            return {"index": 0, "text": text, "finish_reason": finish}
+        key = "delta" if stream else "message"
+        return {"index": 0, key: {"role": "assistant", "content": text}, "finish_reason": finish}
+
+    if not body.get("stream"):
+        text = "".join([w async for w in _decode(words)])
+        return JSONResponse({
+            "object": kind, "model": body.get("model"), "choices": [choice(text, "stop", False)], "usage": usage,
+        })
+
+    async def events():
+        obj = kind + ".chunk" if chat else kind
+        async for w in _decode(words):
+            yield f"data: {json.dumps({'object': obj, 'choices': [choice(w, None, True)]})}\n\n"
+        yield f"data: {json.dumps({'object': obj, 'choices': [choice('', 'stop', True)]})}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({'object': obj, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/completions")
+async def openai_completions(request: Request):
+    return await _openai(request, chat=False)
+
+
+@app.post("/v1/chat/completions")
+async def openai_chat(request: Request):
+    return await _openai(request, chat=True)
+
+
+def main() -> None:
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--reply-tokens", type=int, default=32)
+    ap.add_argument("--token-ms", type=float, default=0.0, help="simulated decode time per token")
+    ap.add_argument("--prefill-ms-per-k", type=float, default=0.0, help="simulated prefill per 1k uncached tokens")
+    args = ap.parse_args()
+    app.state.reply_tokens = args.reply_tokens
+    app.state.token_ms = args.token_ms
+    app.state.prefill_ms_per_k = args.prefill_ms_per_k
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
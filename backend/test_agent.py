@@ -0,0 +1,111 @@
+"""
+Tests for budgeted prompt assembly (backend.agent): history trimming keeps the newest turns, and
+the assembled prompt fits CONTEXT_LENGTH - PROMPT_RESERVED_TOKENS in both layouts.
+Run: uv run pytest backend/test_agent.py
+"""
+import pytest
+
+from backend import agent, tokens
+
+CONTEXT_LENGTH = 2048
+RESERVED = 512
+
+
+class _WordTokenizer:
+    """One token per whitespace-separated word: exact counts without a model download."""
+
+    is_fast = False
+
+    def encode(self, text: str, add_special_tokens: bool = False) -> list[int]:
+        return list(range(len(text.split())))
+
+
+@pytest.fixture(params=["estimate", "tokenizer"])
+def counter(request, monkeypatch):
+    monkeypatch.setattr(agent.settings, "context_length", CONTEXT_LENGTH)
+    monkeypatch.setattr(agent.settings, "prompt_reserved_tokens", RESERVED)
+    monkeypatch.setattr(agent.settings, "prompt_context_share", 0.6)
+    monkeypatch.setattr(tokens, "_chars_per_token", tokens.DEFAULT_CHARS_PER_TOKEN)
+    monkeypatch.setattr(tokens, "_tokenizer", _WordTokenizer() if request.param == "tokenizer" else None)
+    monkeypatch.setattr(tokens, "_tokenizer_failed", request.param == "estimate")
+    if request.param == "tokenizer":
+        # Word counts: truncate to the first max_tokens words of the source text.
+        monkeypatch.setattr(tokens, "truncate", lambda text, n: " ".join(text.split(" ")[:max(n, 0)]))
+    return request.param
+
+
+def _history(turns: int) -> list[dict]:
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "about the tokenizer code " * 8})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "the function returns ids " * 12})
+    return messages
+
+
+def _chunks(n: int) -> list[dict]:
+    body = "def function_{0}(x):\n    return x + {0}\n" * 30
+    return [{"path": f"src/file_{i}.py", "text": body.format(i)} for i in range(n)]
+
+
+def test_history_within_budget_is_kept_whole(counter):
+    history = _history(2)
+    conv, used, kept, summarized = agent._fit_history(history, 10_000)
+    assert (kept, summarized) == (4, False)
+    assert conv == agent._format_messages(history)
+    assert used >= tokens.count(conv)
+
+
+def test_history_over_budget_keeps_newest_turns(counter):
+    history = _history(20)
+    budget = 300
+    conv, used, kept, summarized = agent._fit_history(history, budget)
+    assert summarized and 0 < kept < len(history)
+    assert used <= budget
+    assert tokens.count(conv) <= budget
+    newest = [agent._format_message(m) for m in history[-kept:]]
+    assert conv.endswith("\n".join(newest))
+    assert history[-kept]["role"] == "user"  # never opens on an orphaned reply
+    assert f"({len(history) - kept} earlier messages omitted" in conv
+    assert "question 0" in conv  # summarized, not lost
+    assert agent._format_message(history[0]) not in conv
+
+
+def test_history_cut_is_rounded_to_step(counter):
+    history = _history(20)
+    _, _, kept, _ = agent._fit_history(history, 1500, step=agent.HISTORY_TRIM_STEP)
+    assert kept and (len(history) - kept) % agent.HISTORY_TRIM_STEP == 0
+    _, _, kept_unstepped, _ = agent._fit_history(history, 1500)
+    assert kept <= kept_unstepped
+
+
+def test_history_step_keeps_newest_turn_when_few_fit(counter):
+    history = _history(20)
+    conv, used, kept, _ = agent._fit_history(history, 300, step=agent.HISTORY_TRIM_STEP)
+    assert 0 < kept < agent.HISTORY_TRIM_STEP
+    assert used <= 300
+    assert conv.endswith(agent._format_message(history[-1]))
+
+
+@pytest.mark.parametrize("layout", ["context_first", "history_first"])
+@pytest.mark.parametrize(("n_chunks", "turns"), [(0, 0), (20, 1), (2, 40), (20, 40)])
+def test_prompt_fits_context(counter, monkeypatch, layout, n_chunks, turns):
+    monkeypatch.setattr(agent.settings, "prompt_layout", layout)
+    history = _history(turns)
+    prompt, context, report = agent._assemble_prompt("How are ids padded?", _chunks(n_chunks), history)
+    limit = CONTEXT_LENGTH - RESERVED
+    assert tokens.count(prompt) <= limit
+    assert report["prompt"] <= report["budget"] < limit
+    assert report["chunks_used"] <= n_chunks
+    assert report["history_kept"] + report["history_dropped"] == len(history)
+    assert "User: How are ids padded?" in prompt
+    if history:
+        assert agent._format_message(history[-1]) in prompt  # the newest turn always survives
+    if n_chunks:
+        assert report["chunks_used"] > 0 and "[1] src/file_0.py" in context
+
+
+def test_oversized_message_is_truncated(counter):
+    message = "why " * 5000
+    prompt, _, report = agent._assemble_prompt(message, _chunks(5), _history(5))
+    assert tokens.count(prompt) <= CONTEXT_LENGTH - RESERVED
+    assert report["chunks_used"] > 0
@@ -0,0 +1,57 @@
+"""
+Tests for backend.cache.TTLCache: LRU eviction, TTL expiry, counters.
+Run: uv run pytest backend/test_cache.py
+"""
+from backend import cache
+
+
+def test_get_put_and_counters():
+    c = cache.TTLCache(max_size=4, ttl_s=0)
+    assert c.get("a") is None
+    c.put("a", 1)
+    assert c.get("a") == 1
+    assert c.stats() == {"size": 1, "max_size": 4, "hits": 1, "misses": 1, "hit_rate": 0.5, "evictions": 0}
+
+
+def test_evicts_least_recently_used():
+    c = cache.TTLCache(max_size=2, ttl_s=0)
+    c.put("a", 1)
+    c.put("b", 2)
+    assert c.get("a") == 1  # refreshes a; b is now the oldest
+    c.put("c", 3)
+    assert c.get("b") is None
+    assert (c.get("a"), c.get("c")) == (1, 3)
+    assert c.evictions == 1
+    assert len(c) == 2
+
+
+def test_put_existing_key_refreshes_it():
+    c = cache.TTLCache(max_size=2, ttl_s=0)
+    c.put("a", 1)
+    c.put("b", 2)
+    c.put("a", 10)
+    c.put("c", 3)
+    assert c.get("a") == 10
+    assert c.get("b") is None
+
+
+def test_ttl_expiry(monkeypatch):
+    now = {"t": 100.0}
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now["t"])
+    c = cache.TTLCache(max_size=4, ttl_s=10)
+    c.put("a", 1)
+    now["t"] += 10
+    assert c.get("a") == 1
+    now["t"] += 0.5
+    assert c.get("a") is None
+    assert len(c) == 0  # expired entry dropped on read
+
+
+def test_disabled_and_clear():
+    off = cache.TTLCache(max_size=0, ttl_s=60)
+    off.put("a", 1)
+    assert off.get("a") is None and len(off) == 0
+    c = cache.TTLCache(max_size=4, ttl_s=60)
+    c.put("a", 1)
+    c.clear()
+    assert c.get("a") is None
@@ -0,0 +1,158 @@
+"""
+Tests for the inference client (backend.inference) against the stub server (backend.stub_server),
+in process through httpx.ASGITransport, plus a scripted stream for the prefill/decode split.
+Run: uv run pytest backend/test_inference.py
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from backend import inference, stub_server
+
+APIS = ("ollama", "openai_completions", "openai_chat")
+REPLY_TOKENS = 5
+PROMPT = "You are a helpful assistant. " * 20
+
+
+@pytest.fixture
+def use_transport(monkeypatch):
+    def use(transport: httpx.AsyncBaseTransport, api: str) -> None:
+        monkeypatch.setattr(inference.settings, "inference_api", api)
+        monkeypatch.setattr(inference.settings, "inference_url", "http://inference")
+        monkeypatch.setattr(inference, "_new_client", lambda: httpx.AsyncClient(transport=transport))
+        monkeypatch.setattr(inference, "_client", None)
+        monkeypatch.setattr(inference, "_semaphore", None)
+
+    return use
+
+
+@pytest.fixture
+def stub(use_transport, monkeypatch):
+    monkeypatch.setattr(stub_server.app.state, "reply_tokens", REPLY_TOKENS)
+    monkeypatch.setattr(stub_server, "_last_prompt", "")
+    return lambda api: use_transport(httpx.ASGITransport(app=stub_server.app), api)
+
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await inference.stop()
+
+    return asyncio.run(main())
+
+
+async def _stream(prompt: str) -> tuple[list[str], dict]:
+    telemetry: dict = {}
+    pieces = [p async for p in inference.generate_stream(prompt, telemetry)]
+    return pieces, telemetry
+
+
+EXPECTED_REPLY = "".join(stub_server._words(REPLY_TOKENS)).strip()
+
+
+def test_apis_are_abstract():
+    with pytest.raises(TypeError):
+        inference.InferenceAPI()
+
+
+@pytest.mark.parametrize("api", APIS)
+def test_generate(stub, api):
+    stub(api)
+    reply, telemetry = _run(inference.generate(PROMPT))
+    assert reply == EXPECTED_REPLY
+    assert telemetry["api"] == api
+    assert telemetry["prompt_tokens"] == len(PROMPT) // stub_server.CHARS_PER_TOKEN + 1
+    assert telemetry["completion_tokens"] == REPLY_TOKENS
+    assert telemetry["prefill_ms"] is not None and telemetry["decode_ms"] is not None
+    assert "queue_wait_ms" in telemetry
+
+
+@pytest.mark.parametrize("api", APIS)
+def test_generate_stream(stub, api):
+    stub(api)
+    pieces, telemetry = _run(_stream(PROMPT))
+    assert len(pieces) == REPLY_TOKENS
+    assert "".join(pieces).strip() == EXPECTED_REPLY
+    assert telemetry["stream"] is True
+    assert telemetry["stream_chunks"] == REPLY_TOKENS
+    assert telemetry["completion_tokens"] == REPLY_TOKENS
+    assert telemetry["prompt_tokens"] == len(PROMPT) // stub_server.CHARS_PER_TOKEN + 1
+    assert "ttft_ms" in telemetry
+
+
+@pytest.mark.parametrize("api", APIS)
+def test_prefix_cache_counts(stub, api):
+    stub(api)
+
+    async def twice():
+        await inference.generate(PROMPT)
+        return await inference.generate(PROMPT + "Another question?")
+
+    _, telemetry = _run(twice())
+    full = len(PROMPT + "Another question?") // stub_server.CHARS_PER_TOKEN + 1
+    cached = len(PROMPT) // stub_server.CHARS_PER_TOKEN
+    if inference.prompt_tokens_include_cached():
+        assert telemetry["prompt_tokens"] == full
+        assert telemetry["cached_prompt_tokens"] == cached
+    else:  # Ollama: only the evaluated tokens, no cached count
+        assert telemetry["prompt_tokens"] == full - cached
+        assert "cached_prompt_tokens" not in telemetry
+
+
+def test_ttft_splits_prefill_and_decode(use_transport):
+    async def body():
+        yield b'data: {"choices": [{"text": "first "}]}\n\n'
+        await asyncio.sleep(0.05)
+        yield b'data: {"choices": [{"text": "second"}]}\n\n'
+        usage = {"prompt_tokens": 7, "completion_tokens": 2}
+        yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+        yield b'data: {"choices": [{"text": "after done"}]}\n\n'
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+    use_transport(transport, "openai_completions")
+    pieces, telemetry = _run(_stream("prompt"))
+    assert pieces == ["first ", "second"]
+    assert telemetry["prefill_ms"] == telemetry["ttft_ms"]
+    assert telemetry["decode_ms"] >= 40
+    assert telemetry["prefill_ms"] + telemetry["decode_ms"] == pytest.approx(telemetry["http_ms"], abs=0.1)
+    assert telemetry["prompt_tokens"] == 7 and telemetry["completion_tokens"] == 2
+    assert telemetry["tokens_per_sec"] > 0
+
+
+def test_http_error_raises(use_transport):
+    use_transport(httpx.MockTransport(lambda request: httpx.Response(503, text="overloaded")), "openai_chat")
+    with pytest.raises(httpx.HTTPStatusError):
+        _run(_stream("prompt"))
+
+
+def test_event_parsing():
+    ollama, completions = inference.APIS["ollama"], inference.APIS["openai_completions"]
+    assert ollama.event("") is None
+    assert ollama.event('{"response": "hi", "done": false}') == {"response": "hi", "done": False}
+    assert completions.event(": keep-alive") is None
+    assert completions.event("data: [DONE]") == {"done": True}
+    assert completions.text(completions.event('data: {"choices": [{"text": "x"}]}')) == "x"
+    chat = inference.APIS["openai_chat"]
+    assert chat.text({"choices": [{"delta": {"content": "y"}}]}) == "y"
+    assert chat.text({"choices": []}) == ""
+
+
+def test_usage_normalization():
+    usage = inference.APIS["openai_chat"].usage({
+        "usage": {"prompt_tokens": 10, "completion_tokens": 3, "prompt_tokens_details": {"cached_tokens": 6}},
+    })
+    assert usage == {"prompt_tokens": 10, "completion_tokens": 3, "cached_prompt_tokens": 6}
+    assert "cached_prompt_tokens" not in inference.APIS["openai_chat"].usage({"usage": {"prompt_tokens": 1}})
+    ollama = inference.APIS["ollama"].usage({
+        "prompt_eval_count": 4,
+        "eval_count": 2,
+        "prompt_eval_duration": 3_000_000,
+        "eval_duration": 5_000_000,
+    })
+    assert (ollama["prompt_tokens"], ollama["completion_tokens"]) == (4, 2)
+    assert (ollama["prefill_ms"], ollama["decode_ms"]) == (3.0, 5.0)
@@ -0,0 +1,229 @@
+"""
+Tests for backend.retrieval and /api/retrieve/batch on small flat indexes with stand-in query
+encoders (no model download).
+Run: uv run pytest backend/test_retrieval.py
+"""
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from backend import retrieval
+from ingest.index import write_index
+from ingest.store import ChunkStoreWriter
+
+DOCS = {"alpha": "def alpha(): pass", "beta": "def beta(): pass", "gamma": "def gamma(): pass"}
+
+
+class _Encoder:
+    """Query word -> one-hot vector of the matching chunk (unknown words: the last chunk)."""
+
+    def encode(self, texts, normalize_embeddings=True):
+        names = list(DOCS)
+        out = np.zeros((len(texts), len(names)), dtype=np.float32)
+        for i, text in enumerate(texts):
+            word = text.split()[0]
+            out[i, names.index(word) if word in names else len(names) - 1] = 1.0
+        return out
+
+
+def _install(index_dir, monkeypatch, chunks: list[tuple[str, str]], vectors: np.ndarray, encoder) -> None:
+    """Write a flat index + chunk store to index_dir and make it retrieval's active version."""
+    import faiss
+
+    flat = faiss.IndexFlatIP(vectors.shape[1])
+    flat.add(vectors)
+    write_index(flat, index_dir / "index.faiss")
+    with ChunkStoreWriter(index_dir) as store:
+        for i, (path, text) in enumerate(chunks):
+            store.add(path, text, i)
+
+    for name, value in (
+        ("index_path", index_dir),
+        ("index_hot_reload", False),
+        ("retrieval_mode", "dense"),
+        ("retrieval_warmup", False),
+    ):
+        monkeypatch.setattr(retrieval.settings, name, value)
+    monkeypatch.setattr(retrieval, "_active", retrieval._open_snapshot(index_dir))
+    monkeypatch.setattr(retrieval, "_model", encoder)
+    monkeypatch.setattr(retrieval, "_batcher", None)
+    retrieval._embedding_cache.clear()
+    retrieval._result_cache.clear()
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    chunks = [(f"src/{name}.py", text) for name, text in DOCS.items()]
+    _install(tmp_path, monkeypatch, chunks, np.eye(len(DOCS), dtype=np.float32), _Encoder())
+    yield tmp_path
+    retrieval.shutdown_executor()
+
+
+def _gather(queries: list[str], top_k: int) -> list:
+    async def run():
+        return await asyncio.gather(*(retrieval.retrieve_async(q, top_k) for q in queries))
+
+    return asyncio.run(run())
+
+
+def test_retrieve_returns_hits_best_first(index):
+    hits = retrieval.retrieve("beta", top_k=2)
+    assert [h["path"] for h in hits] == ["src/beta.py", "src/alpha.py"]
+    assert hits[0]["text"] == DOCS["beta"]
+    assert hits[0]["score"] == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("wait_ms", [0.0, 2.0])
+def test_retrieve_async_matches_retrieve(index, monkeypatch, wait_ms):
+    # wait_ms=0 disables micro-batching: one executor call per query.
+    monkeypatch.setattr(retrieval.settings, "retrieval_batch_wait_ms", wait_ms)
+    queries = ["alpha", "gamma", "beta"]
+    results = _gather(queries, 1)
+    for query, hits in zip(queries, results):
+        assert isinstance(hits, list) and all(isinstance(h, dict) for h in hits)
+        assert [h["path"] for h in hits] == [f"src/{query}.py"]
+    assert results == [retrieval.retrieve(q, top_k=1) for q in queries]
+
+
+def test_repeated_query_served_from_cache(index, monkeypatch):
+    monkeypatch.setattr(retrieval.settings, "retrieval_batch_wait_ms", 0.0)
+    first = _gather(["alpha"], 2)[0]
+    hits = retrieval._result_cache.hits
+    assert _gather(["alpha"], 2)[0] == first
+    assert retrieval._result_cache.hits == hits + 1
+
+
+def test_rrf_fuses_ranks(monkeypatch):
+    monkeypatch.setattr(retrieval.settings, "rrf_k", 60)
+    fused = retrieval._rrf(np.array([1, 2, 3]), np.array([3, 4, -1]), top_k=3)
+    ids = [idx for idx, _, _ in fused]
+    assert ids[0] == 3  # in both lists
+    assert fused[0][1] == pytest.approx(1 / 63 + 1 / 61)
+    assert fused[0][2] == {"dense": 3, "lexical": 1}
+    assert ids[1:] == [1, 2]  # 2 and 4 tie at rank 2; dense is fused first
+    assert -1 not in ids
+
+
+def test_hybrid_finds_exact_identifier(index, monkeypatch):
+    from ingest import lexical
+
+    lexical.build(index, retrieval._active.metadata)
+    monkeypatch.setattr(retrieval, "_active", retrieval._open_snapshot(index))
+    monkeypatch.setattr(retrieval.settings, "retrieval_mode", "hybrid")
+    # The encoder maps "gamma" to the gamma chunk; BM25 matches "beta" in the query too.
+    hits = retrieval.retrieve("gamma beta", top_k=2)
+    assert {h["path"] for h in hits} == {"src/gamma.py", "src/beta.py"}
+
+
+class _FixedEncoder:
+    """Every query -> the same vector."""
+
+    def __init__(self, vector: np.ndarray) -> None:
+        self.vector = vector
+
+    def encode(self, texts, normalize_embeddings=True):
+        return np.tile(self.vector, (len(texts), 1))
+
+
+N_COMMON, N_RARE = 396, 4
+
+
+@pytest.fixture
+def prefix_index(tmp_path, monkeypatch):
+    # The query is nearest to every src/common/ chunk; the few src/rare/ chunks point away from it.
+    rng = np.random.default_rng(0)
+    query = np.zeros(8, dtype=np.float32)
+    query[0] = 1.0
+    common = rng.standard_normal((N_COMMON, 8)).astype(np.float32)
+    common[:, 0] = np.abs(common[:, 0]) + 2.0
+    rare = rng.standard_normal((N_RARE, 8)).astype(np.float32)
+    rare[:, 0] = -np.abs(rare[:, 0]) - 2.0
+    vectors = np.vstack([common, rare])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    chunks = [(f"src/common/c{i}.py", f"common {i}") for i in range(N_COMMON)]
+    chunks += [(f"src/rare/r{i}.py", f"rare {i}") for i in range(N_RARE)]
+    _install(tmp_path, monkeypatch, chunks, vectors, _FixedEncoder(query))
+    yield tmp_path
+    retrieval.shutdown_executor()
+
+
+def test_fetch_k_grows_for_rare_prefix(prefix_index):
+    snap = retrieval._active
+    assert retrieval._fetch_k(snap, 5, "", False) == (5, None)
+    k, match = retrieval._fetch_k(snap, 5, "src/rare/", False)
+    assert k >= 2 * 5 * (N_COMMON + N_RARE) / N_RARE  # 1% of chunks match: fetch ~200x top_k
+    assert match(np.array([0, N_COMMON, -1, 10**6])).tolist() == [False, True, False, False]
+    common_k, _ = retrieval._fetch_k(snap, 5, "src/common/", False)
+    assert 5 <= common_k < k
+    assert retrieval._fetch_k(snap, 5, "nowhere/", False)[0] == 0
+
+
+def test_retrieve_many_filters_by_prefix(prefix_index):
+    unfiltered, rare, none = retrieval.retrieve_many(["q", "q", "q"], 3, [None, "src/rare/", "nowhere/"])
+    assert len(unfiltered) == 3 and all(h["path"].startswith("src/common/") for h in unfiltered)
+    assert len(rare) == 3 and all(h["path"].startswith("src/rare/") for h in rare)
+    assert none == []
+
+
+def test_retrieve_many_keeps_order(index):
+    results = retrieval.retrieve_many(["gamma", "alpha", "beta", "alpha"], [1, 2, 1, 1])
+    assert [len(hits) for hits in results] == [1, 2, 1, 1]
+    assert [hits[0]["path"] for hits in results] == [f"src/{q}.py" for q in ("gamma", "alpha", "beta", "alpha")]
+    with pytest.raises(ValueError):
+        retrieval.retrieve_many(["a", "b"], [1])
+
+
+@pytest.fixture
+def client(index):
+    from fastapi.testclient import TestClient
+
+    from backend import main
+
+    with TestClient(main.app) as c:
+        yield c
+
+
+def test_batch_endpoint(client):
+    queries = ["beta", {"query": "alpha", "top_k": 2}, {"query": "gamma", "path_prefix": "src/a"}]
+    results = client.post("/api/retrieve/batch", json={"queries": queries, "top_k": 1}).json()["results"]
+    assert [r["query"] for r in results] == ["beta", "alpha", "gamma"]
+    assert [len(r["chunks"]) for r in results] == [1, 2, 1]
+    assert [r["chunks"][0]["path"] for r in results] == ["src/beta.py", "src/alpha.py", "src/alpha.py"]
+    assert client.post("/api/retrieve/batch", json={"queries": ["ok", " "]}).status_code == 400
+
+
+def test_batch_endpoint_streams_ndjson(client, monkeypatch):
+    from backend import main
+
+    monkeypatch.setattr(main, "STREAM_GROUP", 2)
+    queries = ["alpha", "beta", "gamma", "alpha", "beta"]
+    r = client.post("/api/retrieve/batch", json={"queries": queries, "top_k": 1, "stream": True})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [line["index"] for line in lines] == list(range(len(queries)))
+    assert [line["query"] for line in lines] == queries
+    assert [line["chunks"][0]["path"] for line in lines] == [f"src/{q}.py" for q in queries]
+
+
+def test_batch_stream_reports_failure(client, monkeypatch):
+    from backend import main
+
+    calls = []
+    search = retrieval.retrieve_many_async
+
+    async def flaky(*args):
+        calls.append(args)
+        if len(calls) > 1:
+            raise RuntimeError("search failed")
+        return await search(*args)
+
+    monkeypatch.setattr(main, "STREAM_GROUP", 2)
+    monkeypatch.setattr(main.retrieval, "retrieve_many_async", flaky)
+    r = client.post("/api/retrieve/batch", json={"queries": ["alpha", "beta", "gamma"], "stream": True})
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [line.get("query") for line in lines[:2]] == ["alpha", "beta"]
+    assert lines[2]["index"] == 2
+    assert lines[2]["error"]["status"] == 500
+    assert "search failed" in lines[2]["error"]["detail"]
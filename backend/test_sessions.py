@@ -0,0 +1,123 @@
+"""
+Tests for the session stores (backend.sessions): TTL and LRU eviction, per-session byte cap.
+Run: uv run pytest backend/test_sessions.py
+"""
+import pytest
+
+from backend import sessions
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path, monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: clock["now"])
+    monkeypatch.setattr(sessions.time, "time", lambda: clock["now"])
+    monkeypatch.setattr(sessions, "SWEEP_INTERVAL_S", 0.0)
+    stores = []
+
+    def make(max_sessions: int = 0, ttl_s: float = 0, max_bytes: int = 0) -> sessions.SessionStore:
+        if request.param == "sqlite":
+            store = sessions.SQLiteSessionStore(
+                tmp_path / f"sessions{len(stores)}.sqlite", max_sessions, ttl_s, max_bytes
+            )
+        else:
+            store = sessions.MemorySessionStore(max_sessions, ttl_s, max_bytes)
+        stores.append(store)
+        return store
+
+    make.clock = clock
+    yield make
+    for store in stores:
+        store.close()
+
+
+def _msg(text: str) -> dict:
+    return {"role": "user", "content": text}
+
+
+def test_append_and_get(make_store):
+    store = make_store()
+    assert store.get("a") is None
+    assert store.get_or_create("a") == []
+    store.append("a", [_msg("hi")])
+    assert store.append("a", [_msg("again")]) == [_msg("hi"), _msg("again")]
+    assert store.get("a") == [_msg("hi"), _msg("again")]
+    assert store.stats()["sessions"] == 1
+
+
+def test_lru_evicts_least_recently_used(make_store):
+    store = make_store(max_sessions=2)
+    store.append("a", [_msg("a")])
+    make_store.clock["now"] += 1
+    store.append("b", [_msg("b")])
+    make_store.clock["now"] += 1
+    assert store.get("a") is not None  # refreshes a; b is now the oldest
+    make_store.clock["now"] += 1
+    store.append("c", [_msg("c")])
+    assert store.get("b") is None
+    assert store.get("a") is not None
+    assert store.get("c") is not None
+    assert store.stats()["evicted_lru"] == 1
+
+
+def test_ttl_evicts_idle_sessions(make_store):
+    store = make_store(ttl_s=60)
+    store.append("old", [_msg("x")])
+    make_store.clock["now"] += 30
+    store.append("new", [_msg("y")])
+    make_store.clock["now"] += 31
+    assert store.get("old") is None
+    assert store.get("new") == [_msg("y")]
+    store.append("new", [_msg("z")])  # SQLite sweeps on write
+    stats = store.stats()
+    assert stats["sessions"] == 1
+    assert stats["evicted_ttl"] == 1
+
+
+def test_expired_session_starts_over(make_store):
+    store = make_store(ttl_s=60)
+    store.append("a", [_msg("x")])
+    make_store.clock["now"] += 61
+    assert store.append("a", [_msg("y")]) == [_msg("y")]
+
+
+def test_byte_cap_drops_oldest_messages(make_store):
+    store = make_store(max_bytes=120)
+    for i in range(5):
+        history = store.append("a", [_msg(f"message {i}")])
+    assert history[-1] == _msg("message 4")
+    assert len(history) < 5
+    assert sessions._nbytes(history) <= 120
+    assert store.stats()["trimmed_messages"] == 5 - len(history)
+
+
+def test_byte_cap_keeps_last_message(make_store):
+    store = make_store(max_bytes=10)
+    assert store.append("a", [_msg("far too long for the cap")]) == [_msg("far too long for the cap")]
+
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        sessions.SessionStore(0, 0, 0)
+
+
+def test_close_then_reuse(make_store):
+    # The FastAPI lifespan closes the store on shutdown; a restarted app keeps using it.
+    store = make_store()
+    store.append("a", [_msg("hi")])
+    store.close()
+    store.close()
+    assert store.get("a") == [_msg("hi")]
+
+
+def test_app_shutdown_closes_store(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from backend import main
+
+    store = sessions.SQLiteSessionStore(tmp_path / "s.sqlite", 0, 0, 0)
+    monkeypatch.setattr(main, "_sessions", store)
+    monkeypatch.setattr(main.settings, "retrieval_warmup", False)
+    with TestClient(main.app):
+        assert store._connection is not None
+    assert store._connection is None
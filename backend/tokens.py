@@ -0,0 +1,82 @@
+"""
+Prompt token counting for budgeted prompt assembly (see backend.agent).
+
+With PROMPT_TOKENIZER set (a Hugging Face tokenizer matching MODEL_NAME, e.g.
+meta-llama/Llama-3.1-8B-Instruct) counts are exact. Otherwise counts are estimated from a
+chars-per-token ratio that is calibrated from the server's prompt token count after each turn
+(OpenAI-compatible servers only: Ollama's count leaves out prefix-cache hits; set PROMPT_TOKENIZER
+for exact budgets there).
+"""
+
+import math
+import threading
+
+from config import settings
+
+DEFAULT_CHARS_PER_TOKEN = 3.5  # conservative for code; overestimating tokens is the safe side
+# Calibration: ratios outside this range are prompt-cache hits or bad counters, not tokenization.
+MIN_CHARS_PER_TOKEN = 2.0
+MAX_CHARS_PER_TOKEN = 6.0
+CALIBRATION_WEIGHT = 0.2  # EMA weight of each new observation
+
+_tokenizer = None
+_tokenizer_failed = False
+_lock = threading.Lock()
+_chars_per_token = DEFAULT_CHARS_PER_TOKEN
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_failed
+    if _tokenizer is not None or _tokenizer_failed or not settings.prompt_tokenizer:
+        return _tokenizer
+    with _lock:
+        if _tokenizer is None and not _tokenizer_failed:
+            try:
+                from transformers import AutoTokenizer
+
+                _tokenizer = AutoTokenizer.from_pretrained(settings.prompt_tokenizer)
+            except Exception:
+                _tokenizer_failed = True  # gated/offline: fall back to the calibrated estimate
+    return _tokenizer
+
+
+def counter_name() -> str:
+    """Which counter is in use, for turn telemetry."""
+    if _get_tokenizer() is not None:
+        return f"tokenizer:{settings.prompt_tokenizer}"
+    return f"estimate:{_chars_per_token:.2f}cpt"
+
+
+def count(text: str) -> int:
+    if not text:
+        return 0
+    tok = _get_tokenizer()
+    if tok is not None:
+        return len(tok.encode(text, add_special_tokens=False))
+    return math.ceil(len(text) / _chars_per_token)
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Longest prefix of text within max_tokens."""
+    if max_tokens <= 0:
+        return ""
+    tok = _get_tokenizer()
+    if tok is not None:
+        if not getattr(tok, "is_fast", False):
+            ids = tok.encode(text, add_special_tokens=False)
+            return text if len(ids) <= max_tokens else tok.decode(ids[:max_tokens])
+        offsets = tok(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        if len(offsets) <= max_tokens:
+            return text
+        return text[:offsets[max_tokens - 1][1]]
+    return text[:int(max_tokens * _chars_per_token)]
+
+
+def observe(prompt: str, prompt_tokens: int | None) -> None:
+    """Calibrate the estimate from the server's token count for a prompt we sent."""
+    global _chars_per_token
+    if _get_tokenizer() is not None or not prompt_tokens or not prompt:
+        return
+    ratio = len(prompt) / prompt_tokens
+    if MIN_CHARS_PER_TOKEN <= ratio <= MAX_CHARS_PER_TOKEN:
+        _chars_per_token += CALIBRATION_WEIGHT * (ratio - _chars_per_token)
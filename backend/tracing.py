@@ -0,0 +1,184 @@
+"""
+Per-request span tracing and an opt-in profiler hook.
+
+TraceMiddleware gives every /api/* request a request id (X-Request-ID in, or generated; echoed
+in the response) and a trace held in a contextvar. Code on the request's path opens spans with
+`with span("retrieve"):` and adds attributes with annotate(); backend.agent reports the request id
+and per-span durations in turn telemetry. The root span also records event-loop lag at arrival
+(how late a call_soon callback ran), which separates a busy loop from slow stages.
+
+TRACE_PATH: append finished traces there in the Chrome trace-event format (a JSON array; the
+closing bracket is optional in that format, so the file can grow), for chrome://tracing or
+https://ui.perfetto.dev. Each request is its own row (tid).
+
+PROFILE_SAMPLE_RATE > 0: run cProfile over that fraction of /api/* requests (one at a time; the
+profile covers everything the event-loop thread ran meanwhile) and keep the .prof in PROFILE_DIR
+when the request took at least PROFILE_SLOW_MS. Inspect with: python -m pstats <file>
+"""
+
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import settings
+
+_current: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("trace", default=None)
+_tids = itertools.count(1)
+_export_lock = threading.Lock()
+_profiling = False  # cProfile is per-thread and global to it: one profiled request at a time
+
+
+class Trace:
+    def __init__(self, request_id: str) -> None:
+        self.request_id = request_id
+        self.tid = next(_tids)
+        self.spans: list[dict] = []  # finished spans
+        self._stack: list[dict] = []  # open spans, innermost last
+
+    def durations_ms(self) -> dict[str, float]:
+        """Finished span durations by name (summed if a name repeats)."""
+        out: dict[str, float] = {}
+        for s in self.spans:
+            out[s["name"]] = round(out.get(s["name"], 0.0) + s["dur_ms"], 2)
+        return out
+
+
+def current() -> Trace | None:
+    return _current.get()
+
+
+def request_id() -> str | None:
+    trace = _current.get()
+    return trace.request_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a stage of the current request; a no-op outside a traced request."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    s = {"name": name, "start": time.time(), "t0": time.perf_counter(), "attrs": attrs}
+    trace._stack.append(s)
+    try:
+        yield
+    finally:
+        s["dur_ms"] = (time.perf_counter() - s.pop("t0")) * 1000.0
+        trace._stack.remove(s)
+        trace.spans.append(s)
+
+
+def annotate(**attrs) -> None:
+    """Add attributes to the innermost open span of the current request."""
+    trace = _current.get()
+    if trace is not None and trace._stack:
+        trace._stack[-1]["attrs"].update(attrs)
+
+
+def _export(trace: Trace) -> None:
+    path = settings.trace_path
+    pid = os.getpid()
+    events = [
+        {
+            "name": s["name"],
+            "cat": "rag",
+            "ph": "X",
+            "ts": round(s["start"] * 1e6),
+            "dur": round(s["dur_ms"] * 1000),
+            "pid": pid,
+            "tid": trace.tid,
+            "args": {"request_id": trace.request_id, **s["attrs"]},
+        }
+        for s in trace.spans
+    ]
+    with _export_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        new = not path.exists() or path.stat().st_size == 0
+        with open(path, "a", encoding="utf-8") as f:
+            if new:
+                f.write("[\n")
+            for e in events:
+                f.write(json.dumps(e, default=str) + ",\n")
+
+
+def _start_profile():
+    global _profiling
+    if settings.profile_sample_rate <= 0 or _profiling or random.random() >= settings.profile_sample_rate:
+        return None
+    import cProfile
+
+    _profiling = True
+    prof = cProfile.Profile()
+    prof.enable()
+    return prof
+
+
+def _stop_profile(prof, trace: Trace, dur_ms: float) -> None:
+    global _profiling
+    prof.disable()
+    _profiling = False
+    if dur_ms >= settings.profile_slow_ms:
+        settings.profile_dir.mkdir(parents=True, exist_ok=True)
+        prof.dump_stats(str(settings.profile_dir / f"{trace.request_id}.prof"))
+
+
+class TraceMiddleware:
+    """
+    Pure ASGI middleware (not BaseHTTPMiddleware) so the trace contextvar is visible to the
+    handler and stays open until the last body chunk: streamed responses are traced in full.
+    """
+
+    def __init__(self, app, prefix: str = "/api/") -> None:
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        rid = headers.get(b"x-request-id", b"").decode("latin-1").strip()[:64] or uuid.uuid4().hex[:16]
+        trace = Trace(rid)
+        token = _current.set(trace)
+
+        loop = asyncio.get_running_loop()
+        lag = loop.create_future()
+        t_sched = time.perf_counter()
+        loop.call_soon(lambda: lag.done() or lag.set_result((time.perf_counter() - t_sched) * 1000.0))
+
+        status = {"code": 0}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        prof = _start_profile()
+        t0 = time.perf_counter()
+        try:
+            with span(f"{scope['method']} {scope['path']}"):
+                await self.app(scope, receive, send_with_id)
+                annotate(
+                    status=status["code"],
+                    loop_lag_ms=round(lag.result(), 3) if lag.done() else None,
+                )
+        finally:
+            dur_ms = (time.perf_counter() - t0) * 1000.0
+            _current.reset(token)
+            if prof is not None:
+                _stop_profile(prof, trace, dur_ms)
+            if settings.trace_path.name:
+                try:
+                    _export(trace)
+                except OSError:
+                    pass  # tracing must never fail a request
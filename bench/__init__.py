@@ -0,0 +1 @@
+"""Load generator and latency benchmark for the backend API (python -m bench)."""
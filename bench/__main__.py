@@ -0,0 +1,6 @@
+"""Run the load benchmark: uv run python -m bench --help"""
+
+from bench.load import main
+
+if __name__ == "__main__":
+    main()
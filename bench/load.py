@@ -0,0 +1,266 @@
+"""
+Drive concurrent multi-turn sessions against /api/chat (or queries against /api/retrieve) and
+report latency percentiles, throughput, error rates and backend RSS over time.
+
+Run: uv run python -m bench [--sessions 8] [--turns 5] [--ramp-up 10] [--endpoint chat]
+     [--corpus prompts.txt] [--mock] [--json results.json]
+
+--mock starts backend.stub_server and a backend wired to it (INFERENCE_API=ollama) on free
+local ports, so the run works offline; without it the backend at --url is used as-is.
+Chat latency is split into retrieve/inference from each turn's timing_ms; RSS comes from
+the session metrics (needs psutil in the backend). The JSON output holds the run config
+and rounded summary numbers (sorted keys) so two runs can be diffed directly.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+from config.settings import PROJECT_ROOT
+
+DEFAULT_PROMPTS = (
+    "How does the Trainer class decide which device to use?",
+    "Where is the learning rate scheduler created?",
+    "How are gradient accumulation steps handled in Trainer?",
+    "What does from_pretrained do with sharded checkpoints?",
+    "How does the tokenizer handle the padding side?",
+    "Where is beam search implemented in generation?",
+    "How does GenerationConfig merge with model defaults?",
+    "How are attention masks built for causal language models?",
+    "Where is BERT self-attention implemented?",
+    "How does pipeline() pick a default model for a task?",
+    "How is the KV cache represented during generation?",
+    "What does the DataCollatorWithPadding do?",
+)
+PERCENTILES = (50, 95, 99)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout_s: float) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not up after {timeout_s:.0f}s")
+
+
+def _start_mock(args: argparse.Namespace) -> tuple[str, list[subprocess.Popen]]:
+    """Start the stub inference server and a backend pointed at it; return (backend url, procs)."""
+    stub_port, api_port = _free_port(), _free_port()
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "backend.stub_server", "--port", str(stub_port),
+         "--token-ms", str(args.mock_token_ms), "--reply-tokens", str(args.mock_reply_tokens)],
+        cwd=PROJECT_ROOT,
+    )
+    env = dict(os.environ, INFERENCE_URL=f"http://127.0.0.1:{stub_port}", INFERENCE_API="ollama")
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(api_port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT,
+        env=env,
+    )
+    procs = [stub, api]
+    try:
+        _wait_ready(f"http://127.0.0.1:{stub_port}/docs", 30)
+        _wait_ready(f"http://127.0.0.1:{api_port}/health", 60)
+    except Exception:
+        _stop(procs)
+        raise
+    return f"http://127.0.0.1:{api_port}", procs
+
+
+def _stop(procs: list[subprocess.Popen]) -> None:
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.t0 = time.perf_counter()
+        self.latency_ms: list[float] = []
+        self.retrieve_ms: list[float] = []
+        self.inference_ms: list[float] = []
+        self.errors: dict[str, int] = {}
+        self.rss: list[tuple[float, float]] = []  # (seconds since start, MB)
+        self.requests = 0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+async def _chat_session(client: httpx.AsyncClient, sid: int, args, prompts: list[str], rec: Recorder) -> None:
+    session_id = None
+    for turn in range(args.turns):
+        prompt = prompts[(sid * args.turns + turn) % len(prompts)]
+        t0 = time.perf_counter()
+        rec.requests += 1
+        try:
+            resp = await client.post("/api/chat", json={"prompt": prompt, "session_id": session_id})
+        except httpx.HTTPError as e:
+            rec.error(type(e).__name__)
+            continue
+        rec.latency_ms.append((time.perf_counter() - t0) * 1000.0)
+        if resp.status_code != 200:
+            rec.error(f"http_{resp.status_code}")
+            continue
+        body = resp.json()
+        session_id = body.get("session_id")
+        metrics = body.get("metrics") or {}
+        last = metrics.get("last_turn") or {}
+        if "error" in last:
+            rec.error(last["error"])  # e.g. index_not_loaded: answered without retrieval/inference
+        timing = last.get("timing_ms") or {}
+        if "retrieve_ms" in timing:
+            rec.retrieve_ms.append(timing["retrieve_ms"])
+        if "inference_ms" in timing:
+            rec.inference_ms.append(timing["inference_ms"])
+        if "process_rss_mb" in metrics:
+            rec.rss.append((round(rec.elapsed(), 2), metrics["process_rss_mb"]))
+        if args.think_ms:
+            await asyncio.sleep(args.think_ms / 1000.0)
+
+
+async def _retrieve_session(client: httpx.AsyncClient, sid: int, args, prompts: list[str], rec: Recorder) -> None:
+    for turn in range(args.turns):
+        query = prompts[(sid * args.turns + turn) % len(prompts)]
+        t0 = time.perf_counter()
+        rec.requests += 1
+        try:
+            resp = await client.post("/api/retrieve", json={"query": query, "top_k": args.top_k})
+        except httpx.HTTPError as e:
+            rec.error(type(e).__name__)
+            continue
+        rec.latency_ms.append((time.perf_counter() - t0) * 1000.0)
+        if resp.status_code != 200:
+            rec.error(f"http_{resp.status_code}")
+        if args.think_ms:
+            await asyncio.sleep(args.think_ms / 1000.0)
+
+
+async def _run(url: str, args, prompts: list[str]) -> Recorder:
+    rec = Recorder()
+    session = _chat_session if args.endpoint == "chat" else _retrieve_session
+    limits = httpx.Limits(max_connections=args.sessions, max_keepalive_connections=args.sessions)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        async def start(sid: int) -> None:
+            # Spread session starts evenly over the ramp-up window.
+            await asyncio.sleep(args.ramp_up * sid / max(args.sessions, 1))
+            await session(client, sid, args, prompts, rec)
+
+        await asyncio.gather(*(start(i) for i in range(args.sessions)))
+    return rec
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    arr = np.asarray(values)
+    out = {f"p{p}_ms": round(float(np.percentile(arr, p)), 2) for p in PERCENTILES}
+    out["mean_ms"] = round(float(arr.mean()), 2)
+    out["count"] = len(values)
+    return out
+
+
+def _summary(rec: Recorder, duration_s: float) -> dict:
+    errors = sum(rec.errors.values())
+    return {
+        "requests": rec.requests,
+        "duration_s": round(duration_s, 2),
+        "throughput_rps": round(rec.requests / duration_s, 2) if duration_s else None,
+        "errors": dict(sorted(rec.errors.items())),
+        "error_rate": round(errors / rec.requests, 4) if rec.requests else None,
+        "latency": _percentiles(rec.latency_ms),
+        "retrieve": _percentiles(rec.retrieve_ms),
+        "inference": _percentiles(rec.inference_ms),
+        "rss_mb": {
+            "max": max((mb for _, mb in rec.rss), default=None),
+            "samples": sorted(rec.rss),
+        },
+    }
+
+
+def _print_summary(s: dict) -> None:
+    print(f"\n{s['requests']} requests in {s['duration_s']}s ({s['throughput_rps']} req/s), "
+          f"error rate {s['error_rate']} {s['errors'] or ''}")
+    print(f"{'':<10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'mean ms':>10}")
+    for name in ("latency", "retrieve", "inference"):
+        p = s[name]
+        if p:
+            print(f"{name:<10} {p['p50_ms']:>10} {p['p95_ms']:>10} {p['p99_ms']:>10} {p['mean_ms']:>10}")
+    rss = s["rss_mb"]["samples"]
+    if rss:
+        print(f"RSS: {rss[0][1]} MB at {rss[0][0]}s -> {rss[-1][1]} MB at {rss[-1][0]}s (max {s['rss_mb']['max']})")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--url", default="http://127.0.0.1:8000", help="backend base URL (ignored with --mock)")
+    ap.add_argument("--endpoint", choices=("chat", "retrieve"), default="chat")
+    ap.add_argument("--sessions", type=int, default=8, help="concurrent sessions")
+    ap.add_argument("--turns", type=int, default=5, help="requests per session")
+    ap.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which sessions start")
+    ap.add_argument("--think-ms", type=float, default=0.0, help="pause between a session's turns")
+    ap.add_argument("--top-k", type=int, default=10, help="/api/retrieve top_k")
+    ap.add_argument("--corpus", type=Path, help="prompt file, one prompt per line (default: built-in)")
+    ap.add_argument("--timeout", type=float, default=300.0)
+    ap.add_argument("--mock", action="store_true", help="start a stub inference server + backend (offline)")
+    ap.add_argument("--mock-token-ms", type=float, default=5.0)
+    ap.add_argument("--mock-reply-tokens", type=int, default=64)
+    ap.add_argument("--json", help="write config + summary to this JSON file")
+    args = ap.parse_args()
+
+    prompts = list(DEFAULT_PROMPTS)
+    if args.corpus:
+        prompts = [line.strip() for line in args.corpus.read_text(encoding="utf-8").splitlines() if line.strip()]
+        if not prompts:
+            raise SystemExit(f"{args.corpus}: no prompts")
+
+    procs: list[subprocess.Popen] = []
+    url = args.url
+    if args.mock:
+        url, procs = _start_mock(args)
+        print(f"mock backend at {url}")
+    try:
+        print(f"{args.sessions} sessions x {args.turns} turns -> {url}/api/{args.endpoint} "
+              f"(ramp-up {args.ramp_up}s)")
+        t0 = time.perf_counter()
+        rec = asyncio.run(_run(url, args, prompts))
+        summary = _summary(rec, time.perf_counter() - t0)
+    finally:
+        _stop(procs)
+
+    _print_summary(summary)
+    if args.json:
+        config = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items() if k != "json"}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "summary": summary}, f, indent=2, sort_keys=True)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
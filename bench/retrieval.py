@@ -0,0 +1,255 @@
+"""
+Retrieval micro-benchmark: per-size index build, cold load, search latency, batch throughput,
+memory footprint and recall@k against exact flat search.
+
+Run: uv run python -m bench.retrieval [--sizes 10000,100000,1000000] [--types flat,flat_sq8,binary]
+     [--source synthetic|index] [--k 10] [--queries 200] [--live] [--json results.json]
+
+--source synthetic draws clustered, L2-normalized vectors (--dim, default the embedding
+model's 384); --source index sub-samples the vectors of the flat index at INDEX_PATH, tiling
+them with small noise when a size exceeds the corpus. Queries are held out from the same
+distribution; ground truth is the exact flat top-k. Index types use the INDEX_* settings.
+MB is the index file read into RAM; disk MB adds side files (binary's memory-mapped float
+vectors, paged in only for re-scored rows), so the reduced-precision types can be weighed on
+size vs recall vs latency.
+--live also times backend.retrieval on the configured index: cold load (index, chunk store,
+BM25, model), and per-query encode, FAISS search and BM25 search, with the query caches off.
+The JSON output (sorted keys, rounded) is meant for regression tracking between runs.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from config import settings
+from ingest.incremental import live_dir
+from ingest.index import INDEX_TYPES, apply_search_params, build_index, describe, read_index, unwrap, write_index
+
+PERCENTILES = (50, 95, 99)
+BATCH_SIZE = 256  # queries per search call for the throughput figure
+
+
+def _rss_mb() -> float | None:
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+
+
+def _percentiles(lat_ms: list[float]) -> dict:
+    return {f"p{p}_ms": round(float(np.percentile(lat_ms, p)), 4) for p in PERCENTILES}
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x /= np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
+    return x.astype(np.float32)
+
+
+def _synthetic(n: int, dim: int, seed: int) -> np.ndarray:
+    """Gaussian mixture around random centers: clustered like real embeddings, unlike pure noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(16, n // 1000), dim), dtype=np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    for lo in range(0, n, 100_000):  # chunked to bound temporaries at 1M x dim
+        hi = min(lo + 100_000, n)
+        out[lo:hi] = centers[rng.integers(0, len(centers), hi - lo)]
+        out[lo:hi] += 0.35 * rng.standard_normal((hi - lo, dim), dtype=np.float32)
+    return _normalize(out)
+
+
+def _from_index(base: np.ndarray, n: int, seed: int) -> np.ndarray:
+    """n rows sampled from the corpus vectors; beyond its size, tiled copies with small noise."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(base), size=n, replace=n > len(base))
+    out = base[rows].copy()
+    if n > len(base):
+        out += 0.02 * rng.standard_normal(out.shape, dtype=np.float32)
+        out = _normalize(out)
+    return out
+
+
+def _corpus_vectors() -> np.ndarray:
+    import faiss
+
+    index_dir = live_dir(settings.index_path if not settings.index_path.suffix else settings.index_path.parent)
+    flat = read_index(index_dir / "index.faiss")
+    if not isinstance(unwrap(flat), faiss.IndexFlat):
+        raise SystemExit(f"{index_dir / 'index.faiss'} is {describe(flat)}; --source index needs a flat index.")
+    return unwrap(flat).reconstruct_n(0, flat.ntotal)
+
+
+def _recall(ids: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(a.tolist()) & set(b.tolist())) for a, b in zip(ids, truth))
+    return hits / truth.size
+
+
+def _bench_index(index_type: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    t0 = time.perf_counter()
+    index, label = build_index(vectors, index_type)
+    build_s = time.perf_counter() - t0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "index.faiss"
+        write_index(index, path)
+        size_mb = path.stat().st_size / (1024 * 1024)
+        disk_mb = sum(p.stat().st_size for p in Path(tmp).iterdir()) / (1024 * 1024)
+        del index
+        rss0 = _rss_mb()
+        t0 = time.perf_counter()
+        index = read_index(path)  # binary's vectors stay memory-mapped after the dir is removed
+        load_ms = (time.perf_counter() - t0) * 1000.0
+        rss1 = _rss_mb()
+    apply_search_params(index)
+
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    lat = []
+    for i in range(len(queries)):  # one query per call, as the backend serves single requests
+        t0 = time.perf_counter()
+        _, row = index.search(queries[i:i + 1], k)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+        ids[i] = row[0]
+    batch = queries[:BATCH_SIZE]
+    t0 = time.perf_counter()
+    index.search(batch, k)
+    batch_s = time.perf_counter() - t0
+
+    row = {
+        "index": label,
+        "build_s": round(build_s, 3),
+        "load_ms": round(load_ms, 2),
+        "file_mb": round(size_mb, 2),
+        "disk_mb": round(disk_mb, 2),
+        "bytes_per_vector": round(size_mb * 1024 * 1024 / len(vectors), 1),
+        "recall": round(_recall(ids, truth), 4),
+        "mean_ms": round(float(np.mean(lat)), 4),
+        "batch_qps": round(len(batch) / batch_s, 1),
+        **_percentiles(lat),
+    }
+    if rss0 is not None and rss1 is not None:
+        row["load_rss_mb"] = round(rss1 - rss0, 1)
+    return row
+
+
+def _bench_live(queries: list[str], k: int) -> dict:
+    """backend.retrieval on the configured index, caches off."""
+    settings.query_cache_size = 0  # before the import: caches are sized at module load
+    from backend import retrieval
+
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    retrieval._load()
+    load_ms = (time.perf_counter() - t0) * 1000.0
+    status = retrieval.load_status()
+    snap = retrieval._active
+    encode, search, lexical, total = [], [], [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        vec = retrieval._model.encode([q], normalize_embeddings=True).astype(np.float32)
+        t1 = time.perf_counter()
+        snap.index.search(vec, k)
+        t2 = time.perf_counter()
+        if snap.lexical is not None:
+            snap.lexical.search(q, max(k, settings.hybrid_candidates))
+        t3 = time.perf_counter()
+        retrieval.retrieve(q, k)
+        t4 = time.perf_counter()
+        encode.append((t1 - t0) * 1000.0)
+        search.append((t2 - t1) * 1000.0)
+        lexical.append((t3 - t2) * 1000.0)
+        total.append((t4 - t3) * 1000.0)
+    out = {
+        "index": status.get("index"),
+        "vectors": status.get("vectors"),
+        "mode": status.get("mode"),
+        "cold_load_ms": round(load_ms, 2),
+        "load_timings_ms": status.get("timings_ms"),
+        "encode": _percentiles(encode),
+        "search": _percentiles(search),
+        "lexical": _percentiles(lexical) if snap.lexical is not None else None,
+        "retrieve": _percentiles(total),
+    }
+    rss1 = _rss_mb()
+    if rss0 is not None and rss1 is not None:
+        out["load_rss_mb"] = round(rss1 - rss0, 1)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--sizes", default="10000,100000", help="comma-separated vector counts (up to 1000000)")
+    ap.add_argument("--types", default="flat,flat_fp16,flat_sq8,binary,ivf_flat,ivf_pq,hnsw",
+                    help=f"comma-separated, from {INDEX_TYPES}")
+    ap.add_argument("--source", choices=("synthetic", "index"), default="synthetic")
+    ap.add_argument("--dim", type=int, default=384, help="synthetic vector dimension")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--live", action="store_true", help="also time backend.retrieval on INDEX_PATH")
+    ap.add_argument("--json", help="write results to this JSON file")
+    args = ap.parse_args()
+
+    import faiss
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    for t in types:
+        if t not in INDEX_TYPES:
+            raise SystemExit(f"unknown index type {t!r}; choose from {INDEX_TYPES}")
+    base = _corpus_vectors() if args.source == "index" else None
+
+    results = []
+    for n in sizes:
+        if base is not None:
+            vectors, queries = _from_index(base, n, seed=0), _from_index(base, args.queries, seed=1)
+        else:
+            vectors, queries = _synthetic(n, args.dim, seed=0), _synthetic(args.queries, args.dim, seed=1)
+        k = min(args.k, n)
+        exact = faiss.IndexFlatIP(vectors.shape[1])
+        exact.add(vectors)
+        _, truth = exact.search(queries, k)
+        del exact
+        print(f"\n{n} vectors x {vectors.shape[1]} ({args.source}), {len(queries)} queries, k={k}")
+        print(f"{'index':<34} {'build s':>8} {'load ms':>8} {'MB':>8} {'disk MB':>8} {'recall':>7} "
+              f"{'p50 ms':>8} {'p99 ms':>8} {'batch q/s':>10}")
+        for t in types:
+            row = _bench_index(t, vectors, queries, truth, k) | {"type": t, "vectors": n}
+            results.append(row)
+            print(f"{row['index']:<34} {row['build_s']:>8} {row['load_ms']:>8} {row['file_mb']:>8} {row['disk_mb']:>8} "
+                  f"{row['recall']:>7} {row['p50_ms']:>8} {row['p99_ms']:>8} {row['batch_qps']:>10}")
+        del vectors
+
+    live = None
+    if args.live:
+        from bench.load import DEFAULT_PROMPTS
+
+        live = _bench_live(list(DEFAULT_PROMPTS), args.k)
+        lexical = f"bm25 p50 {live['lexical']['p50_ms']} ms, " if live["lexical"] else ""
+        print(f"\nlive {live['index']} ({live['vectors']} vectors, {live['mode']}): "
+              f"cold load {live['cold_load_ms']} ms, "
+              f"encode p50 {live['encode']['p50_ms']} ms, search p50 {live['search']['p50_ms']} ms, {lexical}"
+              f"retrieve p50 {live['retrieve']['p50_ms']} ms")
+
+    if args.json:
+        out = {
+            "config": {k: v for k, v in vars(args).items() if k != "json"},
+            "settings": {
+                "index_nlist": settings.index_nlist,
+                "index_nprobe": settings.index_nprobe,
+                "index_pq_m": settings.index_pq_m,
+                "index_hnsw_m": settings.index_hnsw_m,
+                "index_ef_search": settings.index_ef_search,
+                "index_rescore": settings.index_rescore,
+            },
+            "results": results,
+            "live": live,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(out, f, indent=2, sort_keys=True)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TIER_CHOICES = ("dev", "test", "demo")
+INDEX_TYPE_CHOICES = ("flat", "flat_fp16", "flat_sq8", "binary", "ivf_flat", "ivf_pq", "hnsw")
+INFERENCE_API_CHOICES = ("ollama", "openai_completions", "openai_chat")
+SESSION_STORE_CHOICES = ("memory", "sqlite")
+PROMPT_LAYOUT_CHOICES = ("context_first", "history_first")
+RETRIEVAL_MODE_CHOICES = ("dense", "hybrid")
 
 # Project root (repo root where pyproject.toml lives). Relative INDEX_PATH/REPO_PATH are resolved from here.
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
@@ -22,6 +27,21 @@ def _int(key: str, default: int = 0) -> int:
     return int(raw) if raw.isdigit() else default
 
 
+def _bool(key: str, default: bool = False) -> bool:
+    raw = _str(key).lower()
+    if not raw:
+        return default
+    return raw in ("1", "true", "yes", "on")
+
+
+def _float(key: str, default: float = 0.0) -> float:
+    raw = _str(key)
+    try:
+        return float(raw) if raw else default
+    except ValueError:
+        return default
+
+
 def _path(key: str, default: str = "") -> Path:
     raw = _str(key) or default
     if not raw:
@@ -37,22 +57,136 @@ def _path(key: str, default: str = "") -> Path:
 class Settings:
     tier: str
     inference_url: str
+    inference_api: str  # ollama | openai_completions | openai_chat (vLLM and other OpenAI-compatible servers)
+    inference_api_key: str  # sent as a Bearer token when set
     model_name: str
     context_length: int
+    prompt_tokenizer: str  # HF tokenizer matching MODEL_NAME for exact counts ("" = calibrated estimate)
+    prompt_reserved_tokens: int  # of context_length, kept free for the reply (also Ollama num_predict)
+    prompt_context_share: float  # of the prompt budget after the template, for retrieved chunks
+    prompt_layout: str  # context_first | history_first (stable prefix for KV/prefix caching)
     index_path: Path
+    index_keep_versions: int  # published index versions kept on disk, the live one included
+    index_hot_reload: bool  # backend swaps in a newly published index version without a restart
     repo_path: Path
     ingest_max_files: int  # 0 = no limit (full repo); default 500 for faster dev runs
+    ingest_incremental: bool  # re-embed only added/modified files (content hash manifest)
+    ingest_workers: int  # processes reading + chunking files; 1 = in-process
+    ingest_embed_batch: int  # chunks per streamed embed → index batch (bounds peak memory)
+    ingest_encode_batch: int  # model.encode batch size
+    ingest_embed_from_ids: bool  # feed chunker token ids to the model instead of re-tokenizing text
+    embed_cache: bool  # reuse embeddings of unchanged chunk texts across ingest runs
+    embed_cache_path: Path
+    # FAISS index type and knobs (see ingest.index)
+    index_type: str
+    index_nlist: int  # IVF cells; 0 = ~4*sqrt(N)
+    index_nprobe: int  # IVF cells searched per query
+    index_pq_m: int  # IVF-PQ sub-quantizers (must divide the embedding dim, 384)
+    index_pq_nbits: int  # IVF-PQ bits per sub-quantizer code
+    index_hnsw_m: int  # HNSW links per node
+    index_ef_construction: int
+    index_ef_search: int
+    index_train_size: int  # IVF / SQ8 training sample; 0 = auto
+    index_rescore: int  # binary: Hamming shortlist of rescore * k, re-scored with float vectors
+    index_mmap: bool  # backend maps the index read-only (shared page cache) instead of copying it
+    index_blas_threshold: int  # queries per search from which FAISS scores flat vectors with BLAS
+    # Inference HTTP client (one pooled client per process, see backend.inference)
+    inference_max_connections: int
+    inference_max_keepalive: int
+    inference_keepalive_expiry: float  # seconds
+    inference_connect_timeout: float  # seconds
+    inference_timeout: float  # seconds (read/write/pool)
+    inference_max_concurrency: int  # in-flight requests to the model server; extra requests queue
+    retrieval_workers: int  # threads running embed + FAISS search off the event loop
+    retrieval_batch_max: int  # max queries per micro-batched encode + search
+    retrieval_batch_wait_ms: float  # how long the first query waits for others; 0 = no batching
+    retrieval_warmup: bool  # load index + model and run a dummy search at startup (see /ready)
+    retrieval_mode: str  # dense (FAISS only) | hybrid (FAISS + BM25, reciprocal-rank fusion)
+    hybrid_candidates: int  # hits taken from each of FAISS and BM25 before fusion
+    rrf_k: int  # reciprocal-rank fusion constant: score = sum of 1 / (rrf_k + rank)
+    query_cache_size: int  # LRU entries for query embeddings and for results (0 disables)
+    query_cache_ttl_s: float  # seconds before a cached query entry expires (0 = never)
+    session_store: str  # memory | sqlite (shared by all workers on the host)
+    session_db_path: Path
+    session_max: int  # most sessions kept; least recently used evicted (0 = unbounded)
+    session_ttl_s: float  # evict sessions idle this long (0 = never)
+    session_max_bytes: int  # cap per session history (JSON bytes); oldest messages dropped (0 = no cap)
+    trace_path: Path  # append request traces here (Chrome trace-event JSON); unset = don't export
+    profile_sample_rate: float  # fraction of /api/* requests run under cProfile (0 = off)
+    profile_slow_ms: float  # keep a profile only when the request took at least this long
+    profile_dir: Path
 
     def __init__(self) -> None:
         self.tier = _str("TIER", "dev").lower()
         if self.tier not in TIER_CHOICES:
             self.tier = "dev"
         self.inference_url = _str("INFERENCE_URL", "http://localhost:11434").rstrip("/")
+        self.inference_api = _str("INFERENCE_API", "ollama").lower()
+        if self.inference_api not in INFERENCE_API_CHOICES:
+            self.inference_api = "ollama"
+        self.inference_api_key = _str("INFERENCE_API_KEY", "")
         self.model_name = _str("MODEL_NAME", "llama3.1:8b")
         self.context_length = _int("CONTEXT_LENGTH", 8192)
+        self.prompt_tokenizer = _str("PROMPT_TOKENIZER", "")
+        self.prompt_reserved_tokens = _int("PROMPT_RESERVED_TOKENS", 1024)
+        self.prompt_context_share = min(max(_float("PROMPT_CONTEXT_SHARE", 0.6), 0.0), 1.0)
+        self.prompt_layout = _str("PROMPT_LAYOUT", "context_first").lower()
+        if self.prompt_layout not in PROMPT_LAYOUT_CHOICES:
+            self.prompt_layout = "context_first"
         self.index_path = _path("INDEX_PATH", "./data/faiss_index")
+        self.index_keep_versions = max(_int("INDEX_KEEP_VERSIONS", 3), 1)
+        self.index_hot_reload = _bool("INDEX_HOT_RELOAD", True)
         self.repo_path = _path("REPO_PATH", "./data/transformers")
         self.ingest_max_files = _int("INGEST_MAX_FILES", 500)
+        self.ingest_incremental = _bool("INGEST_INCREMENTAL", True)
+        self.ingest_workers = _int("INGEST_WORKERS", max(1, min(8, (os.cpu_count() or 2) - 1)))
+        self.ingest_embed_batch = _int("INGEST_EMBED_BATCH", 2048) or 2048
+        self.ingest_encode_batch = _int("INGEST_ENCODE_BATCH", 128) or 128
+        self.ingest_embed_from_ids = _bool("INGEST_EMBED_FROM_IDS", True)
+        self.embed_cache = _bool("EMBED_CACHE", True)
+        self.embed_cache_path = _path("EMBED_CACHE_PATH", "./data/embed_cache")
+        self.index_type = _str("INDEX_TYPE", "flat").lower()
+        if self.index_type not in INDEX_TYPE_CHOICES:
+            self.index_type = "flat"
+        self.index_nlist = _int("INDEX_NLIST", 0)
+        self.index_nprobe = _int("INDEX_NPROBE", 16) or 1
+        self.index_pq_m = _int("INDEX_PQ_M", 48) or 48
+        self.index_pq_nbits = _int("INDEX_PQ_NBITS", 8) or 8
+        self.index_hnsw_m = _int("INDEX_HNSW_M", 32) or 32
+        self.index_ef_construction = _int("INDEX_EF_CONSTRUCTION", 80) or 80
+        self.index_ef_search = _int("INDEX_EF_SEARCH", 64) or 64
+        self.index_train_size = _int("INDEX_TRAIN_SIZE", 0)
+        self.index_rescore = _int("INDEX_RESCORE", 20) or 20
+        self.index_mmap = _bool("INDEX_MMAP", True)
+        self.index_blas_threshold = _int("INDEX_BLAS_THRESHOLD", 4) or 4
+        self.inference_max_connections = _int("INFERENCE_MAX_CONNECTIONS", 16)
+        self.inference_max_keepalive = _int("INFERENCE_MAX_KEEPALIVE", 8)
+        self.inference_keepalive_expiry = _float("INFERENCE_KEEPALIVE_EXPIRY", 30.0)
+        self.inference_connect_timeout = _float("INFERENCE_CONNECT_TIMEOUT", 5.0)
+        self.inference_timeout = _float("INFERENCE_TIMEOUT", 120.0)
+        self.inference_max_concurrency = _int("INFERENCE_MAX_CONCURRENCY", 4) or 1
+        self.retrieval_workers = _int("RETRIEVAL_WORKERS", 2) or 1
+        self.retrieval_batch_max = _int("RETRIEVAL_BATCH_MAX", 16)
+        self.retrieval_batch_wait_ms = _float("RETRIEVAL_BATCH_WAIT_MS", 3.0)
+        self.retrieval_warmup = _bool("RETRIEVAL_WARMUP", False)
+        self.retrieval_mode = _str("RETRIEVAL_MODE", "hybrid").lower()
+        if self.retrieval_mode not in RETRIEVAL_MODE_CHOICES:
+            self.retrieval_mode = "hybrid"
+        self.hybrid_candidates = _int("HYBRID_CANDIDATES", 50) or 50
+        self.rrf_k = _int("RRF_K", 60) or 60
+        self.query_cache_size = _int("QUERY_CACHE_SIZE", 1024)
+        self.query_cache_ttl_s = _float("QUERY_CACHE_TTL_S", 600.0)
+        self.session_store = _str("SESSION_STORE", "memory").lower()
+        if self.session_store not in SESSION_STORE_CHOICES:
+            self.session_store = "memory"
+        self.session_db_path = _path("SESSION_DB_PATH", "./data/sessions.sqlite")
+        self.session_max = _int("SESSION_MAX", 1000)
+        self.session_ttl_s = _float("SESSION_TTL_S", 3600.0)
+        self.session_max_bytes = _int("SESSION_MAX_BYTES", 256 * 1024)
+        self.trace_path = _path("TRACE_PATH", "")
+        self.profile_sample_rate = min(max(_float("PROFILE_SAMPLE_RATE", 0.0), 0.0), 1.0)
+        self.profile_slow_ms = _float("PROFILE_SLOW_MS", 1000.0)
+        self.profile_dir = _path("PROFILE_DIR", "./data/profiles")
 
     def __repr__(self) -> str:
         return f"Settings(tier={self.tier!r}, inference_url={self.inference_url!r}, model_name={self.model_name!r})"
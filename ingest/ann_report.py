@@ -0,0 +1,138 @@
+"""
+Recall@k vs latency of ANN and reduced-precision index types against the exact flat index.
+
+Reads the vectors back out of a flat index.faiss (build one with INDEX_TYPE=flat), builds each
+type in memory with the INDEX_* settings, and sweeps nprobe / efSearch / the binary re-score
+shortlist (INDEX_RESCORE). Queries are a
+random sample of the indexed chunk vectors; ground truth is the exact top-k over the same vectors.
+
+Run: uv run python -m ingest.ann_report [--k 10] [--queries 200] [--json report.json]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from config import settings
+from ingest.incremental import live_dir
+from ingest.index import build_index, describe, read_index, training_sample, unwrap
+
+NPROBE_SWEEP = (1, 4, 8, 16, 32, 64, 128)
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256)
+RESCORE_SWEEP = (1, 2, 5, 10, 20, 50)
+REPORT_TYPES = ("flat", "flat_fp16", "flat_sq8", "binary", "ivf_flat", "ivf_pq", "hnsw")
+
+
+def _latencies_ms(index, queries: np.ndarray, k: int) -> tuple[np.ndarray, list[float]]:
+    """One query per search call, as the backend serves them; returns (ids, per-query ms)."""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    lat = []
+    for i in range(len(queries)):
+        t0 = time.perf_counter()
+        _, row = index.search(queries[i:i + 1], k)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+        ids[i] = row[0]
+    return ids, lat
+
+
+def _recall(ids: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(a.tolist()) & set(b.tolist())) for a, b in zip(ids, truth))
+    return hits / (len(truth) * k)
+
+
+def _row(label: str, param: str, ids, lat, truth) -> dict:
+    return {
+        "index": label,
+        "param": param,
+        "recall": round(_recall(ids, truth), 4),
+        "p50_ms": round(float(np.percentile(lat, 50)), 4),
+        "p95_ms": round(float(np.percentile(lat, 95)), 4),
+        "mean_ms": round(float(np.mean(lat)), 4),
+    }
+
+
+def sweep(vectors: np.ndarray, queries: np.ndarray, k: int, index_types: tuple[str, ...]) -> list[dict]:
+    """
+    Build each index type over vectors (ids = row positions) and measure recall@k against the
+    exact top-k of the same rows, plus per-query latency.
+    """
+    import faiss
+
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    rows = []
+    for index_type in index_types:
+        t0 = time.perf_counter()
+        index, label = build_index(vectors, index_type)
+        build_s = time.perf_counter() - t0
+        print(f"Built {label} in {build_s:.1f}s")
+        if not label.startswith(index_type):
+            continue  # fell back to flat: corpus too small
+        build = {"build_s": round(build_s, 2)}
+        if index_type in ("flat", "flat_fp16", "flat_sq8"):
+            ids, lat = _latencies_ms(index, queries, k)
+            rows.append(_row(index_type, "-", ids, lat, truth) | build)
+        elif index_type == "binary":
+            for rescore in RESCORE_SWEEP:
+                index.rescore = rescore
+                ids, lat = _latencies_ms(index, queries, k)
+                rows.append(_row(index_type, f"rescore={rescore}x", ids, lat, truth) | build)
+        elif index_type == "hnsw":
+            inner = faiss.downcast_index(index)
+            for ef in EF_SEARCH_SWEEP:
+                inner.hnsw.efSearch = ef
+                ids, lat = _latencies_ms(index, queries, k)
+                rows.append(_row(index_type, f"efSearch={ef}", ids, lat, truth) | build)
+        else:
+            ivf = faiss.extract_index_ivf(index)
+            for nprobe in NPROBE_SWEEP:
+                if nprobe > ivf.nlist:
+                    break
+                ivf.nprobe = nprobe
+                ids, lat = _latencies_ms(index, queries, k)
+                rows.append(_row(index_type, f"nprobe={nprobe}", ids, lat, truth) | build)
+    return rows
+
+
+def main() -> None:
+    import faiss
+
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--json", help="also write results to this JSON file")
+    args = ap.parse_args()
+
+    index_dir = settings.index_path
+    if index_dir.suffix:
+        index_dir = index_dir.parent
+    index_dir = live_dir(index_dir)
+    flat = read_index(index_dir / "index.faiss")
+    if not isinstance(unwrap(flat), faiss.IndexFlat):
+        print(f"{index_dir / 'index.faiss'} is {describe(flat)}; this report needs a flat index as baseline.")
+        sys.exit(1)
+    # Row positions, not the index's external ids: after an incremental re-ingest removed vectors
+    # the two differ, and every index built here numbers its vectors by position.
+    vectors = unwrap(flat).reconstruct_n(0, flat.ntotal)
+    queries = training_sample(vectors, args.queries, seed=1)
+    k = min(args.k, flat.ntotal)
+    print(f"Vectors: {flat.ntotal} x {vectors.shape[1]}, queries: {len(queries)}, k={k}")
+
+    rows = sweep(vectors, queries, k, REPORT_TYPES)
+
+    print(f"\n{'index':<10} {'param':<14} {'recall@' + str(k):>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for r in rows:
+        print(f"{r['index']:<10} {r['param']:<14} {r['recall']:>9.4f} {r['p50_ms']:>9.4f} {r['p95_ms']:>9.4f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"vectors": int(flat.ntotal), "queries": len(queries), "k": k, "results": rows}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
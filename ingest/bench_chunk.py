@@ -0,0 +1,69 @@
+"""
+Benchmark the single-pass chunker (chunk_spans: one tokenizer call with offset mappings)
+against the original encode + decode-per-window chunker plus the re-tokenization that
+model.encode does on each decoded chunk.
+
+Run: uv run python -m ingest.bench_chunk [--files 50] [--embed 256]
+Uses the largest .py files under REPO_PATH. --embed N also times embedding N chunks from
+text (model.encode) vs from pre-computed ids.
+"""
+
+import argparse
+import time
+
+from config import settings
+from ingest.chunk import CHUNK_TOKENS, chunk_spans, chunk_text_decode
+from ingest.repo import ensure_repo, list_files
+from ingest.run import EMBED_MODEL
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--files", type=int, default=50)
+    ap.add_argument("--embed", type=int, default=0, help="also time embedding this many chunks")
+    args = ap.parse_args()
+
+    from transformers import AutoTokenizer
+
+    tok = AutoTokenizer.from_pretrained(EMBED_MODEL)
+    tok.model_max_length = 1_000_000
+    repo_path = ensure_repo(settings.repo_path)
+    files = sorted(list_files(repo_path, extensions={".py"}), key=lambda p: p.stat().st_size, reverse=True)
+    files = files[:args.files]
+    texts = [p.read_text(encoding="utf-8", errors="replace") for p in files]
+    mb = sum(len(t.encode("utf-8")) for t in texts) / (1024 * 1024)
+    print(f"{len(texts)} files, {mb:.2f} MB")
+
+    t0 = time.perf_counter()
+    old_chunks = [c for t in texts for c in chunk_text_decode(t, tok)]
+    t1 = time.perf_counter()
+    # What model.encode then does to every decoded chunk string.
+    tok(old_chunks, truncation=True, max_length=CHUNK_TOKENS)
+    t2 = time.perf_counter()
+    new_chunks = [c for t in texts for c in chunk_spans(t, tok)]
+    t3 = time.perf_counter()
+
+    old_s, new_s = t2 - t0, t3 - t2
+    print(f"decode chunker:  {t1 - t0:.2f}s chunk + {t2 - t1:.2f}s re-tokenize = {old_s:.2f}s "
+          f"({mb / old_s:.2f} MB/s), {len(old_chunks)} chunks")
+    print(f"offset chunker:  {new_s:.2f}s ({mb / new_s:.2f} MB/s), {len(new_chunks)} chunks, "
+          f"ids handed to embedder")
+    print(f"speedup: {old_s / new_s:.1f}x")
+
+    if args.embed:
+        from sentence_transformers import SentenceTransformer
+
+        from ingest.pipeline import _encode, _encode_ids
+
+        model = SentenceTransformer(EMBED_MODEL)
+        sample = new_chunks[:args.embed]
+        t0 = time.perf_counter()
+        _encode(model, [c.text for c in sample])
+        t1 = time.perf_counter()
+        _encode_ids(model, [c.ids for c in sample])
+        t2 = time.perf_counter()
+        print(f"embed {len(sample)} chunks: from text {t1 - t0:.2f}s, from ids {t2 - t1:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,94 @@
-"""Chunk text by token count with overlap. Uses tokenizer.encode/decode."""
+"""
+Chunk text by token count with overlap.
+
+Fast (Rust) tokenizers are run once per file with offset mappings: each window of token ids
+is mapped back to a slice of the original text, so chunks keep exact source text and line
+ranges, and the ids can go straight to the embedder (see ingest.pipeline). Other tokenizers
+fall back to encode + decode per window (chunk_text_decode).
+"""
+
+import bisect
+from dataclasses import dataclass
 
 # Align chunk size with embedding model max length (bge* is typically 512).
 # This avoids silent truncation during embedding and keeps retrieval chunks consistent.
 CHUNK_TOKENS = 512
 OVERLAP_TOKENS = 80  # ~15%
+# Bump when chunk boundaries or text change, so incremental ingest rebuilds (see ingest.run).
+CHUNKER_VERSION = "offsets-1"
+
+
+@dataclass(slots=True)
+class Chunk:
+    text: str
+    start_line: int  # 1-based, inclusive
+    end_line: int
+    ids: list[int] | None = None  # token ids without special tokens; None on the decode fallback
+
+
+def _line_of(newlines: list[int], pos: int) -> int:
+    return bisect.bisect_right(newlines, pos - 1) + 1
+
+
+def chunk_spans(
+    text: str,
+    tokenizer,  # fast tokenizer (offset mappings), or anything with .encode() and .decode()
+    chunk_size: int = CHUNK_TOKENS,
+    overlap: int = OVERLAP_TOKENS,
+) -> list[Chunk]:
+    """
+    Split text into chunks of ~chunk_size tokens with overlap, tokenizing it once.
+    """
+    if not text.strip():
+        return []
+    if not getattr(tokenizer, "is_fast", False):
+        return [Chunk(t, 0, 0) for t in chunk_text_decode(text, tokenizer, chunk_size, overlap)]
+
+    enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    ids, offsets = enc["input_ids"], enc["offset_mapping"]
+    newlines = [i for i, ch in enumerate(text) if ch == "\n"]
+    step = chunk_size - overlap
+    chunks: list[Chunk] = []
+    start = 0
+    while start < len(ids):
+        end = min(start + chunk_size, len(ids))
+        lo, hi = offsets[start][0], offsets[end - 1][1]
+        if len(ids) <= chunk_size:
+            lo, hi = 0, len(text)  # whole file: keep everything, as the decode path does
+        raw = text[lo:hi]
+        stripped = raw.strip()
+        if stripped:
+            lo += len(raw) - len(raw.lstrip())
+            hi = lo + len(stripped)
+            chunks.append(Chunk(stripped, _line_of(newlines, lo), _line_of(newlines, hi - 1), ids[start:end]))
+        start += step
+        if end >= len(ids):
+            break
+    return chunks
 
 
 def chunk_text(
     text: str,
-    tokenizer,  # must have .encode() and .decode()
+    tokenizer,
     chunk_size: int = CHUNK_TOKENS,
     overlap: int = OVERLAP_TOKENS,
 ) -> list[str]:
     """
     Split text into chunks of ~chunk_size tokens with overlap.
     """
+    return [c.text for c in chunk_spans(text, tokenizer, chunk_size, overlap)]
+
+
+def chunk_text_decode(
+    text: str,
+    tokenizer,  # must have .encode() and .decode()
+    chunk_size: int = CHUNK_TOKENS,
+    overlap: int = OVERLAP_TOKENS,
+) -> list[str]:
+    """
+    Split text into chunks of ~chunk_size tokens with overlap by decoding each token window
+    (original implementation; used for slow tokenizers and as the benchmark baseline).
+    """
     if not text.strip():
         return []
     enc = tokenizer.encode(text, add_special_tokens=False)
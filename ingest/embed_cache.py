@@ -0,0 +1,95 @@
+"""
+On-disk embedding cache keyed by (model name, chunk text hash).
+
+One directory per model under EMBED_CACHE_PATH:
+- keys.bin     16-byte blake2b digests of chunk texts, append-only
+- vectors.f32  matching L2-normalized float32 rows, append-only
+
+Vectors are memory-mapped for lookups; the digest → row dict is built from keys.bin on open.
+Rows are appended vectors first, keys second, so a torn write only loses the last batch.
+"""
+
+import hashlib
+import re
+from pathlib import Path
+
+import numpy as np
+
+KEY_BYTES = 16
+KEYS_FILE = "keys.bin"
+VECTORS_FILE = "vectors.f32"
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, root: Path, model_name: str, dim: int) -> None:
+        self.dir = root / re.sub(r"[^A-Za-z0-9._-]+", "__", model_name)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.hits = 0
+        self.misses = 0
+        keys_path, vec_path = self.dir / KEYS_FILE, self.dir / VECTORS_FILE
+        keys = keys_path.read_bytes() if keys_path.exists() else b""
+        n_vec = vec_path.stat().st_size // (4 * dim) if vec_path.exists() else 0
+        n = min(len(keys) // KEY_BYTES, n_vec)
+        self._rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(n)}
+        # Drop any torn tail so appends line up with the key index.
+        for path, size in ((keys_path, n * KEY_BYTES), (vec_path, n * 4 * dim)):
+            if path.exists() and path.stat().st_size != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+        self._n = n
+        self._mapped: np.ndarray | None = None
+        self._keys_out = open(keys_path, "ab")
+        self._vec_out = open(vec_path, "ab")
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _vectors(self, row: int) -> np.ndarray:
+        if self._mapped is None or row >= len(self._mapped):
+            self._vec_out.flush()
+            self._mapped = np.memmap(self.dir / VECTORS_FILE, dtype=np.float32, mode="r").reshape(-1, self.dim)
+        return self._mapped
+
+    def lookup(self, texts: list[str]) -> tuple[list[bytes], np.ndarray, list[int]]:
+        """Return (keys, vectors with cached rows filled in, indices of texts that missed)."""
+        keys = [text_key(t) for t in texts]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing = []
+        for i, k in enumerate(keys):
+            row = self._rows.get(k)
+            if row is None:
+                missing.append(i)
+            else:
+                out[i] = self._vectors(row)[row]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return keys, out, missing
+
+    def put(self, keys: list[bytes], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        new = []
+        for k, v in zip(keys, vectors):
+            if k not in self._rows:
+                self._rows[k] = self._n + len(new)
+                new.append((k, v))
+        if not new:
+            return
+        self._vec_out.write(np.stack([v for _, v in new]).tobytes())
+        self._vec_out.flush()
+        self._keys_out.write(b"".join(k for k, _ in new))
+        self._keys_out.flush()
+        self._n += len(new)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self) -> None:
+        self._keys_out.close()
+        self._vec_out.close()
+        self._mapped = None
@@ -0,0 +1,154 @@
+"""
+Incremental re-ingest: per-file content hashes and chunk-id ranges (manifest.json).
+
+FAISS ids are rows of the chunk store. On re-run only added/modified files are chunked and
+embedded; their new chunks are appended with fresh ids, while the rows of modified/deleted
+files become tombstones in the store and their vectors are removed from the (ID-mapped)
+index. Everything is written to a staging dir and then moved over the live files.
+
+Each build is a complete, immutable version: the staging dir is renamed to versions/<version>
+and the CURRENT file (one line, the version name) is swapped to point at it. Readers resolve the
+live files with live_dir(); an index dir without CURRENT (built before versioning) is read as is.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+STAGING_DIR = ".staging"
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def new_manifest(params: dict) -> dict:
+    """params: build parameters that invalidate all vectors when changed (model, chunking, index type)."""
+    return {"version": MANIFEST_VERSION, "params": params, "files": {}}
+
+
+def load_manifest(index_dir: Path) -> dict | None:
+    p = index_dir / MANIFEST_FILE
+    if not p.exists():
+        return None
+    try:
+        manifest = json.loads(p.read_text(encoding="utf-8"))
+    except ValueError:
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def save_manifest(index_dir: Path, manifest: dict) -> None:
+    (index_dir / MANIFEST_FILE).write_text(json.dumps(manifest, indent=0), encoding="utf-8")
+
+
+def diff(manifest: dict, hashes: dict[str, str]) -> tuple[list[str], list[str], list[str], list[str]]:
+    """Compare current {path: sha256} to the manifest; return (added, modified, deleted, unchanged)."""
+    old = manifest["files"]
+    added, modified, unchanged = [], [], []
+    for path, sha in hashes.items():
+        if path not in old:
+            added.append(path)
+        elif old[path]["sha256"] != sha:
+            modified.append(path)
+        else:
+            unchanged.append(path)
+    deleted = [p for p in old if p not in hashes]
+    return added, modified, deleted, unchanged
+
+
+def staging_dir(index_dir: Path) -> Path:
+    d = index_dir / STAGING_DIR
+    if d.exists():
+        shutil.rmtree(d)
+    d.mkdir(parents=True)
+    return d
+
+
+def stage_copy(src: Path, index_dir: Path, exclude: tuple[str, ...] = ()) -> Path:
+    """
+    Fresh staging dir holding the files of src (a live dir) except exclude, hard-linked where
+    possible: files are never rewritten in place, so versions can share them.
+    """
+    staging = staging_dir(index_dir)
+    for f in src.iterdir():
+        if not f.is_file() or f.name in exclude or f.name.startswith(CURRENT_FILE):
+            continue
+        try:
+            os.link(f, staging / f.name)
+        except OSError:
+            shutil.copy2(f, staging / f.name)
+    return staging
+
+
+def current_version(index_dir: Path) -> str | None:
+    """Name of the published version, or None for an unversioned (or empty) index dir."""
+    try:
+        name = (index_dir / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return name if name and (index_dir / VERSIONS_DIR / name).is_dir() else None
+
+
+def live_dir(index_dir: Path) -> Path:
+    """Directory holding the live index files: versions/<CURRENT>, or index_dir itself if unversioned."""
+    version = current_version(index_dir)
+    return index_dir / VERSIONS_DIR / version if version else index_dir
+
+
+def list_versions(index_dir: Path) -> list[str]:
+    """Version names on disk, oldest first (names are build timestamps)."""
+    d = index_dir / VERSIONS_DIR
+    return sorted(p.name for p in d.iterdir() if p.is_dir()) if d.is_dir() else []
+
+
+def _new_version_name(index_dir: Path) -> str:
+    """Build timestamp, made to sort after every version on disk (list_versions order = build order)."""
+    base = time.strftime("%Y%m%d-%H%M%S")
+    latest = max(list_versions(index_dir), default="")
+    if base > latest:
+        return base
+    # Same second as the newest version (or the clock went back): sort right after it.
+    stem, _, n = latest.partition(".")
+    return f"{stem}.{int(n) + 1 if n.isdigit() else 1:03d}"
+
+
+def prune_versions(index_dir: Path, keep: int) -> list[str]:
+    """
+    Delete all but the newest `keep` versions (the live one is always kept). Backends still
+    serving a deleted version keep their open mappings until they swap; returns deleted names.
+    """
+    live = current_version(index_dir)
+    old = [v for v in list_versions(index_dir) if v != live]
+    doomed = old[: max(len(old) - (keep - 1), 0)]
+    for name in doomed:
+        shutil.rmtree(index_dir / VERSIONS_DIR / name, ignore_errors=True)
+    return doomed
+
+
+def publish(staging: Path, index_dir: Path, keep: int = 3) -> Path:
+    """
+    Turn the staging dir into a new version and make it live; returns the version dir.
+    The rename and the CURRENT swap are each atomic, so readers see the old version or the new
+    one, never a mix, and an interrupted publish leaves the old version (and its manifest) live.
+    """
+    versions = index_dir / VERSIONS_DIR
+    versions.mkdir(exist_ok=True)
+    name = _new_version_name(index_dir)
+    os.rename(staging, versions / name)
+    tmp = index_dir / f"{CURRENT_FILE}.tmp"
+    tmp.write_text(name + "\n", encoding="utf-8")
+    os.replace(tmp, index_dir / CURRENT_FILE)
+    prune_versions(index_dir, keep)
+    return versions / name
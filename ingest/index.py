@@ -0,0 +1,379 @@
+"""
+FAISS index construction and search-time tuning.
+
+INDEX_TYPE selects the index built by ingest (all inner product over L2-normalized vectors):
+- flat      exact brute force (IndexFlatIP); cost grows linearly with corpus size
+- flat_fp16 brute force over float16 vectors (half the RAM of flat, near-identical scores)
+- flat_sq8  brute force over 8-bit scalar-quantized vectors (a quarter of flat; trained ranges)
+- binary    1 bit/dim codes (above/below the trained per-dimension median) searched by Hamming
+            distance (1/32 of flat in RAM), then the INDEX_RESCORE * k best re-scored exactly
+            against float32 vectors memory-mapped from vectors.npy: only the shortlist is paged in
+- ivf_flat  inverted lists over k-means cells; searches INDEX_NPROBE of INDEX_NLIST cells
+- ivf_pq    as ivf_flat, with product-quantized vectors (INDEX_PQ_M x INDEX_PQ_NBITS bits)
+- hnsw      graph index (INDEX_HNSW_M links/node); INDEX_EF_SEARCH trades recall for speed
+
+Vector ids are chunk-store rows. Flat types are wrapped in IndexIDMap2 (binary in
+IndexBinaryIDMap2) and IVF indexes take ids natively, so incremental re-ingest can remove_ids()
+for changed files; hnsw cannot remove.
+
+Use read_index() / write_index() from here rather than faiss's: they also handle binary, which
+is a faiss binary index plus vectors.npy and binary_thresholds.npy. read_index(mmap=True) maps
+the vector data read-only instead of copying it, so uvicorn workers share one copy in the page
+cache (files are only ever replaced, never rewritten in place, so a mapped index stays valid).
+Search parameters are not fully persisted, so the backend calls apply_search_params() after
+every read_index.
+"""
+
+import math
+from pathlib import Path
+
+import numpy as np
+
+from config import settings
+
+INDEX_TYPES = ("flat", "flat_fp16", "flat_sq8", "binary", "ivf_flat", "ivf_pq", "hnsw")
+# Filled as vectors arrive; the other types need training (spilled, then trained in finish()).
+DIRECT_TYPES = ("flat", "flat_fp16", "hnsw")
+VECTORS_FILE = "vectors.npy"  # binary: float32 vectors for re-scoring, row = id
+THRESHOLDS_FILE = "binary_thresholds.npy"  # binary: per-dimension bit thresholds
+QUANTIZER_TRAIN_SIZE = 65_536  # flat_sq8 ranges / binary thresholds
+
+# FAISS warns below ~39 training points per centroid; PQ needs 2**nbits points per sub-quantizer.
+MIN_POINTS_PER_CENTROID = 39
+
+
+def auto_nlist(n: int) -> int:
+    """Rule of thumb: ~4*sqrt(N) cells, capped so each cell has enough training points."""
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+
+
+def training_sample(vectors: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    """Uniform random sample (without replacement) for k-means / PQ training."""
+    if size <= 0 or size >= len(vectors):
+        return vectors
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(vectors), size=size, replace=False))
+    return vectors[rows]
+
+
+def binarize(vectors: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """One bit per dimension (above its threshold), packed 8 per byte (d must be a multiple of 8)."""
+    return np.packbits(vectors > thresholds, axis=1)
+
+
+class BinaryIndex:
+    """
+    Hamming search over binary codes, then exact re-scoring of a shortlist with float vectors.
+    Thresholds are per-dimension medians rather than 0: embedding dimensions are not centered,
+    and median splits keep every bit informative.
+
+    Exposes the faiss methods the rest of the code uses (ntotal, add_with_ids, remove_ids,
+    search returning (scores, ids)). Vectors added since load are kept in memory and merged
+    into the id-indexed float array when it is next needed.
+    """
+
+    def __init__(self, thresholds: np.ndarray, codes=None, vectors: np.ndarray | None = None) -> None:
+        import faiss
+
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        d = self.d = len(self.thresholds)
+        self.codes = codes if codes is not None else faiss.IndexBinaryIDMap2(faiss.IndexBinaryFlat(d))
+        self.vectors = vectors if vectors is not None else np.empty((0, d), dtype=np.float32)
+        self.rescore = settings.index_rescore
+        self._added: list[tuple[np.ndarray, np.ndarray]] = []
+
+    @property
+    def ntotal(self) -> int:
+        return self.codes.ntotal
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        vectors = np.array(vectors, dtype=np.float32)  # a copy: callers may reuse the batch buffer
+        self.codes.add_with_ids(binarize(vectors, self.thresholds), ids)
+        self._added.append((np.asarray(ids, dtype=np.int64), vectors))
+
+    def remove_ids(self, ids: np.ndarray) -> int:
+        return self.codes.remove_ids(ids)  # float rows stay; nothing points at them any more
+
+    def float_vectors(self) -> np.ndarray:
+        """Float vectors indexed by id (rows added since load merged in)."""
+        if self._added:
+            n = max(len(self.vectors), max(int(ids.max()) + 1 for ids, _ in self._added))
+            merged = np.zeros((n, self.d), dtype=np.float32)
+            merged[:len(self.vectors)] = self.vectors
+            for ids, vectors in self._added:
+                merged[ids] = vectors
+            self.vectors, self._added = merged, []
+        return self.vectors
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        vectors = self.float_vectors()
+        shortlist = max(1, min(self.ntotal, k * self.rescore))
+        _, cand = self.codes.search(binarize(queries, self.thresholds), shortlist)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for r, q in enumerate(queries):
+            c = np.sort(cand[r][cand[r] >= 0])  # ascending ids: sequential reads of the mmap
+            exact = vectors[c] @ q
+            top = np.argsort(-exact, kind="stable")[:k]
+            ids[r, :len(top)] = c[top]
+            scores[r, :len(top)] = exact[top]
+        return scores, ids
+
+
+def read_index(path: Path, mmap: bool = False):
+    """faiss.read_index, or a BinaryIndex when path holds a faiss binary index. mmap: read-only."""
+    import faiss
+
+    flags = 0
+    if mmap:
+        # MMAP_IFC maps flat/SQ codes, IVF lists and HNSW storage (faiss >= 1.10; plain MMAP
+        # before that only covers IVF lists).
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    with open(path, "rb") as f:
+        is_binary = f.read(2) == b"IB"  # fourcc of every faiss binary index type
+    if not is_binary:
+        return faiss.read_index(str(path), flags)
+    codes = faiss.read_index_binary(str(path), flags)
+    vectors = np.load(path.parent / VECTORS_FILE, mmap_mode="r")
+    return BinaryIndex(np.load(path.parent / THRESHOLDS_FILE), codes, vectors)
+
+
+def write_index(index, path: Path) -> None:
+    """faiss.write_index; a BinaryIndex also writes its float vectors next to path."""
+    import faiss
+
+    if isinstance(index, BinaryIndex):
+        faiss.write_index_binary(index.codes, str(path))
+        np.save(path.parent / VECTORS_FILE, index.float_vectors())
+        np.save(path.parent / THRESHOLDS_FILE, index.thresholds)
+    else:
+        faiss.write_index(index, str(path))
+
+
+def _empty_direct(index_type: str, d: int):
+    """Empty index of a type that needs no training."""
+    import faiss
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, settings.index_hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = settings.index_ef_construction
+        return index
+    if index_type == "flat_fp16":
+        return faiss.IndexIDMap2(
+            faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        )
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+
+
+def build_index(vectors: np.ndarray, index_type: str | None = None, ids: np.ndarray | None = None):
+    """
+    Build and fill an index of INDEX_TYPE (or index_type) over L2-normalized float32 vectors,
+    with ids (default 0..N-1). Falls back to flat when the corpus is too small to train the
+    requested index. Returns (index, description).
+    """
+    index_type = (index_type or settings.index_type).lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown INDEX_TYPE {index_type!r}; choose one of {INDEX_TYPES}")
+    n, d = vectors.shape
+    if ids is None:
+        ids = np.arange(n, dtype=np.int64)
+
+    if index_type == "hnsw":
+        index = _empty_direct(index_type, d)
+        if not np.array_equal(ids, np.arange(n)):
+            raise ValueError("hnsw only supports sequential ids; rebuild fully")
+        index.add(vectors)
+    elif index_type in DIRECT_TYPES:
+        index = _empty_direct(index_type, d)
+        index.add_with_ids(vectors, ids)
+    else:
+        index = _trained(vectors, index_type)
+        index.add_with_ids(vectors, ids)
+    apply_search_params(index)
+    return index, describe(index)
+
+
+class StreamingIndexBuilder:
+    """
+    Build an INDEX_TYPE index from vectors arriving in batches, without holding them all in RAM.
+    DIRECT_TYPES take each batch directly. IVF types, flat_sq8 and binary need training first
+    (and the right nlist depends on the final N), so their vectors are spilled to raw files in spill_dir;
+    finish() trains on a random sample of the spill and adds it back in batches.
+    """
+
+    ADD_BATCH = 65_536
+
+    def __init__(self, spill_dir: Path, index_type: str | None = None) -> None:
+        self.index_type = (index_type or settings.index_type).lower()
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown INDEX_TYPE {self.index_type!r}; choose one of {INDEX_TYPES}")
+        self.spill_dir = spill_dir
+        self.ntotal = 0
+        self._d = 0
+        self._index = None
+        self._vec_file = None
+        self._id_file = None
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        if not self._d:
+            self._d = vectors.shape[1]
+            if self.index_type in DIRECT_TYPES:
+                self._index = _empty_direct(self.index_type, self._d)
+            else:
+                self._vec_file = open(self.spill_dir / "spill_vectors.f32", "wb")
+                self._id_file = open(self.spill_dir / "spill_ids.i64", "wb")
+        if self.index_type == "hnsw":
+            if ids[0] != self.ntotal:
+                raise ValueError("hnsw only supports sequential ids; rebuild fully")
+            self._index.add(vectors)
+        elif self._index is not None:
+            self._index.add_with_ids(vectors, ids)
+        else:
+            self._vec_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            self._id_file.write(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+        self.ntotal += len(vectors)
+
+    def finish(self):
+        """Return (index, description)."""
+        if self._index is not None:
+            apply_search_params(self._index)
+            return self._index, describe(self._index)
+        self._vec_file.close()
+        self._id_file.close()
+        vec_path = self.spill_dir / "spill_vectors.f32"
+        id_path = self.spill_dir / "spill_ids.i64"
+        vectors = np.memmap(vec_path, dtype=np.float32, mode="r").reshape(-1, self._d)
+        ids = np.memmap(id_path, dtype=np.int64, mode="r")
+        try:
+            index = _trained(vectors, self.index_type)
+            for i in range(0, len(vectors), self.ADD_BATCH):
+                index.add_with_ids(
+                    np.ascontiguousarray(vectors[i:i + self.ADD_BATCH]),
+                    np.ascontiguousarray(ids[i:i + self.ADD_BATCH]),
+                )
+        finally:
+            del vectors, ids
+            vec_path.unlink()
+            id_path.unlink()
+        apply_search_params(index)
+        return index, describe(index)
+
+
+def _trained(vectors: np.ndarray, index_type: str):
+    """Empty, trained flat_sq8, binary or IVF index for vectors (IndexIDMap2 flat if too few for IVF)."""
+    import faiss
+
+    n, d = vectors.shape
+    if index_type in ("flat_sq8", "binary"):
+        sample = np.ascontiguousarray(training_sample(vectors, settings.index_train_size or QUANTIZER_TRAIN_SIZE))
+        if index_type == "binary":
+            return BinaryIndex(np.median(sample, axis=0))
+        sq = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        sq.train(sample)
+        return faiss.IndexIDMap2(sq)
+    nlist = settings.index_nlist or auto_nlist(n)
+    min_train = nlist * MIN_POINTS_PER_CENTROID
+    if index_type == "ivf_pq":
+        min_train = max(min_train, 2 ** settings.index_pq_nbits * MIN_POINTS_PER_CENTROID)
+    if n < min_train:
+        print(f"  {index_type}: {n} vectors < {min_train} needed to train; using flat")
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+    quantizer = faiss.IndexFlatIP(d)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexIVFPQ(
+            quantizer, d, nlist, settings.index_pq_m, settings.index_pq_nbits,
+            faiss.METRIC_INNER_PRODUCT,
+        )
+    train_size = settings.index_train_size or min(n, max(min_train, nlist * 256))
+    index.train(np.ascontiguousarray(training_sample(vectors, train_size)))
+    return index
+
+
+def unwrap(index):
+    """Innermost concrete index (through IndexIDMap/IndexIDMap2); a BinaryIndex as is."""
+    import faiss
+
+    if isinstance(index, BinaryIndex):
+        return index
+    inner = faiss.downcast_index(index)
+    while isinstance(inner, faiss.IndexIDMap):  # IndexIDMap2 is a subclass
+        inner = faiss.downcast_index(inner.index)
+    return inner
+
+
+def supports_remove(index) -> bool:
+    """True if remove_ids() works (ID-mapped flat or IVF): needed for incremental re-ingest."""
+    import faiss
+
+    if isinstance(index, BinaryIndex):
+        return True
+    outer = faiss.downcast_index(index)
+    if isinstance(outer, faiss.IndexIDMap):
+        return True
+    try:
+        return faiss.extract_index_ivf(index) is not None
+    except RuntimeError:
+        return False
+
+
+# faiss's default BLAS threshold, read before the first change: 20 in releases that compare it
+# with the query count, 128000 in those that compare it with queries * d.
+_blas_default: int | None = None
+
+
+def _set_blas_threshold(d: int) -> None:
+    """BLAS for flat distances from settings.index_blas_threshold queries per search on."""
+    import faiss
+
+    global _blas_default
+    if _blas_default is None:
+        _blas_default = int(faiss.cvar.distance_compute_blas_threshold)
+    per_query = d if _blas_default > 1000 else 1
+    faiss.cvar.distance_compute_blas_threshold = settings.index_blas_threshold * per_query
+
+
+def apply_search_params(index) -> None:
+    """
+    Set nprobe (IVF), efSearch (HNSW) or the binary re-score shortlist from settings, and the
+    process-wide query count from which flat distances go through one BLAS matrix multiply.
+    """
+    import faiss
+
+    if isinstance(index, BinaryIndex):
+        index.rescore = settings.index_rescore
+        return
+    _set_blas_threshold(index.d)
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        ivf.nprobe = min(settings.index_nprobe, ivf.nlist)
+        return
+    inner = unwrap(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = settings.index_ef_search
+
+
+def describe(index) -> str:
+    """Short label like 'ivf_pq(nlist=1024,nprobe=16)' for logs and /ready."""
+    import faiss
+
+    if isinstance(index, BinaryIndex):
+        return f"binary(rescore={index.rescore}x)"
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        kind = "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+        return f"{kind}(nlist={ivf.nlist},nprobe={ivf.nprobe})"
+    inner = unwrap(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return f"hnsw(M={inner.hnsw.nb_neighbors(1)},efSearch={inner.hnsw.efSearch})"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return "flat_fp16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "flat_sq8"
+    return "flat" if isinstance(inner, faiss.IndexFlat) else type(inner).__name__
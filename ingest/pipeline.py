@@ -0,0 +1,240 @@
+"""
+Streaming ingest pipeline: parallel read + chunk → bounded embed batches → caller's sink.
+
+Stage 1 reads and chunks files in a process pool (INGEST_WORKERS), one tokenizer per worker.
+Results come back in file order through a bounded window of in-flight files. Stage 2 encodes
+INGEST_EMBED_BATCH chunks at a time and passes each batch to sink(batch, embeddings), which
+appends to the FAISS index and chunk store. Peak memory is one embed batch plus the window,
+independent of corpus size.
+"""
+
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from config import settings
+from ingest.chunk import Chunk, chunk_spans
+
+# In-flight files per worker: enough to keep workers busy while the main process embeds.
+WINDOW_PER_WORKER = 8
+
+ChunkRow = tuple[str, Chunk, int]  # (path, chunk, chunk_id)
+Sink = Callable[[list[ChunkRow], Any], None]  # (batch, float32 embeddings)
+
+_tokenizer = None  # per worker process
+
+
+def _init_worker(model_name: str) -> None:
+    global _tokenizer
+    import os
+
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    from transformers import AutoTokenizer
+
+    _tokenizer = AutoTokenizer.from_pretrained(model_name)
+    # We intentionally tokenize long files for chunking; avoid max-length warnings.
+    _tokenizer.model_max_length = 1_000_000
+
+
+def _read_and_chunk(path: str, tokenizer=None) -> tuple[list[Chunk] | None, str | None]:
+    """Return (chunks, None) or (None, error) for one file."""
+    try:
+        text = Path(path).read_text(encoding="utf-8", errors="replace")
+    except Exception as e:
+        return None, str(e)
+    chunks = chunk_spans(text, tokenizer or _tokenizer)
+    if not settings.ingest_embed_from_ids:
+        for c in chunks:
+            c.ids = None  # don't ship ids back from workers if they won't be used
+    return chunks, None
+
+
+@dataclass
+class PipelineStats:
+    files: int = 0
+    skipped: int = 0
+    chunks: int = 0
+    embedded: int = 0
+    cache_hits: int = 0
+    chunk_s: float = 0.0  # stage 1 wall time: start → last file chunked
+    embed_s: float = 0.0  # time inside model.encode
+    sink_s: float = 0.0  # time inside sink (index add + store append)
+    wall_s: float = 0.0
+
+    def report(self) -> str:
+        def rate(n: int, s: float) -> str:
+            return f"{n / s:,.1f}/s" if s > 0 else "-"
+
+        return (
+            f"read+chunk: {self.files} files ({rate(self.files, self.chunk_s)}), "
+            f"{self.chunks} chunks ({rate(self.chunks, self.chunk_s)}); "
+            f"embed: {self.embedded} ({rate(self.embedded, self.embed_s)}"
+            + (f", cache hit rate {self.cache_hits / self.embedded:.1%}" if self.embedded else "")
+            + "); "
+            f"index+store: {rate(self.embedded, self.sink_s)}; "
+            f"wall {self.wall_s:.1f}s"
+            + (f"; {self.skipped} files skipped" if self.skipped else "")
+        )
+
+
+def iter_chunked(files: list[Path], tokenizer, workers: int) -> Iterator[tuple[Path, list[Chunk] | None, str | None]]:
+    """Yield (file, chunks, error) in file order; chunking runs in `workers` processes when > 1."""
+    if workers <= 1:
+        for fp in files:
+            yield (fp, *_read_and_chunk(str(fp), tokenizer))
+        return
+    import multiprocessing as mp
+
+    from ingest.run import EMBED_MODEL
+
+    # spawn: the parent has torch loaded; forking it is unsafe and wastes memory.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(EMBED_MODEL,),
+    ) as pool:
+        pending: deque = deque()
+        todo = iter(files)
+        for fp in todo:
+            pending.append((fp, pool.submit(_read_and_chunk, str(fp))))
+            if len(pending) >= workers * WINDOW_PER_WORKER:
+                break
+        while pending:
+            fp, fut = pending.popleft()
+            nxt = next(todo, None)
+            if nxt is not None:
+                pending.append((nxt, pool.submit(_read_and_chunk, str(nxt))))
+            yield (fp, *fut.result())
+
+
+def _encode(model, texts: list[str]):
+    import faiss
+    import numpy as np
+
+    embeddings = model.encode(texts, batch_size=settings.ingest_encode_batch, show_progress_bar=False)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def _special_tokens(tok) -> tuple[list[int], list[int]]:
+    """Ids the tokenizer wraps around a single sequence (e.g. [CLS] ... [SEP]), found by probing."""
+    inner = tok("a", add_special_tokens=False)["input_ids"]
+    full = tok("a", add_special_tokens=True)["input_ids"]
+    for i in range(len(full) - len(inner) + 1):
+        if full[i:i + len(inner)] == inner:
+            return full[:i], full[i + len(inner):]
+    return [], []
+
+
+def _encode_ids(model, ids_list: list[list[int]]):
+    """
+    Encode pre-tokenized chunks (no special tokens) without re-tokenizing their text: add
+    special tokens, pad per length-sorted batch, and run the SentenceTransformer modules.
+    """
+    import faiss
+    import numpy as np
+    import torch
+
+    tok = model.tokenizer
+    prefix, suffix = _special_tokens(tok)
+    # Same truncation model.encode applies to text: max_seq_length including special tokens.
+    room = model.max_seq_length - len(prefix) - len(suffix)
+    with_type_ids = "token_type_ids" in tok.model_input_names
+    out = np.empty((len(ids_list), model.get_sentence_embedding_dimension()), dtype=np.float32)
+    order = sorted(range(len(ids_list)), key=lambda i: len(ids_list[i]))
+    bs = settings.ingest_encode_batch
+    for s in range(0, len(order), bs):
+        rows = order[s:s + bs]
+        seqs = [prefix + list(ids_list[i][:room]) + suffix for i in rows]
+        width = max(len(q) for q in seqs)
+        input_ids = torch.full((len(seqs), width), tok.pad_token_id or 0, dtype=torch.long)
+        mask = torch.zeros((len(seqs), width), dtype=torch.long)
+        for r, q in enumerate(seqs):
+            input_ids[r, :len(q)] = torch.tensor(q, dtype=torch.long)
+            mask[r, :len(q)] = 1
+        features = {"input_ids": input_ids.to(model.device), "attention_mask": mask.to(model.device)}
+        if with_type_ids:
+            features["token_type_ids"] = torch.zeros_like(features["input_ids"])
+        with torch.no_grad():
+            emb = model(features)["sentence_embedding"]
+        out[rows] = emb.float().cpu().numpy()
+    faiss.normalize_L2(out)
+    return out
+
+
+def embed(model, texts: list[str], cache=None, ids: list[list[int]] | None = None):
+    """
+    Encode texts into L2-normalized float32 vectors, encoding only cache misses if a cache is
+    given. With ids (token ids per text, from chunk_spans) the model skips re-tokenization.
+    """
+    def encode(rows: list[int]):
+        if ids is not None:
+            return _encode_ids(model, [ids[i] for i in rows])
+        return _encode(model, [texts[i] for i in rows])
+
+    if cache is None:
+        return encode(list(range(len(texts))))
+    keys, out, missing = cache.lookup(texts)
+    if missing:
+        vectors = encode(missing)
+        out[missing] = vectors
+        cache.put([keys[i] for i in missing], vectors)
+    return out
+
+
+def run(
+    files: list[Path], repo_path: Path, model, sink: Sink, cache=None
+) -> tuple[dict[str, int], PipelineStats]:
+    """
+    Chunk and embed files, calling sink(batch, embeddings) per INGEST_EMBED_BATCH chunks in file
+    order; cache (ingest.embed_cache.EmbeddingCache) skips encoding of already-seen chunk texts.
+    Returns ({path: chunk count} for files that were read, stats).
+    """
+    stats = PipelineStats()
+    counts: dict[str, int] = {}
+    batch: list[ChunkRow] = []
+    t_start = time.perf_counter()
+    workers = settings.ingest_workers
+
+    def flush() -> None:
+        t0 = time.perf_counter()
+        hits_before = cache.hits if cache is not None else 0
+        ids = [c.ids for (_, c, _) in batch]
+        embeddings = embed(model, [c.text for (_, c, _) in batch], cache, ids if all(ids) else None)
+        if cache is not None:
+            stats.cache_hits += cache.hits - hits_before
+        t1 = time.perf_counter()
+        sink(batch, embeddings)
+        t2 = time.perf_counter()
+        stats.embed_s += t1 - t0
+        stats.sink_s += t2 - t1
+        stats.embedded += len(batch)
+        print(f"  {stats.files}/{len(files)} files, {stats.embedded} chunks embedded")
+        batch.clear()
+
+    for fp, chunks, err in iter_chunked(files, model.tokenizer, workers):
+        rel = str(fp.relative_to(repo_path))
+        if err is not None:
+            print(f"  Skip {rel}: {err}")
+            stats.skipped += 1
+            continue
+        stats.files += 1
+        stats.chunks += len(chunks)
+        counts[rel] = len(chunks)
+        batch.extend((rel, c, i) for i, c in enumerate(chunks))
+        if len(batch) >= settings.ingest_embed_batch:
+            flush()
+    stats.chunk_s = time.perf_counter() - t_start
+    if workers <= 1:
+        # Serial: embedding ran between files rather than alongside chunking.
+        stats.chunk_s -= stats.embed_s + stats.sink_s
+    if batch:
+        flush()
+    stats.wall_s = time.perf_counter() - t_start
+    return counts, stats
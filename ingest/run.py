@@ -1,6 +1,10 @@
 """
-Ingest pipeline: clone Transformers → chunk → embed → FAISS.
+Ingest pipeline: clone Transformers → chunk → embed → FAISS (+ BM25 postings, ingest.lexical).
 Run from repo root: uv run python -m ingest
+
+Re-runs are incremental (INGEST_INCREMENTAL=true): only added/modified files are embedded,
+vectors of deleted/modified files are removed. Every run publishes a new index version that a
+running backend picks up without a restart. See ingest.incremental.
 """
 import os
 import warnings
@@ -8,24 +12,209 @@ import warnings
 # Before any tokenizer/transformers imports
 os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
 # Apply warning filters to subprocesses too (resource_tracker can warn from helper processes).
-# Format: action:message:category:module:lineno
+# Format: action:message:category:module:lineno (no ':' allowed inside fields; chunking workers
+# are spawned processes and reject the whole option otherwise).
 os.environ.setdefault(
     "PYTHONWARNINGS",
-    "ignore:resource_tracker: There appear to be .* leaked semaphore objects.*:UserWarning:multiprocessing.resource_tracker:0",
+    "ignore::UserWarning:multiprocessing.resource_tracker",
 )
 warnings.filterwarnings("ignore", message=".*resource_tracker.*leaked semaphore.*", category=UserWarning)
 
-import json
+import shutil
 import sys
+import time
 from pathlib import Path
 
 from config import settings
-from ingest.chunk import chunk_text
+from ingest import incremental, lexical, pipeline
+from ingest.chunk import CHUNK_TOKENS, CHUNKER_VERSION, OVERLAP_TOKENS
+from ingest.embed_cache import EmbeddingCache
+from ingest.index import StreamingIndexBuilder, describe, read_index, supports_remove, write_index
 from ingest.repo import ensure_repo, list_files
+from ingest.store import TEXT_FILE, ChunkStore, ChunkStoreWriter, exists as store_exists
 
 # Embedding model: good quality, 512 max length, runs on CPU/MPS
 EMBED_MODEL = "BAAI/bge-small-en-v1.5"
-BATCH_SIZE = 128  # Larger batch = faster encode on most machines
+
+
+def _build_params() -> dict:
+    """Anything that changes every vector or the index layout; a manifest mismatch forces a full rebuild."""
+    return {
+        "embed_model": EMBED_MODEL,
+        "chunk_tokens": CHUNK_TOKENS,
+        "overlap_tokens": OVERLAP_TOKENS,
+        "chunker": CHUNKER_VERSION,
+        "index_type": settings.index_type,
+        "index_nlist": settings.index_nlist,
+        "index_pq_m": settings.index_pq_m,
+        "index_pq_nbits": settings.index_pq_nbits,
+        "index_hnsw_m": settings.index_hnsw_m,
+    }
+
+
+def _record_files(
+    manifest: dict, rels: list[str], counts: dict[str, int], hashes: dict[str, str], first_id: int
+) -> None:
+    """
+    Add {sha256, ids: [start, end)} entries for the files in rels; chunks were appended in counts'
+    order from first_id. Files the pipeline skipped get an empty range, so they are retried only
+    once their content changes.
+    """
+    next_id = first_id
+    for rel, n in counts.items():
+        manifest["files"][rel] = {"sha256": hashes[rel], "ids": [next_id, next_id + n]}
+        next_id += n
+    for rel in rels:
+        if rel not in counts:
+            manifest["files"][rel] = {"sha256": hashes[rel], "ids": [next_id, next_id]}
+
+
+def _build_lexical(staging: Path) -> None:
+    """BM25 postings over the staged chunk store (ingest.lexical), rebuilt in full each run."""
+    t0 = time.perf_counter()
+    meta = lexical.build(staging, ChunkStore(staging))
+    print(f"BM25 index: {meta['docs']} docs in {time.perf_counter() - t0:.1f}s")
+
+
+def _publish(staging: Path, index_dir: Path) -> Path:
+    version_dir = incremental.publish(staging, index_dir, settings.index_keep_versions)
+    print(f"Published version {version_dir.name} ({index_dir / incremental.CURRENT_FILE})")
+    return version_dir
+
+
+def _open_cache(model) -> EmbeddingCache | None:
+    if not settings.embed_cache:
+        return None
+    cache = EmbeddingCache(settings.embed_cache_path, EMBED_MODEL, model.get_sentence_embedding_dimension())
+    print(f"Embedding cache: {cache.dir} ({len(cache)} vectors)")
+    return cache
+
+
+def _full_build(
+    index_dir: Path, files: list[Path], repo_path: Path, model, hashes: dict[str, str], cache
+) -> None:
+    import numpy as np
+
+    staging = incremental.staging_dir(index_dir)
+    builder = StreamingIndexBuilder(staging)
+    with ChunkStoreWriter(staging) as store:
+        def sink(batch: list[pipeline.ChunkRow], embeddings) -> None:
+            first = len(store)
+            builder.add(embeddings, np.arange(first, first + len(batch), dtype=np.int64))
+            for (p, chunk, c) in batch:
+                store.add(p, chunk.text, c, (chunk.start_line, chunk.end_line))
+
+        counts, stats = pipeline.run(files, repo_path, model, sink, cache)
+    print(f"Chunks: {stats.chunks}")
+    print(f"Throughput: {stats.report()}")
+
+    if not stats.chunks:
+        print("No chunks; nothing to save.")
+        shutil.rmtree(staging)
+        return
+
+    print(f"Building {settings.index_type} index...")
+    index, index_desc = builder.finish()
+    write_index(index, staging / "index.faiss")
+    _build_lexical(staging)
+    manifest = incremental.new_manifest(_build_params())
+    _record_files(manifest, list(hashes), counts, hashes, 0)
+    incremental.save_manifest(staging, manifest)
+    version_dir = _publish(staging, index_dir)
+
+    index_file = version_dir / "index.faiss"
+    size_mb = index_file.stat().st_size / (1024 * 1024)
+    print(f"Saved: {index_file} ({index_desc}, {size_mb:.2f} MB), {version_dir / TEXT_FILE} ({len(store)} chunks)")
+
+
+def _incremental_build(
+    index_dir: Path,
+    live: Path,
+    index,
+    manifest: dict,
+    files: list[Path],
+    repo_path: Path,
+    model,
+    hashes: dict[str, str],
+    cache,
+) -> None:
+    import numpy as np
+
+    added, modified, deleted, unchanged = incremental.diff(manifest, hashes)
+    reused = sum(manifest["files"][rel]["ids"][1] - manifest["files"][rel]["ids"][0] for rel in unchanged)
+    print(
+        f"Incremental: {len(added)} added, {len(modified)} modified, {len(deleted)} deleted, "
+        f"{len(unchanged)} unchanged ({reused} chunks reused without re-embedding)"
+    )
+    if not (added or modified or deleted):
+        print("Index is up to date; nothing to do.")
+        return
+
+    stale: list[int] = []
+    for rel in modified + deleted:
+        start, end = manifest["files"].pop(rel)["ids"]
+        stale.extend(range(start, end))
+    if stale:
+        index.remove_ids(np.array(stale, dtype=np.int64))
+
+    todo = set(added) | set(modified)
+    old_store = ChunkStore(live)
+    first_id = len(old_store)
+    staging = incremental.staging_dir(index_dir)
+    stale_set = set(stale)
+    tombstones = 0
+    with ChunkStoreWriter(staging) as store:
+        for i in range(len(old_store)):
+            row = old_store[i]
+            if i in stale_set or row["chunk_id"] < 0:
+                store.add_tombstone()
+                tombstones += 1
+            else:
+                store.add(row["path"], row["text"], row["chunk_id"], tuple(row.get("lines", (0, 0))))
+
+        def sink(batch: list[pipeline.ChunkRow], embeddings) -> None:
+            first = len(store)
+            index.add_with_ids(embeddings, np.arange(first, first + len(batch), dtype=np.int64))
+            for (p, chunk, c) in batch:
+                store.add(p, chunk.text, c, (chunk.start_line, chunk.end_line))
+
+        counts, stats = pipeline.run(
+            [fp for fp in files if str(fp.relative_to(repo_path)) in todo], repo_path, model, sink, cache
+        )
+    print(f"Throughput: {stats.report()}")
+
+    write_index(index, staging / "index.faiss")
+    _build_lexical(staging)
+    _record_files(manifest, sorted(todo), counts, hashes, first_id)
+    incremental.save_manifest(staging, manifest)
+    version_dir = _publish(staging, index_dir)
+
+    print(
+        f"Saved: {version_dir / 'index.faiss'} ({describe(index)}, {index.ntotal} vectors): "
+        f"embedded {stats.embedded} chunks from {len(todo)} files, removed {len(stale)} vectors"
+    )
+    if tombstones > len(store) // 2:
+        print(f"  {tombstones}/{len(store)} store rows are tombstones; INGEST_INCREMENTAL=false compacts.")
+
+
+def _build(
+    index_dir: Path, files: list[Path], repo_path: Path, model, hashes: dict[str, str], cache
+) -> None:
+    """Incremental build when the manifest matches and the index supports removal, else full."""
+    live = incremental.live_dir(index_dir)
+    index_file = live / "index.faiss"
+    manifest = incremental.load_manifest(live) if settings.ingest_incremental else None
+    if manifest is not None and index_file.exists() and store_exists(live):
+        if manifest["params"] != _build_params():
+            print("Build parameters changed since last ingest; full rebuild.")
+        else:
+            index = read_index(index_file)
+            if supports_remove(index):
+                _incremental_build(index_dir, live, index, manifest, files, repo_path, model, hashes, cache)
+                return
+            print(f"{describe(index)} index can't remove vectors; full rebuild.")
+
+    _full_build(index_dir, files, repo_path, model, hashes, cache)
 
 
 def main() -> None:
@@ -33,8 +222,6 @@ def main() -> None:
     if index_dir.suffix:
         index_dir = index_dir.parent
     index_dir.mkdir(parents=True, exist_ok=True)
-    index_file = index_dir / "index.faiss"
-    meta_file = index_dir / "metadata.json"
     print(f"Index output: {index_dir.resolve()}")
 
     repo_path = ensure_repo(settings.repo_path)
@@ -59,45 +246,23 @@ def main() -> None:
     else:
         print(f"Files to index: {len(files)} (full repo)")
 
-    chunks_with_meta: list[tuple[str, str, int]] = []  # (path, text, chunk_id)
+    hashes: dict[str, str] = {}
+    readable: list[Path] = []
     for fp in files:
+        rel = str(fp.relative_to(repo_path))
         try:
-            text = fp.read_text(encoding="utf-8", errors="replace")
-        except Exception as e:
-            print(f"  Skip {fp.relative_to(repo_path)}: {e}")
+            hashes[rel] = incremental.file_sha256(fp)
+        except OSError as e:
+            print(f"  Skip {rel}: {e}")
             continue
-        rel = str(fp.relative_to(repo_path))
-        for i, chunk in enumerate(chunk_text(text, tokenizer)):
-            chunks_with_meta.append((rel, chunk, i))
-
-    print(f"Chunks: {len(chunks_with_meta)}")
-
-    if not chunks_with_meta:
-        print("No chunks; nothing to save.")
-        return
-
-    texts = [t for (_, t, _) in chunks_with_meta]
-    print("Embedding...")
-    embeddings = model.encode(texts, batch_size=BATCH_SIZE, show_progress_bar=True)
-
-    import faiss
-    import numpy as np
-
-    d = embeddings.shape[1]
-    index = faiss.IndexFlatIP(d)
-    faiss.normalize_L2(embeddings)
-    index.add(embeddings.astype(np.float32))
-
-    index_file.parent.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(index, str(index_file))
-    metadata = [
-        {"path": p, "text": t, "chunk_id": c}
-        for (p, t, c) in chunks_with_meta
-    ]
-    meta_file.write_text(json.dumps(metadata, indent=0), encoding="utf-8")
-
-    size_mb = index_file.stat().st_size / (1024 * 1024)
-    print(f"Saved: {index_file} ({size_mb:.2f} MB), {meta_file} ({len(metadata)} chunks)")
+        readable.append(fp)
+    files = readable
+    cache = _open_cache(model)
+    try:
+        _build(index_dir, files, repo_path, model, hashes, cache)
+    finally:
+        if cache is not None:
+            cache.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+"""
+Compact on-disk chunk store (replaces metadata.json).
+
+Layout in the index dir:
+- chunks.bin   UTF-8 chunk texts, concatenated
+- chunks.npy   one row per chunk: (offset, length) into chunks.bin, path index, chunk_id,
+               start/end source line (0 when unknown)
+- paths.json   unique file paths (small; loaded into memory)
+
+The reader memory-maps chunks.bin and chunks.npy, so worker processes share them through
+the OS page cache and only the top-k hits are ever decoded into Python objects.
+
+Convert an existing index: uv run python -m ingest.store [INDEX_DIR]
+"""
+
+import json
+import mmap
+import sys
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+TEXT_FILE = "chunks.bin"
+TABLE_FILE = "chunks.npy"
+PATHS_FILE = "paths.json"
+LEGACY_META_FILE = "metadata.json"
+
+ROW_DTYPE = np.dtype([
+    ("offset", "<i8"),
+    ("length", "<i4"),
+    ("path", "<i4"),
+    ("chunk_id", "<i4"),
+    ("start_line", "<i4"),
+    ("end_line", "<i4"),
+])
+
+
+def exists(index_dir: Path) -> bool:
+    return all((index_dir / f).exists() for f in (TEXT_FILE, TABLE_FILE, PATHS_FILE))
+
+
+class ChunkStoreWriter:
+    """
+    Append chunks one at a time; text goes straight to disk, the row table (28 bytes/row in
+    typed arrays) is written on close().
+    """
+
+    def __init__(self, index_dir: Path) -> None:
+        self.index_dir = index_dir
+        self._text = open(index_dir / TEXT_FILE, "wb")
+        self._cols = {name: array("q" if name == "offset" else "i") for name in ROW_DTYPE.names}
+        self._paths: list[str] = []
+        self._path_ids: dict[str, int] = {}
+        self._offset = 0
+
+    def add(self, path: str, text: str, chunk_id: int, lines: tuple[int, int] = (0, 0)) -> None:
+        pid = self._path_ids.get(path)
+        if pid is None:
+            pid = self._path_ids[path] = len(self._paths)
+            self._paths.append(path)
+        data = text.encode("utf-8")
+        self._text.write(data)
+        self._append(self._offset, len(data), pid, chunk_id, *lines)
+        self._offset += len(data)
+
+    def add_tombstone(self) -> None:
+        """Reserve a row (FAISS id) whose chunk was removed by an incremental re-ingest."""
+        self._append(self._offset, 0, -1, -1, 0, 0)
+
+    def _append(self, *row: int) -> None:
+        for col, v in zip(self._cols.values(), row):
+            col.append(v)
+
+    def __len__(self) -> int:
+        return len(self._cols["offset"])
+
+    def close(self) -> None:
+        self._text.close()
+        table = np.empty(len(self), dtype=ROW_DTYPE)
+        for name, col in self._cols.items():
+            table[name] = np.frombuffer(col, dtype=ROW_DTYPE[name]) if len(col) else []
+        np.save(self.index_dir / TABLE_FILE, table)
+        (self.index_dir / PATHS_FILE).write_text(json.dumps(self._paths), encoding="utf-8")
+
+    def __enter__(self) -> "ChunkStoreWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped chunk store. Supports len() and store[i] -> {path, text, chunk_id},
+    the same shape as an entry of the old metadata.json list. Row i is FAISS id i.
+    """
+
+    def __init__(self, index_dir: Path) -> None:
+        self._rows = np.load(index_dir / TABLE_FILE, mmap_mode="r")
+        self._has_lines = "start_line" in self._rows.dtype.names  # stores written before line ranges
+        self._paths: list[str] = json.loads((index_dir / PATHS_FILE).read_text(encoding="utf-8"))
+        with open(index_dir / TEXT_FILE, "rb") as f:
+            # mmap of an empty file is an error; an empty store has no rows to read anyway.
+            self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._rows.size else b""
+
+    def __len__(self) -> int:
+        return int(self._rows.shape[0])
+
+    def __getitem__(self, i: int) -> dict:
+        row = self._rows[i]
+        offset, length, pid, chunk_id = (int(row[f]) for f in ("offset", "length", "path", "chunk_id"))
+        if pid < 0:
+            return {"path": "", "text": "", "chunk_id": -1}  # tombstone
+        out = {
+            "path": self._paths[pid],
+            "text": self._text[offset:offset + length].decode("utf-8"),
+            "chunk_id": chunk_id,
+        }
+        if self._has_lines and row["start_line"]:
+            out["lines"] = [int(row["start_line"]), int(row["end_line"])]
+        return out
+
+    def prefix_paths(self, prefix: str) -> np.ndarray:
+        """Path-table indices of the paths starting with prefix (for prefix_mask)."""
+        return np.array([i for i, p in enumerate(self._paths) if p.startswith(prefix)], dtype=np.int32)
+
+    def prefix_mask(self, ids: np.ndarray, paths: np.ndarray) -> np.ndarray:
+        """True for each row id whose path index is in paths; reads only the row table, no text."""
+        return np.isin(self._rows["path"][ids], paths)
+
+
+def convert_metadata_json(index_dir: Path) -> int:
+    """Write the chunk store from an existing metadata.json in index_dir; return chunk count."""
+    metadata = json.loads((index_dir / LEGACY_META_FILE).read_text(encoding="utf-8"))
+    with ChunkStoreWriter(index_dir) as w:
+        for m in metadata:
+            w.add(m["path"], m["text"], int(m.get("chunk_id", 0)))
+    return len(metadata)
+
+
+def main() -> None:
+    from config import settings
+
+    index_dir = Path(sys.argv[1]).expanduser().resolve() if len(sys.argv) > 1 else settings.index_path
+    if index_dir.suffix:
+        index_dir = index_dir.parent
+    if not (index_dir / LEGACY_META_FILE).exists():
+        print(f"No {LEGACY_META_FILE} in {index_dir}; nothing to convert.")
+        sys.exit(1)
+    n = convert_metadata_json(index_dir)
+    size_mb = (index_dir / TEXT_FILE).stat().st_size / (1024 * 1024)
+    print(f"Converted {n} chunks: {index_dir / TEXT_FILE} ({size_mb:.2f} MB), {TABLE_FILE}, {PATHS_FILE}")
+    print(f"{LEGACY_META_FILE} is no longer read when the chunk store exists; delete it to save disk.")
+
+
+if __name__ == "__main__":
+    main()
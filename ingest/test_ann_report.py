@@ -0,0 +1,32 @@
+"""
+Tests for the ANN recall report (ingest.ann_report).
+Run: uv run pytest ingest/test_ann_report.py
+"""
+import json
+
+import numpy as np
+
+from ingest import ann_report
+from ingest.index import build_index, write_index
+
+
+def _vectors(n: int, d: int = 32) -> np.ndarray:
+    v = np.random.default_rng(0).standard_normal((n, d)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def test_recall_after_removed_ids(tmp_path, monkeypatch):
+    # Removing vectors (incremental re-ingest) leaves external ids that no longer match positions.
+    index, _ = build_index(_vectors(500), "flat")
+    index.remove_ids(np.arange(0, 500, 3, dtype=np.int64))
+    write_index(index, tmp_path / "index.faiss")
+
+    monkeypatch.setattr(ann_report.settings, "index_path", tmp_path)
+    monkeypatch.setattr(ann_report, "REPORT_TYPES", ("flat", "flat_fp16"))
+    report = tmp_path / "report.json"
+    monkeypatch.setattr("sys.argv", ["ann_report", "--k", "10", "--queries", "50", "--json", str(report)])
+    ann_report.main()
+
+    results = {r["index"]: r for r in json.loads(report.read_text(encoding="utf-8"))["results"]}
+    assert results["flat"]["recall"] == 1.0
+    assert results["flat_fp16"]["recall"] > 0.95
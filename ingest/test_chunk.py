@@ -0,0 +1,103 @@
+"""
+Tests for token-window chunking (ingest.chunk): exact source text, 1-based line ranges, overlap,
+and the slow-tokenizer fallback. Uses a small word-level tokenizer built in memory (no download).
+Run: uv run pytest ingest/test_chunk.py
+"""
+import pytest
+
+from ingest.chunk import chunk_spans, chunk_text_decode
+
+WORDS_PER_LINE = 7
+
+
+def _source(lines: int) -> str:
+    # Every word is unique and names its line: "l12w3" is word 3 on line 12.
+    body = "\n".join(" ".join(f"l{n}w{w}" for w in range(WORDS_PER_LINE)) for n in range(1, lines + 1))
+    return "\n\n" + body + "\n"  # leading blank lines: line numbers must still count them
+
+
+def _fast_tokenizer(text: str):
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {"[UNK]": 0, **{w: i + 1 for i, w in enumerate(dict.fromkeys(text.split()))}}
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tok.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    return PreTrainedTokenizerFast(tokenizer_object=tok, unk_token="[UNK]")
+
+
+class _SlowTokenizer:
+    """Whitespace words; encode/decode only (no offsets), like a Python tokenizer."""
+
+    is_fast = False
+
+    def __init__(self, text: str) -> None:
+        self.words = list(dict.fromkeys(text.split()))
+        self.ids = {w: i for i, w in enumerate(self.words)}
+
+    def encode(self, text: str, add_special_tokens: bool = False) -> list[int]:
+        return [self.ids[w] for w in text.split()]
+
+    def decode(self, ids: list[int], skip_special_tokens: bool = True) -> str:
+        return " ".join(self.words[i] for i in ids)
+
+
+def _line(word: str) -> int:
+    return int(word[1:word.index("w")])
+
+
+@pytest.fixture
+def text() -> str:
+    return _source(40)
+
+
+def test_chunks_are_exact_source_slices(text):
+    chunks = chunk_spans(text, _fast_tokenizer(text), chunk_size=30, overlap=8)
+    assert len(chunks) > 5
+    for c in chunks:
+        assert c.text in text  # a slice of the source, not re-decoded text
+        assert c.text == c.text.strip()
+        words = c.text.split()
+        assert len(words) == len(c.ids) <= 30
+        # Lines are 1-based and counted from the very start of the file (including blank lines).
+        assert c.start_line == _line(words[0]) + 2
+        assert c.end_line == _line(words[-1]) + 2
+        assert "\n".join(text.split("\n")[c.start_line - 1:c.end_line]).find(c.text) >= 0
+
+
+def test_windows_overlap_and_cover_everything(text):
+    tok = _fast_tokenizer(text)
+    chunks = chunk_spans(text, tok, chunk_size=30, overlap=8)
+    for a, b in zip(chunks, chunks[1:]):
+        assert a.ids[-8:] == b.ids[:8]
+        assert a.end_line >= b.start_line
+    all_ids = tok(text, add_special_tokens=False)["input_ids"]
+    assert chunks[0].ids[:8] == all_ids[:8]
+    assert chunks[-1].ids[-1] == all_ids[-1]
+    assert chunks[-1].end_line == 42
+
+
+def test_ids_match_chunk_text(text):
+    tok = _fast_tokenizer(text)
+    for c in chunk_spans(text, tok, chunk_size=30, overlap=8):
+        assert tok(c.text, add_special_tokens=False)["input_ids"] == c.ids
+
+
+def test_short_file_is_one_chunk():
+    short = "\n\n  first line\nsecond line  \n\n"
+    tok = _fast_tokenizer(short)
+    [c] = chunk_spans(short, tok, chunk_size=30, overlap=8)
+    assert c.text == "first line\nsecond line"
+    assert (c.start_line, c.end_line) == (3, 4)
+
+
+def test_blank_text_has_no_chunks(text):
+    assert chunk_spans("  \n\n ", _fast_tokenizer(text)) == []
+
+
+def test_slow_tokenizer_falls_back_to_decode(text):
+    tok = _SlowTokenizer(text)
+    chunks = chunk_spans(text, tok, chunk_size=30, overlap=8)
+    assert [c.text for c in chunks] == chunk_text_decode(text, tok, chunk_size=30, overlap=8)
+    assert all(c.start_line == c.end_line == 0 and c.ids is None for c in chunks)
+    assert len(chunks[0].text.split()) == 30
@@ -0,0 +1,95 @@
+"""
+Tests for the on-disk embedding cache (ingest.embed_cache) and its use in pipeline.embed.
+Run: uv run pytest ingest/test_embed_cache.py
+"""
+import numpy as np
+
+from ingest import pipeline
+from ingest.embed_cache import KEYS_FILE, VECTORS_FILE, EmbeddingCache, text_key
+
+DIM = 4
+
+
+def _vectors(n: int, start: int = 0) -> np.ndarray:
+    return np.arange(start * DIM, (start + n) * DIM, dtype=np.float32).reshape(n, DIM)
+
+
+class _Model:
+    """Counts encoded texts; vector i is one-hot at len(text) % DIM."""
+
+    def __init__(self) -> None:
+        self.encoded: list[str] = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.encoded.extend(texts)
+        out = np.zeros((len(texts), DIM), dtype=np.float32)
+        out[np.arange(len(texts)), [len(t) % DIM for t in texts]] = 2.0
+        return out
+
+
+def test_lookup_and_put(tmp_path):
+    cache = EmbeddingCache(tmp_path, "org/model", DIM)
+    keys, out, missing = cache.lookup(["a", "b"])
+    assert missing == [0, 1] and not out.any()
+    cache.put(keys, _vectors(2))
+    keys, out, missing = cache.lookup(["b", "c", "a"])
+    assert missing == [1]
+    np.testing.assert_array_equal(out[[0, 2]], _vectors(2)[[1, 0]])
+    assert (cache.hits, cache.misses) == (2, 3)
+    cache.close()
+
+
+def test_duplicates_are_stored_once(tmp_path):
+    cache = EmbeddingCache(tmp_path, "m", DIM)
+    cache.put([text_key("a"), text_key("a")], _vectors(2))
+    cache.put([text_key("a")], _vectors(1, start=5))
+    assert len(cache) == 1
+    np.testing.assert_array_equal(cache.lookup(["a"])[1][0], _vectors(1)[0])
+    cache.close()
+
+
+def test_persists_per_model(tmp_path):
+    cache = EmbeddingCache(tmp_path, "org/model-a", DIM)
+    keys, _, _ = cache.lookup(["x", "y"])
+    cache.put(keys, _vectors(2))
+    cache.close()
+
+    reopened = EmbeddingCache(tmp_path, "org/model-a", DIM)
+    assert len(reopened) == 2
+    np.testing.assert_array_equal(reopened.lookup(["y"])[1][0], _vectors(2)[1])
+    reopened.close()
+    other = EmbeddingCache(tmp_path, "org/model-b", DIM)
+    assert len(other) == 0 and other.dir != reopened.dir
+    other.close()
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    cache = EmbeddingCache(tmp_path, "m", DIM)
+    keys, _, _ = cache.lookup(["x", "y"])
+    cache.put(keys, _vectors(2))
+    cache.close()
+    # Vectors of a third row were written but its key never was.
+    with open(cache.dir / VECTORS_FILE, "ab") as f:
+        f.write(_vectors(1, start=9).tobytes()[:10])
+
+    reopened = EmbeddingCache(tmp_path, "m", DIM)
+    assert len(reopened) == 2
+    assert (reopened.dir / VECTORS_FILE).stat().st_size == 2 * DIM * 4
+    assert (reopened.dir / KEYS_FILE).stat().st_size == 2 * len(keys[0])
+    keys, _, _ = reopened.lookup(["z"])
+    reopened.put(keys, _vectors(1, start=3))
+    np.testing.assert_array_equal(reopened.lookup(["z"])[1][0], _vectors(1, start=3)[0])
+    reopened.close()
+
+
+def test_embed_encodes_only_misses(tmp_path):
+    model = _Model()
+    cache = EmbeddingCache(tmp_path, "m", DIM)
+    first = pipeline.embed(model, ["aa", "bbb"], cache)
+    assert model.encoded == ["aa", "bbb"]
+    second = pipeline.embed(model, ["bbb", "c", "aa"], cache)
+    assert model.encoded == ["aa", "bbb", "c"]
+    np.testing.assert_array_equal(second[[0, 2]], first[[1, 0]])
+    np.testing.assert_allclose(np.linalg.norm(second, axis=1), 1.0)
+    np.testing.assert_array_equal(second, pipeline.embed(_Model(), ["bbb", "c", "aa"]))
+    cache.close()
@@ -0,0 +1,117 @@
+"""
+Tests for incremental re-ingest bookkeeping (ingest.incremental).
+Run: uv run pytest ingest/test_incremental.py
+"""
+import json
+
+from ingest import incremental
+
+
+def _manifest(files: dict[str, tuple[str, int, int]]) -> dict:
+    manifest = incremental.new_manifest({"embed_model": "m"})
+    for path, (sha, start, end) in files.items():
+        manifest["files"][path] = {"sha256": sha, "ids": [start, end]}
+    return manifest
+
+
+def test_diff_classifies_files():
+    manifest = _manifest({"a.py": ("1", 0, 3), "b.py": ("2", 3, 5), "c.py": ("3", 5, 9)})
+    added, modified, deleted, unchanged = incremental.diff(manifest, {"a.py": "1", "b.py": "2x", "d.py": "4"})
+    assert added == ["d.py"]
+    assert modified == ["b.py"]
+    assert deleted == ["c.py"]
+    assert unchanged == ["a.py"]
+
+
+def test_diff_empty_manifest_adds_everything():
+    added, modified, deleted, unchanged = incremental.diff(_manifest({}), {"a.py": "1", "b.py": "2"})
+    assert (added, modified, deleted, unchanged) == (["a.py", "b.py"], [], [], [])
+
+
+def test_diff_skipped_file_stays_unchanged():
+    # Files skipped at ingest are recorded with an empty id range and only retried when they change.
+    manifest = _manifest({"bad.py": ("9", 4, 4)})
+    assert incremental.diff(manifest, {"bad.py": "9"})[3] == ["bad.py"]
+    assert incremental.diff(manifest, {"bad.py": "10"})[1] == ["bad.py"]
+
+
+def test_file_sha256_tracks_content(tmp_path):
+    fp = tmp_path / "x.py"
+    fp.write_text("a = 1\n", encoding="utf-8")
+    first = incremental.file_sha256(fp)
+    assert incremental.file_sha256(fp) == first
+    fp.write_text("a = 2\n", encoding="utf-8")
+    assert incremental.file_sha256(fp) != first
+
+
+def test_manifest_round_trip(tmp_path):
+    manifest = _manifest({"a.py": ("1", 0, 3)})
+    incremental.save_manifest(tmp_path, manifest)
+    assert incremental.load_manifest(tmp_path) == manifest
+
+
+def test_load_manifest_rejects_missing_corrupt_and_old(tmp_path):
+    assert incremental.load_manifest(tmp_path) is None
+    (tmp_path / incremental.MANIFEST_FILE).write_text("{not json", encoding="utf-8")
+    assert incremental.load_manifest(tmp_path) is None
+    old = dict(_manifest({}), version=incremental.MANIFEST_VERSION - 1)
+    (tmp_path / incremental.MANIFEST_FILE).write_text(json.dumps(old), encoding="utf-8")
+    assert incremental.load_manifest(tmp_path) is None
+
+
+def test_staging_dir_starts_empty(tmp_path):
+    staging = incremental.staging_dir(tmp_path)
+    (staging / "leftover").write_text("x", encoding="utf-8")
+    assert list(incremental.staging_dir(tmp_path).iterdir()) == []
+
+
+def _publish(index_dir, keep: int = 3, marker: str = "") -> str:
+    staging = incremental.staging_dir(index_dir)
+    (staging / "index.faiss").write_text(marker, encoding="utf-8")
+    return incremental.publish(staging, index_dir, keep).name
+
+
+def test_unversioned_dir_is_live(tmp_path):
+    assert incremental.current_version(tmp_path) is None
+    assert incremental.live_dir(tmp_path) == tmp_path
+    assert incremental.list_versions(tmp_path) == []
+
+
+def test_publish_swaps_current(tmp_path):
+    first = _publish(tmp_path, marker="v1")
+    assert incremental.current_version(tmp_path) == first
+    assert (incremental.live_dir(tmp_path) / "index.faiss").read_text(encoding="utf-8") == "v1"
+    assert not (tmp_path / incremental.STAGING_DIR).exists()
+
+    second = _publish(tmp_path, marker="v2")
+    assert second != first
+    assert incremental.list_versions(tmp_path) == [first, second]
+    assert (incremental.live_dir(tmp_path) / "index.faiss").read_text(encoding="utf-8") == "v2"
+
+
+def test_current_pointing_at_missing_version_is_ignored(tmp_path):
+    (tmp_path / incremental.CURRENT_FILE).write_text("gone\n", encoding="utf-8")
+    assert incremental.live_dir(tmp_path) == tmp_path
+
+
+def test_publish_prunes_old_versions(tmp_path):
+    names = [_publish(tmp_path, keep=2) for _ in range(4)]
+    assert incremental.list_versions(tmp_path) == names[-2:]
+
+
+def test_prune_keeps_live_version(tmp_path):
+    names = [_publish(tmp_path, keep=0) for _ in range(3)]
+    assert incremental.list_versions(tmp_path) == names[-1:]
+    # Rolled back to an older version: pruning never removes the live one.
+    rollback = _publish(tmp_path, keep=5)
+    (tmp_path / incremental.CURRENT_FILE).write_text(names[-1] + "\n", encoding="utf-8")
+    assert incremental.prune_versions(tmp_path, 1) == [rollback]
+    assert incremental.list_versions(tmp_path) == [names[-1]]
+
+
+def test_same_second_versions_sort_in_build_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental.time, "strftime", lambda fmt: "20250101-000000")
+    names = [_publish(tmp_path, keep=2) for _ in range(12)]
+    assert names == sorted(names)
+    assert len(set(names)) == len(names)
+    assert incremental.list_versions(tmp_path) == names[-2:]
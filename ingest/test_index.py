@@ -0,0 +1,132 @@
+"""
+Tests for index construction (ingest.index): recall of each reduced-precision type against exact
+flat search, BinaryIndex Hamming search with float re-scoring, and the write_index / read_index
+round trip with and without mmap.
+Run: uv run pytest ingest/test_index.py
+"""
+import numpy as np
+import pytest
+
+from ingest import index as ix
+
+D = 64
+K = 10
+
+
+def _normalized(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def vectors() -> np.ndarray:
+    # Clustered, like embeddings: uniform random unit vectors have no meaningful neighbours.
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((40, D))
+    return _normalized(centers[rng.integers(0, 40, 2000)] + 0.4 * rng.standard_normal((2000, D)))
+
+
+@pytest.fixture(scope="module")
+def queries(vectors) -> np.ndarray:
+    return _normalized(ix.training_sample(vectors, 50, seed=1) + 0.05)
+
+
+@pytest.fixture(scope="module")
+def truth(vectors, queries) -> np.ndarray:
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :K]
+
+
+def _overlap(ids: np.ndarray, truth: np.ndarray) -> float:
+    return sum(len(set(a.tolist()) & set(b.tolist())) for a, b in zip(ids, truth)) / truth.size
+
+
+@pytest.mark.parametrize(
+    ("index_type", "min_overlap"),
+    [("flat", 1.0), ("flat_fp16", 0.98), ("flat_sq8", 0.9), ("binary", 0.8)],
+)
+def test_top_k_overlaps_flat(vectors, queries, truth, index_type, min_overlap):
+    index, label = ix.build_index(vectors, index_type)
+    assert label.startswith(index_type)
+    assert index.ntotal == len(vectors)
+    scores, ids = index.search(queries, K)
+    assert _overlap(ids, truth) >= min_overlap
+    assert np.all(np.diff(scores, axis=1) <= 1e-6)  # best first
+
+
+def test_binary_rescore_scores_are_exact(vectors, queries, monkeypatch):
+    monkeypatch.setattr(ix.settings, "index_rescore", 5)
+    index, label = ix.build_index(vectors, "binary")
+    assert label == "binary(rescore=5x)"
+    scores, ids = index.search(queries, K)
+    np.testing.assert_allclose(scores, np.einsum("qd,qkd->qk", queries, vectors[ids]), rtol=1e-5)
+
+
+def test_binary_wider_shortlist_finds_more(vectors, queries, truth):
+    index, _ = ix.build_index(vectors, "binary")
+    index.rescore = 1
+    narrow = _overlap(index.search(queries, K)[1], truth)
+    index.rescore = 20
+    wide = _overlap(index.search(queries, K)[1], truth)
+    assert wide >= narrow
+    assert wide > 0.95
+
+
+def test_binary_remove_and_add(vectors, queries):
+    index, _ = ix.build_index(vectors[:1000], "binary", ids=np.arange(1000))
+    index.add_with_ids(vectors[1000:], np.arange(1000, len(vectors)))
+    assert index.remove_ids(np.arange(0, len(vectors), 2)) == len(vectors) // 2
+    _, ids = index.search(queries, K)
+    assert np.all(ids % 2 == 1)
+    assert index.float_vectors().shape == vectors.shape
+
+
+def test_binarize_packs_bits():
+    codes = ix.binarize(np.array([[1, -1, 1, 1, -1, -1, -1, 1]], dtype=np.float32), np.zeros(8, np.float32))
+    assert codes.tolist() == [[0b10110001]]
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+@pytest.mark.parametrize("index_type", ["flat", "flat_fp16", "flat_sq8", "binary"])
+def test_write_read_round_trip(vectors, queries, tmp_path, index_type, mmap):
+    index, label = ix.build_index(vectors, index_type, ids=np.arange(len(vectors)) + 100)
+    path = tmp_path / "index.faiss"
+    ix.write_index(index, path)
+    if index_type == "binary":
+        assert (tmp_path / ix.VECTORS_FILE).exists() and (tmp_path / ix.THRESHOLDS_FILE).exists()
+    loaded = ix.read_index(path, mmap=mmap)
+    ix.apply_search_params(loaded)
+    assert ix.describe(loaded) == label
+    assert loaded.ntotal == index.ntotal
+    expected_scores, expected_ids = index.search(queries, K)
+    scores, ids = loaded.search(queries, K)
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+    if index_type == "binary":
+        assert isinstance(loaded.vectors, np.memmap)  # float vectors are always mapped
+
+
+@pytest.mark.parametrize("index_type", ["flat", "binary"])
+def test_mmap_flags(vectors, tmp_path, monkeypatch, index_type):
+    import faiss
+
+    index, _ = ix.build_index(vectors, index_type)
+    ix.write_index(index, tmp_path / "index.faiss")
+    seen = []
+    for name in ("read_index", "read_index_binary"):
+        real = getattr(faiss, name)
+        monkeypatch.setattr(faiss, name, lambda path, flags=0, r=real: seen.append(flags) or r(path, flags))
+    ix.read_index(tmp_path / "index.faiss")
+    ix.read_index(tmp_path / "index.faiss", mmap=True)
+    mmap = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    assert seen[0] == 0
+    assert seen[1] & mmap == mmap and seen[1] & faiss.IO_FLAG_READ_ONLY
+
+
+def test_streaming_builder_matches_build_index(vectors, queries, tmp_path):
+    builder = ix.StreamingIndexBuilder(tmp_path, "binary")
+    for i in range(0, len(vectors), 300):
+        builder.add(vectors[i:i + 300], np.arange(i, min(i + 300, len(vectors))))
+    streamed, label = builder.finish()
+    built, _ = ix.build_index(vectors, "binary")
+    assert label == ix.describe(built)
+    np.testing.assert_array_equal(streamed.search(queries, K)[1], built.search(queries, K)[1])
+    assert not list(tmp_path.iterdir())  # spill files removed
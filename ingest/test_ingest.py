@@ -15,17 +15,18 @@ os.environ.setdefault(
 )
 warnings.filterwarnings("ignore", message=".*resource_tracker.*leaked semaphore.*", category=UserWarning)
 
-import json
 import sys
 from pathlib import Path
 
 from config.settings import PROJECT_ROOT, settings
 from ingest.chunk import chunk_text
+from ingest.embed_cache import EmbeddingCache
+from ingest.pipeline import embed
 from ingest.repo import ensure_repo, list_files
+from ingest.store import TEXT_FILE, ChunkStoreWriter
 
 # Embedding model: same as main ingest
 EMBED_MODEL = "BAAI/bge-small-en-v1.5"
-BATCH_SIZE = 64
 
 # Test limits
 MAX_FILES = 20  # Only index first 20 files
@@ -36,7 +37,6 @@ def main() -> None:
     index_dir = PROJECT_ROOT / "data" / "faiss_index_test"
     index_dir.mkdir(parents=True, exist_ok=True)
     index_file = index_dir / "index.faiss"
-    meta_file = index_dir / "metadata.json"
 
     repo_path = ensure_repo(settings.repo_path)
     print(f"Repo: {repo_path}")
@@ -74,25 +74,29 @@ def main() -> None:
 
     texts = [t for (_, t, _) in chunks_with_meta]
     print("Embedding...")
-    embeddings = model.encode(texts, batch_size=BATCH_SIZE, show_progress_bar=True)
+    cache = None
+    if settings.embed_cache:
+        # Same cache as the main ingest: chunks it already embedded are not re-encoded here.
+        cache = EmbeddingCache(settings.embed_cache_path, EMBED_MODEL, model.get_sentence_embedding_dimension())
+    embeddings = embed(model, texts, cache)
+    if cache is not None:
+        print(f"Embedding cache hit rate: {cache.hit_rate():.1%}")
+        cache.close()
 
     import faiss
-    import numpy as np
 
     d = embeddings.shape[1]
     index = faiss.IndexFlatIP(d)
-    faiss.normalize_L2(embeddings)
-    index.add(embeddings.astype(np.float32))
+    index.add(embeddings)
 
     faiss.write_index(index, str(index_file))
-    metadata = [
-        {"path": p, "text": t, "chunk_id": c}
-        for (p, t, c) in chunks_with_meta
-    ]
-    meta_file.write_text(json.dumps(metadata, indent=0), encoding="utf-8")
+    with ChunkStoreWriter(index_dir) as store:
+        for (p, t, c) in chunks_with_meta:
+            store.add(p, t, c)
+    store_file = index_dir / TEXT_FILE
 
     size_mb = index_file.stat().st_size / (1024 * 1024)
-    print(f"✅ TEST INDEX SAVED: {index_file} ({size_mb:.2f} MB), {meta_file} ({len(metadata)} chunks)")
+    print(f"✅ TEST INDEX SAVED: {index_file} ({size_mb:.2f} MB), {store_file} ({len(store)} chunks)")
     print("To use this test index, set INDEX_PATH=./data/faiss_index_test in .env")
 
 
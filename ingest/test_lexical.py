@@ -0,0 +1,132 @@
+"""
+Tests for the BM25 lexical index (ingest.lexical): code-aware tokens and scoring order.
+Run: uv run pytest ingest/test_lexical.py
+"""
+import math
+
+import numpy as np
+import pytest
+
+from ingest import lexical
+
+
+def _row(text: str, path: str = "src/x.py") -> dict:
+    return {"path": path, "text": text, "chunk_id": 0}
+
+
+def _index(tmp_path, rows: list[dict]) -> lexical.LexicalIndex:
+    lexical.build(tmp_path, rows)
+    return lexical.LexicalIndex(tmp_path)
+
+
+def test_tokenize_splits_identifiers():
+    assert lexical.tokenize("LlamaAttention") == ["llamaattention", "llama", "attention"]
+    assert lexical.tokenize("_prepare_4d_mask") == ["prepare_4d_mask", "prepare", "4d", "mask"]
+    assert lexical.tokenize("HTTPServer") == ["httpserver", "http", "server"]
+
+
+def test_tokenize_drops_stopwords_and_short_parts():
+    assert lexical.tokenize("how does the x work") == ["work"]
+    assert lexical.tokenize("def forward(self): return None") == ["forward"]
+
+
+def test_term_frequency_ranks_first(tmp_path):
+    index = _index(tmp_path, [
+        _row("attention once, padding padding"),
+        _row("attention attention attention, padding"),
+        _row("unrelated words here"),
+    ])
+    docs, scores = index.search("attention", 10)
+    assert docs.tolist() == [1, 0]
+    assert scores[0] > scores[1] > 0
+
+
+def test_rare_term_outweighs_common_term(tmp_path):
+    rows = [_row("common words"), _row("common rare"), _row("common common common"), _row("common other")]
+    docs, _ = _index(tmp_path, rows).search("common rare", 10)
+    assert docs[0] == 1
+
+
+def test_shorter_document_ranks_first(tmp_path):
+    index = _index(tmp_path, [_row("tokenizer " + "filler " * 50), _row("tokenizer short"), _row("other")])
+    docs, _ = index.search("tokenizer", 10)
+    assert docs.tolist() == [1, 0]
+
+
+def test_scores_match_bm25(tmp_path):
+    texts = ["alpha beta beta", "alpha gamma", "beta beta beta gamma delta", "delta"]
+    index = _index(tmp_path, [_row(t, path="") for t in texts])
+    tfs = [lexical.tokenize(t) for t in texts]
+    avgdl = sum(map(len, tfs)) / len(tfs)
+
+    def bm25(doc: list[str], terms: list[str]) -> float:
+        score = 0.0
+        for term in terms:
+            n = sum(term in d for d in tfs)
+            tf = doc.count(term)
+            idf = math.log(1 + (len(tfs) - n + 0.5) / (n + 0.5))
+            norm = lexical.K1 * (1 - lexical.B + lexical.B * len(doc) / avgdl)
+            score += idf * tf * (lexical.K1 + 1) / (tf + norm)
+        return score
+
+    docs, scores = index.search("beta gamma", 10)
+    expected = {i: bm25(d, ["beta", "gamma"]) for i, d in enumerate(tfs)}
+    assert docs.tolist() == sorted((i for i in expected if expected[i]), key=expected.get, reverse=True)
+    for doc, score in zip(docs.tolist(), scores.tolist()):
+        assert score == pytest.approx(expected[doc], rel=2e-3)  # float16 weights
+
+
+def test_path_is_indexed(tmp_path):
+    index = _index(tmp_path, [_row("x = 1", path="models/llama/modeling_llama.py"), _row("y = 2")])
+    assert index.search("modeling_llama", 5)[0].tolist() == [0]
+
+
+def test_tombstones_and_unknown_terms(tmp_path):
+    tombstone = {"path": "", "text": "", "chunk_id": -1}
+    index = _index(tmp_path, [_row("attention"), tombstone, _row("attention mask")])
+    assert sorted(index.search("attention", 10)[0].tolist()) == [0, 2]
+    docs, scores = index.search("nonexistentterm", 10)
+    assert len(docs) == 0 and len(scores) == 0
+
+
+def test_sparse_and_dense_scoring_agree(tmp_path):
+    rows = [_row(f"word{i % 7} shared{i % 3} token{i}") for i in range(200)]
+    index = _index(tmp_path, rows)
+    dense = index.search("word3 shared1", len(rows))  # many postings per doc: dense score array
+    index.n_docs = 10**6  # few postings per doc: scores only the touched docs
+    sparse = index.search("word3 shared1", len(rows))
+    assert sparse[0].tolist() == dense[0].tolist()
+    np.testing.assert_allclose(sparse[1], dense[1], rtol=1e-6)
+    assert dense[1].tolist() == sorted(dense[1].tolist(), reverse=True)
+
+
+def test_load_checks_doc_count(tmp_path):
+    lexical.build(tmp_path, [_row("a1"), _row("b2")])
+    assert lexical.load(tmp_path, 2) is not None
+    assert lexical.load(tmp_path, 3) is None
+    assert lexical.load(tmp_path / "missing", 2) is None
+
+
+def test_main_publishes_new_version(tmp_path, monkeypatch):
+    from ingest import incremental
+    from ingest.store import ChunkStoreWriter
+
+    staging = incremental.staging_dir(tmp_path)
+    with ChunkStoreWriter(staging) as w:
+        w.add("src/a.py", "def attention(): pass", 0)
+        w.add("src/b.py", "def padding(): pass", 0)
+    (staging / "index.faiss").write_bytes(b"faiss")
+    lexical.build(staging, [_row("unrelated"), _row("words")])
+    old = incremental.publish(staging, tmp_path)
+    old_index = lexical.LexicalIndex(old)  # a running backend's mapping
+    old_bytes = {f: (old / f).read_bytes() for f in lexical.FILES}
+
+    monkeypatch.setattr("sys.argv", ["lexical", str(tmp_path)])
+    lexical.main()
+
+    new = incremental.live_dir(tmp_path)
+    assert new != old
+    assert {f: (old / f).read_bytes() for f in lexical.FILES} == old_bytes
+    assert old_index.search("unrelated", 5)[0].tolist() == [0]
+    assert lexical.LexicalIndex(new).search("attention", 5)[0].tolist() == [0]
+    assert (new / "index.faiss").read_bytes() == b"faiss"
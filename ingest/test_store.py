@@ -0,0 +1,62 @@
+"""
+Tests for the memory-mapped chunk store (ingest.store).
+Run: uv run pytest ingest/test_store.py
+"""
+import json
+
+import numpy as np
+
+from ingest import store
+
+
+def _write(index_dir, rows) -> None:
+    with store.ChunkStoreWriter(index_dir) as w:
+        for row in rows:
+            if row is None:
+                w.add_tombstone()
+            else:
+                w.add(*row)
+
+
+def test_round_trip(tmp_path):
+    _write(tmp_path, [
+        ("src/a.py", "def a(): pass", 0, (1, 3)),
+        ("src/a.py", "héllo wörld", 1),
+        ("src/b.py", "", 0),
+    ])
+    assert store.exists(tmp_path)
+    s = store.ChunkStore(tmp_path)
+    assert len(s) == 3
+    assert s[0] == {"path": "src/a.py", "text": "def a(): pass", "chunk_id": 0, "lines": [1, 3]}
+    assert s[1] == {"path": "src/a.py", "text": "héllo wörld", "chunk_id": 1}  # no line range
+    assert s[2] == {"path": "src/b.py", "text": "", "chunk_id": 0}
+    assert json.loads((tmp_path / store.PATHS_FILE).read_text(encoding="utf-8")) == ["src/a.py", "src/b.py"]
+
+
+def test_tombstones_keep_row_ids(tmp_path):
+    _write(tmp_path, [("a.py", "x", 0), None, ("b.py", "y", 0)])
+    s = store.ChunkStore(tmp_path)
+    assert len(s) == 3
+    assert s[1] == {"path": "", "text": "", "chunk_id": -1}
+    assert s[2]["text"] == "y"
+
+
+def test_empty_store(tmp_path):
+    _write(tmp_path, [])
+    assert len(store.ChunkStore(tmp_path)) == 0
+
+
+def test_prefix_mask(tmp_path):
+    _write(tmp_path, [("src/models/a.py", "a", 0), ("docs/b.md", "b", 0), ("src/models/c.py", "c", 0), None])
+    s = store.ChunkStore(tmp_path)
+    paths = s.prefix_paths("src/models/")
+    assert s.prefix_mask(np.arange(4), paths).tolist() == [True, False, True, False]
+    assert not s.prefix_mask(np.arange(4), s.prefix_paths("nowhere/")).any()
+
+
+def test_convert_metadata_json(tmp_path):
+    legacy = [{"path": "a.py", "text": "one", "chunk_id": 0}, {"path": "a.py", "text": "two", "chunk_id": 1}]
+    (tmp_path / store.LEGACY_META_FILE).write_text(json.dumps(legacy), encoding="utf-8")
+    assert store.convert_metadata_json(tmp_path) == 2
+    s = store.ChunkStore(tmp_path)
+    assert [s[i] for i in range(len(s))] == legacy